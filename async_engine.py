@@ -0,0 +1,44 @@
+"""
+Async bounded-concurrency engine for URL scoring.
+
+A fixed pool of workers pulls items from the input iterator, so at most
+`concurrency` calls are in flight and memory stays flat even when the input
+has hundreds of thousands of rows. Results are handed to `on_result` on the
+event loop thread as soon as each call completes (completion order, not
+input order).
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+
+async def run_bounded(items: Iterable[Any],
+                      worker: Callable[[Any], Awaitable[Any]],
+                      concurrency: int = 16,
+                      on_result: Optional[Callable[[Any, Any], None]] = None) -> int:
+    """Run `worker(item)` for every item with at most `concurrency` in flight.
+
+    `on_result(item, result)` is called once per item; exceptions raised by the
+    worker are passed through as the result so one bad URL never stops the run.
+    Returns the number of items processed.
+    """
+    if concurrency < 1:
+        raise ValueError(f"concurrency must be >= 1, got {concurrency}")
+
+    iterator = iter(items)
+    processed = 0
+
+    async def _worker():
+        nonlocal processed
+        # next() on a shared iterator is safe here: workers only switch at awaits
+        for item in iterator:
+            try:
+                result = await worker(item)
+            except Exception as e:
+                result = e
+            processed += 1
+            if on_result is not None:
+                on_result(item, result)
+
+    await asyncio.gather(*(_worker() for _ in range(concurrency)))
+    return processed
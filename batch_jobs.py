@@ -0,0 +1,298 @@
+"""
+Offline batch-job execution mode.
+
+For large offline evaluations we do not need interactive latency, so every
+row is rendered into a provider batch-request JSONL file (OpenAI Batch API
+format), submitted through a pluggable transport, polled until the job
+finishes and the output is ingested through the provider's parser into the
+usual `{url: score}` / `{url: reason}` files (failed requests go to
+`<output_file>.failures.json`, as in the online path).
+
+Transports:
+    OpenAIBatchTransport  - OpenAI /v1/files + /v1/batches (discounted, 24h window)
+    LocalBatchTransport   - runs the job in-process; no network needed
+
+URLs already in the response cache for this provider/model/prompt are not
+submitted, and every parsed answer is written back to the cache, so a rerun
+only pays for what is new. The submitted job id is saved to
+`<output_file>.batchjob.json`, so rerunning after an interruption resumes
+polling instead of submitting (and paying) again.
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import shutil
+from typing import Callable, Optional
+
+import pandas as pd
+
+from providers import Provider, OpenAIProvider, TruncatedResponseError, get_http_client, override_base_url
+from prompts import find_final_score
+from url_canon import dedupe
+from run_journal import ERROR_PREFIX, is_failure, failures_file, write_failures
+
+TERMINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+
+def custom_id_for(url: str) -> str:
+    """Stable request id for a URL (batch APIs limit custom_id length)."""
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+
+
+def render_batch_file(provider: Provider, urls: list[str], path: str,
+                      endpoint: str = "/v1/chat/completions") -> int:
+    """Write one batch request line per unique URL; returns the number of lines."""
+    n = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for url in dict.fromkeys(urls):
+            _, _, body = provider.build_request(provider.render(url))
+            line = {"custom_id": custom_id_for(url), "method": "POST", "url": endpoint, "body": body}
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+            n += 1
+    return n
+
+
+# ========= Transports =========
+class BatchTransport:
+    """Interface: submit a request file, report status, download the output file."""
+
+    def submit(self, input_path: str) -> str:
+        raise NotImplementedError
+
+    def status(self, job_id: str) -> str:
+        raise NotImplementedError
+
+    def download(self, job_id: str, output_path: str):
+        raise NotImplementedError
+
+
+class OpenAIBatchTransport(BatchTransport):
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 completion_window: str = "24h"):
+        self.api_key = api_key or os.environ.get("OPENAI_API_KEY", "")
+        if not self.api_key:
+            raise ValueError("请设置环境变量 OPENAI_API_KEY")
+        self.base_url = (base_url or override_base_url("openai") or OpenAIProvider.default_base_url).rstrip("/")
+        self.completion_window = completion_window
+
+    def _headers(self):
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    def _check(self, response):
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+        return response
+
+    def submit(self, input_path):
+        client = get_http_client()
+        with open(input_path, 'rb') as f:
+            uploaded = self._check(client.post(
+                f"{self.base_url}/files", headers=self._headers(),
+                data={"purpose": "batch"}, files={"file": (os.path.basename(input_path), f)})).json()
+        job = self._check(client.post(
+            f"{self.base_url}/batches", headers=self._headers(),
+            json={"input_file_id": uploaded["id"], "endpoint": "/v1/chat/completions",
+                  "completion_window": self.completion_window})).json()
+        return job["id"]
+
+    def _job(self, job_id):
+        return self._check(get_http_client().get(f"{self.base_url}/batches/{job_id}", headers=self._headers())).json()
+
+    def status(self, job_id):
+        return self._job(job_id)["status"]
+
+    def download(self, job_id, output_path):
+        file_id = self._job(job_id).get("output_file_id")
+        if not file_id:
+            raise RuntimeError(f"批处理任务 {job_id} 没有输出文件")
+        response = self._check(get_http_client().get(
+            f"{self.base_url}/files/{file_id}/content", headers=self._headers()))
+        with open(output_path, 'wb') as f:
+            f.write(response.content)
+
+
+def _stand_in_response(body: dict) -> str:
+    """Deterministic offline answer: score derived from a hash of the prompt."""
+    prompt = body["messages"][-1]["content"]
+    score = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF
+    return f"Local stand-in response.\n{{\"score\": {score:.2f}}}"
+
+
+class LocalBatchTransport(BatchTransport):
+    """In-process stand-in for a batch API.
+
+    `handler(body) -> text` produces each completion; the default returns a
+    deterministic fake score, pass e.g. `lambda b: provider.complete(b["messages"][-1]["content"])`
+    to run the requests for real. The job reports "in_progress" on the first
+    poll and completes on the next one, like a remote job would.
+    """
+
+    def __init__(self, work_dir: str = ".batch_jobs", handler: Optional[Callable[[dict], str]] = None):
+        self.work_dir = work_dir
+        self.handler = handler or _stand_in_response
+        os.makedirs(work_dir, exist_ok=True)
+
+    def _path(self, job_id, suffix):
+        return os.path.join(self.work_dir, f"{job_id}.{suffix}")
+
+    def submit(self, input_path):
+        job_id = f"local_{uuid.uuid4().hex[:12]}"
+        shutil.copyfile(input_path, self._path(job_id, "input.jsonl"))
+        return job_id
+
+    def status(self, job_id):
+        if os.path.exists(self._path(job_id, "output.jsonl")):
+            return "completed"
+        if not os.path.exists(self._path(job_id, "started")):
+            open(self._path(job_id, "started"), 'w').close()
+            return "in_progress"
+        with open(self._path(job_id, "input.jsonl"), 'r', encoding='utf-8') as src, \
+                open(self._path(job_id, "output.jsonl"), 'w', encoding='utf-8') as dst:
+            for line in src:
+                req = json.loads(line)
+                try:
+                    content = self.handler(req["body"])
+                    out = {"custom_id": req["custom_id"], "error": None, "response": {
+                        "status_code": 200,
+                        "body": {"choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                              "finish_reason": "stop"}]}}}
+                except Exception as e:
+                    out = {"custom_id": req["custom_id"], "response": None,
+                           "error": {"message": repr(e)}}
+                dst.write(json.dumps(out, ensure_ascii=False) + "\n")
+        return "completed"
+
+    def download(self, job_id, output_path):
+        shutil.copyfile(self._path(job_id, "output.jsonl"), output_path)
+
+
+# ========= Ingest =========
+def ingest_batch_output(provider: Provider, urls: list[str], output_path: str) -> tuple[dict, dict]:
+    """Parse a batch output JSONL into ({url: score}, {url: reason}); missing or
+    failed requests, and completions cut off at max_tokens before their score,
+    get score None and the error as reason, like the online path.
+    """
+    by_id = {custom_id_for(u): u for u in urls}
+    result_dict, result_reasons = {}, {}
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            rec = json.loads(line)
+            url = by_id.get(rec.get("custom_id"))
+            if url is None:
+                continue
+            response = rec.get("response") or {}
+            try:
+                if rec.get("error") or response.get("status_code") != 200:
+                    raise RuntimeError(rec.get("error") or f"HTTP {response.get('status_code')}")
+                text = provider.extract_text(response["body"])
+                # 和在线路径的 Provider._finish 一致：截断且没有最终分数算失败，不写缓存
+                if provider.extract_finish_reason(response["body"]) in provider.truncation_reasons \
+                        and find_final_score(text) is None:
+                    raise TruncatedResponseError(
+                        f"{provider.name} 输出在 max_tokens={provider.max_tokens} 处被截断，没有最终分数: ...{text[-80:]!r}")
+                score, reason = provider.parser(text)
+                key = provider.cache_key(url) if provider.cache is not None else None
+                if key is not None:
+                    provider.cache.put(key, provider.name, provider.model, provider.prompt_hash,
+                                       url, text, score, reason)
+            except Exception as e:
+                print(f"[WARN] 批处理结果无效，不计分: {url}\n  err={repr(e)}")
+                score, reason = None, f"{ERROR_PREFIX} {repr(e)}"
+            result_dict[url] = score
+            result_reasons[url] = reason
+    for url in dict.fromkeys(urls):
+        if url not in result_dict:
+            print(f"[WARN] 批处理输出缺少URL，不计分: {url}")
+            result_dict[url], result_reasons[url] = None, f"{ERROR_PREFIX} missing from batch output"
+    return result_dict, result_reasons
+
+
+def get_transport(name: Optional[str] = None) -> BatchTransport:
+    """Transport by name ($BATCH_TRANSPORT): "openai" (default) or "local"."""
+    name = name or os.environ.get("BATCH_TRANSPORT", "openai")
+    if name == "openai":
+        return OpenAIBatchTransport()
+    if name == "local":
+        return LocalBatchTransport()
+    raise ValueError(f"Unknown batch transport {name!r}; choose 'openai' or 'local'")
+
+
+def run_batch_job(provider: Provider,
+                  data_file: str,
+                  output_file: str,
+                  reasons_file: str = None,
+                  limit: int = 0,
+                  transport: Optional[BatchTransport] = None,
+                  poll_interval: float = 30.0) -> dict:
+    """Batch-mode counterpart of inference_runner.run_inference; returns {url: score}."""
+    if not isinstance(provider, OpenAIProvider):
+        raise ValueError(f"批处理模式只支持OpenAI格式的provider，当前为 {provider!r}")
+    transport = transport or get_transport()
+    df = pd.read_csv(data_file)
+    if limit > 0:
+        df = df.head(limit)
+    urls = df['url'].astype(str).tolist()
+    aliases = dedupe(df['url'].astype(str))
+    requested = [u for u in urls if u not in aliases]
+    # URLs already answered for this provider/model/prompt are not submitted (and paid for) again
+    cached = {}
+    if provider.cache is not None:
+        for url in dict.fromkeys(requested):
+            hit = provider.cache_lookup(url)[1]
+            if hit is not None:
+                cached[url] = hit
+        print(f"响应缓存命中: {len(cached)} 个URL不再提交")
+    todo = [u for u in requested if u not in cached]
+
+    result_dict = {url: score for url, (score, _) in cached.items()}
+    result_reasons = {url: reason for url, (_, reason) in cached.items()}
+    state_file = output_file + ".batchjob.json"
+    if todo:
+        if os.path.exists(state_file):
+            with open(state_file, 'r') as f:
+                job_id = json.load(f)["job_id"]
+            print(f"继续轮询已提交的批处理任务: {job_id}")
+        else:
+            request_file = output_file + ".batch_input.jsonl"
+            n = render_batch_file(provider, todo, request_file)
+            job_id = transport.submit(request_file)
+            with open(state_file, 'w') as f:
+                json.dump({"job_id": job_id, "requests": n, "submitted_at": time.time()}, f)
+            print(f"已提交批处理任务 {job_id}：{n} 个请求")
+
+        while True:
+            status = transport.status(job_id)
+            print(f"批处理任务 {job_id} 状态: {status}")
+            if status in TERMINAL_STATES:
+                break
+            time.sleep(poll_interval)
+        if status != "completed":
+            raise RuntimeError(f"批处理任务 {job_id} 未完成: {status}")
+
+        batch_output = output_file + ".batch_output.jsonl"
+        transport.download(job_id, batch_output)
+        # parsed answers are written to the response cache as they are ingested
+        scores, reasons = ingest_batch_output(provider, todo, batch_output)
+        result_dict.update(scores)
+        result_reasons.update(reasons)
+    for url, rep in aliases.items():
+        result_dict[url], result_reasons[url] = result_dict[rep], result_reasons[rep]
+    failures = {url: reason for url, reason in result_reasons.items() if is_failure(reason)}
+    for url in failures:
+        del result_dict[url], result_reasons[url]
+
+    with open(output_file, 'w') as f:
+        json.dump(result_dict, f, indent=2)
+    if reasons_file:
+        with open(reasons_file, 'w', encoding='utf-8') as f:
+            json.dump(result_reasons, f, ensure_ascii=False, indent=2)
+    write_failures(output_file, failures)
+    if os.path.exists(state_file):
+        os.remove(state_file)
+    print(f"\n完成！总共处理了 {len(result_dict)} 个URL")
+    if failures:
+        print(f"[WARN] {len(failures)} 个URL推理失败，未写入分数文件，见 {failures_file(output_file)}")
+    return result_dict
@@ -0,0 +1,149 @@
+"""
+Multi-URL batched prompting.
+
+Packs N URLs into one request (BATCH_PROMPT_TEMPLATE), so the few-shot
+instructions are paid once per batch instead of once per URL, and asks for a
+JSON list of {url, score}. The answer is validated against the input list;
+any URL that is missing or malformed falls back to a normal single-URL call.
+
+Batched scores can differ from single-URL scores, so `drift_report()`
+re-scores a sample through the single-URL path and reports the difference.
+
+    python batch_prompting.py batched_results.json single_results.json
+"""
+
+import sys
+import copy
+import json
+import time
+import random
+import asyncio
+from typing import Optional
+
+import numpy as np
+
+from prompts import BATCH_PROMPT_TEMPLATE, parse_batch_scores
+from providers import Provider
+from response_cache import sha256_text
+
+
+class BatchScorer:
+    """Score URLs N at a time through `provider`, falling back to provider.ascore()."""
+
+    def __init__(self, provider: Provider, batch_size: int = 10, tokens_per_url: int = 40):
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be >= 1, got {batch_size}")
+        self.provider = provider
+        self.batch_size = batch_size
+        # Same key, pool, limiter and cache; own prompt, no single-score system
+        # message and enough output budget for the whole list.
+        self.batch_provider = copy.copy(provider)
+        self.batch_provider.system_msg = None
+        self.batch_provider.max_tokens = 64 + tokens_per_url * batch_size
+        self.batch_provider.prompt_hash = sha256_text(BATCH_PROMPT_TEMPLATE, "batch")
+        self.stats = {"requests": 0, "urls": 0, "batched": 0, "fallbacks": 0, "cached": 0}
+
+    @staticmethod
+    def render(urls: list[str]) -> str:
+        return BATCH_PROMPT_TEMPLATE.format(urls="\n".join(f"{i}. {u}" for i, u in enumerate(urls, 1)))
+
+    async def ascore_many(self, urls: list[str]) -> list[tuple[Optional[float], str]]:
+        """Score up to `batch_size` URLs with one request; returns results in input order."""
+        bp = self.batch_provider
+        self.stats["urls"] += len(urls)
+        results: dict[str, tuple[Optional[float], str]] = {}
+        keys = {}
+        for url in urls:
+            key, hit = bp.cache_lookup(url)
+            keys[url] = key
+            if hit is not None:
+                results[url] = hit
+                self.stats["cached"] += 1
+                bp.record_call(url, time.perf_counter(), cached=True)
+
+        todo = list(dict.fromkeys(u for u in urls if u not in results))
+        if todo:
+            scores = {}
+            start = time.perf_counter()
+            info = bp.new_call_info()
+            try:
+                self.stats["requests"] += 1
+                text = await bp.acomplete(self.render(todo), info)
+                scores = parse_batch_scores(text, todo)
+                bp.record_call(todo[0], start, info, urls=len(todo))
+            except Exception as e:
+                bp.record_call(todo[0], start, info, error=e, urls=len(todo))
+                print(f"[WARN] 批量请求失败，逐个回退: {len(todo)} 个URL\n  err={repr(e)}")
+            for url, score in scores.items():
+                results[url] = (score, "")
+                if keys[url] is not None:
+                    bp.cache.put(keys[url], bp.name, bp.model, bp.prompt_hash, url, "", score, "")
+            self.stats["batched"] += len(scores)
+
+            missing = [u for u in todo if u not in scores]
+            if missing:
+                self.stats["fallbacks"] += len(missing)
+                self.stats["requests"] += len(missing)
+                # 这些URL已经算在上面的批量请求里，回退调用单独计数
+                singles = await asyncio.gather(*(self.provider.ascore(u, purpose="fallback") for u in missing))
+                results.update(zip(missing, singles))
+        return [results[u] for u in urls]
+
+
+def compare_scores(batched: dict, single: dict, threshold: float = 0.2) -> dict:
+    """Drift between two {url: score} dicts on their common URLs."""
+    common = [u for u in batched if u in single]
+    if not common:
+        return {"n": 0}
+    a = np.array([float(batched[u]) for u in common])
+    b = np.array([float(single[u]) for u in common])
+    diff = np.abs(a - b)
+    corr = float(np.corrcoef(a, b)[0, 1]) if len(common) > 1 and a.std() > 0 and b.std() > 0 else float("nan")
+    return {
+        "n": len(common),
+        "mean_abs_diff": float(diff.mean()),
+        "max_abs_diff": float(diff.max()),
+        "mean_shift": float((a - b).mean()),
+        "pearson_r": corr,
+        "label_flip_rate": float(np.mean((a >= threshold) != (b >= threshold))),
+        "threshold": threshold,
+    }
+
+
+async def drift_report(provider: Provider, batched: dict, sample: int = 20,
+                       seed: int = 42, threshold: float = 0.2) -> dict:
+    """Re-score a random sample of batched URLs through the single-URL path and compare."""
+    urls = list(batched)
+    rng = random.Random(seed)
+    picked = rng.sample(urls, min(sample, len(urls)))
+    singles = await asyncio.gather(*(provider.ascore(u, purpose="drift") for u in picked))
+    # URLs whose single-URL call failed have nothing to compare against
+    singles = {u: s for u, (s, _) in zip(picked, singles) if s is not None}
+    return compare_scores({u: batched[u] for u in singles}, singles, threshold)
+
+
+def print_drift(report: dict):
+    if report.get("n", 0) == 0:
+        print("漂移检查: 没有可比较的URL")
+        return
+    print(f"漂移检查（批量 vs 单URL，{report['n']} 个URL）:")
+    print(f"  平均绝对差: {report['mean_abs_diff']:.3f}  最大绝对差: {report['max_abs_diff']:.3f}")
+    print(f"  平均偏移: {report['mean_shift']:+.3f}  相关系数: {report['pearson_r']:.3f}")
+    print(f"  阈值 {report['threshold']} 下标签翻转率: {report['label_flip_rate']*100:.1f}%")
+
+
+def main(argv: Optional[list[str]] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        print("用法: python batch_prompting.py <batched_results.json> <single_results.json>")
+        return 1
+    with open(argv[0], 'r') as f:
+        batched = json.load(f)
+    with open(argv[1], 'r') as f:
+        single = json.load(f)
+    print_drift(compare_scores(batched, single))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""
+Throughput benchmark of the inference pipeline against the local mock server.
+
+Starts mock_llm_server.py in its own process (synthetic or recorded latency
+profile, optional 429/5xx/truncation injection) and runs the real
+run_inference() / Provider / BatchScorer code paths once per cell of the
+grid provider x concurrency x URLs-per-request x retries. Every cell runs in
+a fresh subprocess, so rate-limiter state and peak RSS do not leak between
+cells. Per cell it reports URLs/s, p50/p99 call latency, total CPU time,
+CPU time spent parsing responses (JSON decoding, SSE chunks, score parsers)
+and serializing (request building, journal and metrics lines), and peak
+memory. Results go to a JSON file with the git revision and environment, and
+`--compare` flags cells that got slower than an earlier result file:
+
+    python benchmark.py --concurrency 1,8,32 --batch-size 1,10 --urls 500 --out bench.json
+    python benchmark.py --providers openai,gemini --latency empirical:openai_100_results.json.metrics.jsonl
+    python benchmark.py --out bench_new.json --compare bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import platform
+import resource
+import argparse
+import itertools
+import subprocess
+import contextlib
+import tempfile
+from typing import Optional
+
+import numpy as np
+
+# model, prompt and parser of each provider's inference script
+PROVIDER_SETUPS = {
+    "openai": ("gpt-4o-mini", "PROMPT_TEMPLATE", "parse_score_and_reason"),
+    "xai": ("grok-4-latest", "SIMPLE_PROMPT_TEMPLATE", "parse_probability"),
+    "llama": ("Llama-4-Maverick-17B-128E-Instruct-FP8", "SIMPLE_PROMPT_TEMPLATE", "parse_probability"),
+    "gemini": ("gemini-2.5-pro", "GEMINI_SIMPLE_PROMPT_TEMPLATE", "parse_probability"),
+    "llamacpp": ("local-gguf", "PROMPT_TEMPLATE", "parse_score_and_reason"),
+}
+REGRESSION_TOLERANCE = 0.10
+
+
+# ========= CPU accounting =========
+class CpuTimers:
+    """Patch functions to add their thread CPU time to named buckets.
+
+    The async pipeline runs on one event-loop thread, so thread_time() around
+    a call is the CPU spent inside it.
+    """
+
+    def __init__(self, targets: list[tuple[object, str, str]]):
+        self.targets = [(owner, name, bucket) for owner, name, bucket in targets if hasattr(owner, name)]
+        self.cpu = {bucket: 0.0 for _, _, bucket in targets}
+        self._saved = []
+
+    def _wrap(self, fn, bucket):
+        cpu = self.cpu
+
+        def timed(*args, **kwargs):
+            start = time.thread_time()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                cpu[bucket] += time.thread_time() - start
+        return timed
+
+    def __enter__(self):
+        for owner, name, bucket in self.targets:
+            original = owner.__dict__[name] if name in getattr(owner, "__dict__", {}) else getattr(owner, name)
+            self._saved.append((owner, name, original))
+            fn = original.__func__ if isinstance(original, staticmethod) else original
+            wrapped = self._wrap(fn, bucket)
+            setattr(owner, name, staticmethod(wrapped) if isinstance(original, staticmethod) else wrapped)
+        return self
+
+    def __exit__(self, *exc):
+        for owner, name, original in reversed(self._saved):
+            setattr(owner, name, original)
+
+
+def _cpu_targets(provider) -> list[tuple[object, str, str]]:
+    import httpx
+    import batch_prompting
+    from providers import Provider
+    from run_journal import RunJournal
+    from call_metrics import MetricsRecorder
+    cls = type(provider)
+    targets = [
+        (Provider, "_read", "parse_cpu_s"),           # response.json() of whole responses
+        (Provider, "_feed", "parse_cpu_s"),           # SSE lines: json.loads + final-score check
+        (provider, "parser", "parse_cpu_s"),          # score / reason parsing
+        (batch_prompting, "parse_batch_scores", "parse_cpu_s"),
+        (cls, "build_request", "serialize_cpu_s"),
+        (RunJournal, "append", "serialize_cpu_s"),
+        (MetricsRecorder, "record", "serialize_cpu_s"),
+    ]
+    content = getattr(httpx, "_content", None)
+    if content is not None and hasattr(content, "encode_json"):
+        targets.append((content, "encode_json", "serialize_cpu_s"))  # request body JSON
+    return targets
+
+
+# ========= One cell (runs in a child process) =========
+def run_cell(cell: dict, base_url: str, data_file: str, urls: int, stream: bool = False) -> dict:
+    os.environ["LLM_BASE_URL"] = base_url
+    os.environ["LLM_CACHE"] = "off"
+    os.environ.setdefault("TQDM_DISABLE", "1")
+    import prompts
+    from providers import get_provider
+    from inference_runner import run_inference
+    from call_metrics import load_metrics
+
+    model, template, parser = PROVIDER_SETUPS[cell["provider"]]
+    provider = get_provider(cell["provider"], model, api_key="bench",
+                            prompt_template=getattr(prompts, template), parser=getattr(prompts, parser),
+                            system_msg=prompts.SYSTEM_MSG if template == "PROMPT_TEMPLATE" else None,
+                            max_tokens=200, retries=cell["retries"],
+                            max_throttle_retries=max(cell["retries"], 1) * 3,
+                            stream=stream and provider_streams(cell["provider"]))
+    with tempfile.TemporaryDirectory() as tmp, CpuTimers(_cpu_targets(provider)) as timers:
+        output_file = os.path.join(tmp, "bench_results.json")
+        wall0, cpu0 = time.perf_counter(), time.process_time()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = run_inference(provider, data_file, output_file, limit=urls, concurrency=cell["concurrency"],
+                                   resume=False, batch_size=cell["batch_size"], drift_sample=0,
+                                   mode="online", prefilter=False)
+        wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+        records = load_metrics(output_file + ".metrics.jsonl")
+
+    calls = [r for r in records if not r.get("cached")]
+    latency = np.array([r["latency_s"] for r in calls]) if calls else np.array([np.nan])
+    return {
+        **cell, "stream": bool(provider.stream),
+        "urls": len(result), "calls": len(calls),
+        "errors": sum(1 for r in calls if r.get("error")),
+        "retries_used": sum(r.get("retries") or 0 for r in calls),
+        "wall_s": wall, "urls_per_s": len(result) / wall if wall > 0 else float("nan"),
+        "latency_p50_s": float(np.nanpercentile(latency, 50)), "latency_p99_s": float(np.nanpercentile(latency, 99)),
+        "cpu_s": cpu, "cpu_ms_per_url": 1000 * cpu / max(len(result), 1),
+        **timers.cpu,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def provider_streams(name: str) -> bool:
+    from providers import provider_class
+    return provider_class(name).supports_streaming
+
+
+# ========= Driver =========
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def mock_server(args):
+    """mock_llm_server.py in a child process; yields its base URL."""
+    port = _free_port()
+    cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_llm_server.py"),
+           "--port", str(port), "--latency", args.latency, "--rate-limit", str(args.rate_limit),
+           "--error-rate", str(args.error_rate), "--truncate-rate", str(args.truncate_rate), "--seed", str(args.seed)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            if proc.poll() is not None:
+                raise RuntimeError(f"mock_llm_server.py 启动失败: {proc.stderr.read().decode()[-500:]}")
+            with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port), timeout=0.1):
+                break
+            time.sleep(0.05)
+        yield base_url
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def cell_key(row: dict) -> tuple:
+    return row["provider"], row["concurrency"], row["batch_size"], row["retries"], row.get("stream", False)
+
+
+def compare(rows: list[dict], baseline: list[dict], tolerance: float = REGRESSION_TOLERANCE) -> list[dict]:
+    """Per matching cell: throughput / p99 / CPU ratios vs the baseline and a regression flag."""
+    base = {cell_key(r): r for r in baseline}
+    out = []
+    for row in rows:
+        old = base.get(cell_key(row))
+        if old is None:
+            continue
+        ratio = {m: row[m] / old[m] if old.get(m) else float("nan")
+                 for m in ("urls_per_s", "latency_p99_s", "cpu_ms_per_url")}
+        out.append({"cell": cell_key(row), **ratio,
+                    "regression": ratio["urls_per_s"] < 1 - tolerance or ratio["cpu_ms_per_url"] > 1 + tolerance})
+    return out
+
+
+def _ints(spec: str) -> list[int]:
+    return [int(v) for v in spec.split(",")]
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark the inference pipeline against the local mock server")
+    parser.add_argument("--providers", default="openai", help=f"comma-separated, from {sorted(PROVIDER_SETUPS)}")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--batch-size", default="1,10", help="URLs per request")
+    parser.add_argument("--retries", default="3")
+    parser.add_argument("--stream", action="store_true", help="stream responses where the provider supports it")
+    parser.add_argument("--urls", type=int, default=300, help="URLs per cell")
+    parser.add_argument("--data", default="sampled_data_2000_balanced.csv")
+    parser.add_argument("--latency", default="lognormal:0.3,0.5",
+                        help="mock latency profile, e.g. fixed:0.2 or empirical:<metrics.jsonl>")
+    parser.add_argument("--rate-limit", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--truncate-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", default=None, help="earlier result file to compare against")
+    parser.add_argument("--cell", default=None, help=argparse.SUPPRESS)  # internal: run one cell
+    args = parser.parse_args(argv)
+
+    if args.cell:
+        spec = json.loads(args.cell)
+        print(json.dumps(run_cell(spec["cell"], spec["base_url"], spec["data"], spec["urls"], spec["stream"])))
+        return 0
+
+    grid = [{"provider": p, "concurrency": c, "batch_size": b, "retries": r}
+            for p, c, b, r in itertools.product(args.providers.split(","), _ints(args.concurrency),
+                                                _ints(args.batch_size), _ints(args.retries))]
+    rows = []
+    print(f"{len(grid)} 个组合，每个 {args.urls} 个URL，模拟延迟 {args.latency}")
+    with mock_server(args) as base_url:
+        for cell in grid:
+            spec = {"cell": cell, "base_url": base_url, "data": args.data, "urls": args.urls, "stream": args.stream}
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--cell", json.dumps(spec)],
+                                  capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(f"[WARN] 组合失败 {cell}: {proc.stderr.strip()[-300:]}")
+                continue
+            row = json.loads(proc.stdout.strip().splitlines()[-1])
+            rows.append(row)
+            print(f"{row['provider']:>7} c={row['concurrency']:<3} b={row['batch_size']:<3} r={row['retries']}  "
+                  f"{row['urls_per_s']:8.1f} URL/s  p50 {row['latency_p50_s']:.3f}s  p99 {row['latency_p99_s']:.3f}s  "
+                  f"CPU {row['cpu_ms_per_url']:.2f} ms/URL (解析 {1000 * row['parse_cpu_s'] / max(row['urls'], 1):.2f}, "
+                  f"序列化 {1000 * row['serialize_cpu_s'] / max(row['urls'], 1):.2f})  "
+                  f"峰值内存 {row['peak_rss_mb']:.0f} MB  错误 {row['errors']}")
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "git": _git_revision(),
+        "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+        "mock": {"latency": args.latency, "rate_limit": args.rate_limit, "error_rate": args.error_rate,
+                 "truncate_rate": args.truncate_rate, "seed": args.seed},
+        "urls_per_cell": args.urls, "data": args.data, "results": rows,
+    }
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            report["comparison"] = compare(rows, json.load(f)["results"])
+        regressions = [c for c in report["comparison"] if c["regression"]]
+        for c in report["comparison"]:
+            print(f"{str(c['cell']):<40} 吞吐 x{c['urls_per_s']:.2f}  p99 x{c['latency_p99_s']:.2f}  "
+                  f"CPU x{c['cpu_ms_per_url']:.2f}{'  <-- 回退' if c['regression'] else ''}")
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"结果已保存: {args.out}")
+    return 1 if args.compare and regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+Per-call latency, token and cost instrumentation.
+
+Providers append one JSON line per scored URL to a per-run metrics file
+(`<output_file>.metrics.jsonl`): wall latency, time-to-first-byte,
+time-to-score, retry and throttle counts, prompt/completion tokens,
+estimated cost, cache hits and errors. `summarize()` turns one or more metrics files into a per-model
+report with p50/p95/p99 latency, throughput and cost per 1,000 URLs. The URL
+count is the distinct URLs of live primary calls; cache hits, batch-fallback
+retries and drift-check calls (the `purpose` field) are reported separately:
+
+    python call_metrics.py openai_100_results.json.metrics.jsonl grok_url_classification_results.json.metrics.jsonl
+"""
+
+import sys
+import json
+import time
+import threading
+from typing import Optional
+
+import numpy as np
+
+# USD per 1M tokens (input, output). List prices at the time of writing;
+# update when providers change them.
+PRICING = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-2.5-pro": (1.25, 10.00),
+    "grok-4": (3.00, 15.00),
+    "grok-4-latest": (3.00, 15.00),
+    "Llama-4-Maverick-17B-128E-Instruct-FP8": (0.27, 0.85),
+}
+
+
+def estimate_cost(model: str, prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> Optional[float]:
+    """Estimated USD cost of one call, or None when the model or usage is unknown."""
+    price = PRICING.get(model)
+    if price is None or prompt_tokens is None:
+        return None
+    return (prompt_tokens * price[0] + (completion_tokens or 0) * price[1]) / 1_000_000
+
+
+class MetricsRecorder:
+    """Thread-safe JSONL writer for per-call records."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def record(self, **fields):
+        fields.setdefault("ts", time.time())
+        line = json.dumps(fields, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def load_metrics(*paths: str) -> list[dict]:
+    records = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    return records
+
+
+def _pct(values, q):
+    return float(np.percentile(values, q)) if len(values) else float("nan")
+
+
+def summarize(records: list[dict]) -> dict:
+    """Per-model summary: {model: {calls, urls, p50/p95/p99 latency, ...}}."""
+    by_model: dict[str, list[dict]] = {}
+    for r in records:
+        by_model.setdefault(r.get("model", "?"), []).append(r)
+
+    summary = {}
+    for model, rs in by_model.items():
+        live = [r for r in rs if not r.get("cached")]
+        latency = np.array([r["latency_s"] for r in live])
+        ttfb = np.array([r["ttfb_s"] for r in live if r.get("ttfb_s") is not None])
+        tts = np.array([r["time_to_score_s"] for r in live if r.get("time_to_score_s") is not None])
+        # 漂移检查是跑完之后的额外调用，不算进吞吐和每1000个URL费用
+        run = [r for r in rs if r.get("purpose", "primary") != "drift"] or rs
+        primary = [r for r in live if r.get("purpose", "primary") == "primary"]
+        # 单URL调用按URL去重（续跑时重试的URL只算一次），批量请求按其中的URL数计
+        urls = len({r["url"] for r in primary if r.get("urls", 1) == 1}) \
+            + sum(r["urls"] for r in primary if r.get("urls", 1) != 1)
+        tokens = sum((r.get("prompt_tokens") or 0) + (r.get("completion_tokens") or 0) for r in run)
+        costs = [r["cost_usd"] for r in rs if r.get("cost_usd") is not None]
+        run_costs = [r["cost_usd"] for r in run if r.get("cost_usd") is not None]
+        start = min(r["ts"] - r["latency_s"] for r in run)
+        wall = max(max(r["ts"] for r in run) - start, 1e-9)
+        summary[model] = {
+            "provider": rs[0].get("provider"),
+            "calls": len(live),
+            "cached": len(rs) - len(live),
+            "fallbacks": sum(1 for r in live if r.get("purpose") == "fallback"),
+            "drift_checks": sum(1 for r in live if r.get("purpose") == "drift"),
+            "urls": urls,
+            "errors": sum(1 for r in rs if r.get("error")),
+            "truncated": sum(1 for r in rs if "TruncatedResponseError" in (r.get("error") or "")),
+            "early_stops": sum(1 for r in rs if r.get("early_stop")),
+            "retries": sum(r.get("retries", 0) for r in rs),
+            "latency_p50": _pct(latency, 50),
+            "latency_p95": _pct(latency, 95),
+            "latency_p99": _pct(latency, 99),
+            "ttfb_p50": _pct(ttfb, 50),
+            "tts_p50": _pct(tts, 50),
+            "tts_p95": _pct(tts, 95),
+            "urls_per_s": urls / wall,
+            "tokens_per_s": tokens / wall,
+            "prompt_tokens": sum(r.get("prompt_tokens") or 0 for r in rs),
+            "completion_tokens": sum(r.get("completion_tokens") or 0 for r in rs),
+            "cost_usd": sum(costs) if costs else None,
+            "cost_per_1k_urls": sum(run_costs) / urls * 1000 if run_costs and urls else None,
+        }
+    return summary
+
+
+def print_summary(summary: dict):
+    print("\n" + "=" * 50)
+    print("调用性能统计:")
+    for model, s in summary.items():
+        cost = f"${s['cost_usd']:.4f}（每1000个URL ${s['cost_per_1k_urls']:.4f}）" if s["cost_usd"] is not None else "未知"
+        print(f"[{s['provider']}] {model}")
+        print(f"  调用: {s['calls']}  缓存命中: {s['cached']}  URL: {s['urls']}  错误: {s['errors']}"
+              f"（截断 {s['truncated']}）  重试: {s['retries']}")
+        if s["fallbacks"] or s["drift_checks"]:
+            print(f"  批量回退调用: {s['fallbacks']}  漂移检查调用: {s['drift_checks']}")
+        print(f"  延迟 p50/p95/p99: {s['latency_p50']:.3f}s / {s['latency_p95']:.3f}s / {s['latency_p99']:.3f}s"
+              f"  首字节 p50: {s['ttfb_p50']:.3f}s  出分 p50/p95: {s['tts_p50']:.3f}s / {s['tts_p95']:.3f}s")
+        if s["early_stops"]:
+            print(f"  流式提前结束: {s['early_stops']} 次")
+        print(f"  吞吐: {s['urls_per_s']:.2f} URL/s, {s['tokens_per_s']:.0f} tokens/s")
+        print(f"  tokens: 输入 {s['prompt_tokens']}  输出 {s['completion_tokens']}  费用: {cost}")
+
+
+def main(argv: Optional[list[str]] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print("用法: python call_metrics.py <run.metrics.jsonl> [...]")
+        return 1
+    print_summary(summarize(load_metrics(*argv)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
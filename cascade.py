@@ -0,0 +1,239 @@
+"""
+Model cascade: score everything with a cheap model, escalate only the
+uncertain URLs to a stronger one.
+
+`run_cascade()` runs the cheap provider over the whole dataset, re-queries
+the URLs whose cheap score falls inside (low, high) - the band around the
+decision threshold where the cheap model is least reliable - with the strong
+provider and merges the two result files.
+
+`cascade_curve()` replays the cascade offline from two existing result
+files for a range of band widths and reports the escalated fraction, AUROC,
+cost per 1,000 URLs and mean latency per URL of each operating point:
+
+    python cascade.py sampled_data_2000_balanced.csv claudehaiku_url_classification_results.json gemini_url_classification_results.json --plot cascade_curve.png
+"""
+
+import os
+import sys
+import json
+import argparse
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from prompts import SYSTEM_MSG, PROMPT_TEMPLATE, SIMPLE_PROMPT_TEMPLATE, BATCH_PROMPT_TEMPLATE
+from call_metrics import estimate_cost, load_metrics, summarize
+from inference_runner import run_inference
+from evaluation import load_labels, load_failures, join_predictions
+from run_journal import write_failures
+
+DEFAULT_WIDTHS = "0,0.05,0.1,0.15,0.2,0.3,0.4,0.5,1"
+# prompt a result file was produced with -> (template, system message, completion tokens per URL)
+PROMPT_PROFILES = {
+    "full": (PROMPT_TEMPLATE, SYSTEM_MSG, 150),
+    "simple": (SIMPLE_PROMPT_TEMPLATE, None, 5),
+    "batch": (BATCH_PROMPT_TEMPLATE, None, 40),
+}
+
+
+def escalation_mask(scores: np.ndarray, low: float, high: float) -> np.ndarray:
+    """True where the cheap score is inside the uncertainty band (low, high)."""
+    return (scores > low) & (scores < high)
+
+
+def merge_cascade(cheap: dict, strong: dict, low: float, high: float) -> dict:
+    """Cheap scores, replaced by the strong model's score inside the band
+    (and for URLs the cheap model could not score)."""
+    merged = {url: strong.get(url, score) if low < score < high else score
+              for url, score in cheap.items()}
+    merged.update((url, score) for url, score in strong.items() if url not in merged)
+    return merged
+
+
+def band_around(threshold: float, width: float) -> tuple[float, float]:
+    return max(0.0, threshold - width), min(1.0, threshold + width)
+
+
+def _load_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def run_cascade(cheap, strong,
+                data_file: str,
+                output_file: str,
+                reasons_file: str = None,
+                low: float = 0.1,
+                high: float = 0.4,
+                limit: int = 0,
+                **kwargs) -> dict:
+    """Score `data_file` with `cheap`, re-score the (low, high) band with `strong`
+    and write the merged `{url: score}` (and reasons) files.
+
+    Each stage is a normal run_inference run with its own journal, metrics and
+    cache entries: `<output_file>.cheap.json` and `<output_file>.strong.json`.
+    Extra keyword arguments are passed to both run_inference calls.
+    """
+    stem = os.path.splitext(output_file)[0]
+    cheap_out, strong_out = stem + ".cheap.json", stem + ".strong.json"
+    cheap_reasons = stem + ".cheap_reasons.json" if reasons_file else None
+    strong_reasons = stem + ".strong_reasons.json" if reasons_file else None
+
+    print(f"=== 第一阶段: {cheap!r} 处理全部URL ===")
+    cheap_scores = run_inference(cheap, data_file, cheap_out, cheap_reasons, limit=limit, **kwargs)
+
+    df = pd.read_csv(data_file)
+    if limit > 0:
+        df = df.head(limit)
+    scores = pd.to_numeric(df['url'].map(cheap_scores), errors="coerce").to_numpy()
+    # URLs the cheap model failed on have no score (NaN) and are escalated as well
+    escalate = df[escalation_mask(scores, low, high) | np.isnan(scores)]
+    print(f"\n不确定区间 ({low}, {high}): {len(escalate)}/{len(df)} 个URL"
+          f"（{len(escalate) / max(len(df), 1) * 100:.1f}%）升级到 {strong!r}")
+
+    strong_scores = {}
+    if len(escalate):
+        escalate_file = stem + ".escalate.csv"
+        escalate.to_csv(escalate_file, index=False)
+        print(f"=== 第二阶段: {strong!r} 处理不确定URL ===")
+        strong_scores = run_inference(strong, escalate_file, strong_out, strong_reasons, **kwargs)
+        os.remove(escalate_file)
+
+    result_dict = merge_cascade(cheap_scores, strong_scores, low, high)
+    with open(output_file, 'w') as f:
+        json.dump(result_dict, f, indent=2)
+    if reasons_file:
+        reasons = _load_json(cheap_reasons)
+        if strong_scores:
+            reasons.update(_load_json(strong_reasons))
+        with open(reasons_file, 'w', encoding='utf-8') as f:
+            json.dump({url: reasons.get(url, "") for url in result_dict}, f, ensure_ascii=False, indent=2)
+    failures = {**load_failures(cheap_out), **load_failures(strong_out)}
+    write_failures(output_file, {url: e for url, e in failures.items() if url not in result_dict})
+    print(f"\n级联完成！{len(result_dict)} 个URL，其中 {len(strong_scores)} 个由强模型评分")
+    return result_dict
+
+
+# ========= Offline operating-point curve =========
+def per_url_cost(model: str, prompt_template: str = PROMPT_TEMPLATE, completion_tokens: int = 150,
+                 system_msg: Optional[str] = None, batch_size: int = 10) -> Optional[float]:
+    """Rough USD per 1,000 URLs for `prompt_template` (~4 chars per token) from the price table.
+
+    Templates with {urls} (BATCH_PROMPT_TEMPLATE) are priced per URL of a
+    `batch_size` batch; completion_tokens is per URL.
+    """
+    example = "example.com/some/path"
+    if "{urls}" in prompt_template:
+        prompt = prompt_template.format(urls="\n".join(f"{i}. {example}" for i in range(1, batch_size + 1)))
+    else:
+        prompt, batch_size = prompt_template.format(url=example), 1
+    prompt_tokens = (len(prompt) + len(system_msg or "")) // 4 / batch_size
+    cost = estimate_cost(model, prompt_tokens, completion_tokens)
+    return cost * 1000 if cost is not None else None
+
+
+def model_profile(model: str, metrics_file: Optional[str] = None, prompt: str = "full") -> dict:
+    """{cost_per_1k, latency} measured from a run's metrics file, else the cost of
+    `prompt` (see PROMPT_PROFILES) from the price table."""
+    if metrics_file:
+        summary = summarize(load_metrics(metrics_file))
+        s = summary.get(model) or next(iter(summary.values()))
+        return {"cost_per_1k": s["cost_per_1k_urls"], "latency": s["latency_p50"]}
+    template, system_msg, completion_tokens = PROMPT_PROFILES[prompt]
+    return {"cost_per_1k": per_url_cost(model, template, completion_tokens, system_msg), "latency": None}
+
+
+def cascade_curve(labels: np.ndarray, cheap: np.ndarray, strong: np.ndarray,
+                  threshold: float = 0.2, widths=(0, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0),
+                  cheap_profile: Optional[dict] = None, strong_profile: Optional[dict] = None) -> pd.DataFrame:
+    """One row per band width: escalated share, AUROC, accuracy, cost and latency."""
+    from sklearn.metrics import roc_auc_score
+    cheap_profile = cheap_profile or {}
+    strong_profile = strong_profile or {}
+    rows = []
+    for width in widths:
+        low, high = band_around(threshold, width)
+        mask = escalation_mask(cheap, low, high)
+        merged = np.where(mask, strong, cheap)
+        frac = float(mask.mean())
+        row = {
+            "width": width, "low": low, "high": high,
+            "escalated": frac,
+            "auroc": float(roc_auc_score(labels, merged)),
+            "accuracy": float(((merged >= threshold) == labels).mean()),
+        }
+        for key in ("cost_per_1k", "latency"):
+            c, s = cheap_profile.get(key), strong_profile.get(key)
+            row[key] = c + frac * s if c is not None and s is not None else float("nan")
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def plot_curve(curve: pd.DataFrame, path: str, strong_auroc: Optional[float] = None):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    use_cost = curve["cost_per_1k"].notna().all()
+    x = curve["cost_per_1k"] if use_cost else curve["escalated"] * 100
+    plt.figure(figsize=(8, 6))
+    plt.plot(x, curve["auroc"], marker="o", color="darkorange", lw=2, label="Cascade")
+    for xi, yi, w in zip(x, curve["auroc"], curve["width"]):
+        plt.annotate(f"±{w:g}", (xi, yi), textcoords="offset points", xytext=(5, -12), fontsize=9)
+    if strong_auroc is not None:
+        plt.axhline(strong_auroc, color="navy", lw=1, linestyle="--", label="Strong model only")
+    plt.xlabel("Cost per 1,000 URLs (USD)" if use_cost else "URLs escalated (%)")
+    plt.ylabel("AUROC")
+    plt.title("Model Cascade: Cost vs. AUROC")
+    plt.legend(loc="lower right")
+    plt.grid(True, alpha=0.3)
+    plt.savefig(path, dpi=300, bbox_inches="tight")
+    plt.close()
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Cost/latency vs. AUROC of a cheap -> strong model cascade")
+    parser.add_argument("data_file", help="labelled CSV with url,type columns")
+    parser.add_argument("cheap_results", help="{url: score} JSON of the cheap model")
+    parser.add_argument("strong_results", help="{url: score} JSON of the strong model")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--widths", default=DEFAULT_WIDTHS, help="comma-separated half-widths of the band")
+    parser.add_argument("--cheap-model", default="gpt-4o-mini", help="model name for pricing")
+    parser.add_argument("--strong-model", default="gemini-2.5-pro", help="model name for pricing")
+    parser.add_argument("--cheap-metrics", help="metrics.jsonl of a cheap-model run (measured cost/latency)")
+    parser.add_argument("--strong-metrics", help="metrics.jsonl of a strong-model run")
+    parser.add_argument("--cheap-prompt", choices=sorted(PROMPT_PROFILES), default="full",
+                        help="prompt the cheap results were produced with, for pricing without metrics")
+    parser.add_argument("--strong-prompt", choices=sorted(PROMPT_PROFILES), default="full")
+    parser.add_argument("--plot", help="save the curve as a PNG")
+    args = parser.parse_args(argv)
+
+    # same label mapping, URL matching and failure handling as evaluation.py
+    labels = load_labels(args.data_file)
+    cheap = join_predictions(labels, _load_json(args.cheap_results), only_predicted=True,
+                             failed=load_failures(args.cheap_results))
+    strong = join_predictions(labels, _load_json(args.strong_results), only_predicted=True,
+                              failed=load_failures(args.strong_results))
+    common = cheap.index.intersection(strong.index)
+    y = labels.loc[common, 'label'].to_numpy()
+    cheap_scores = cheap.loc[common, 'score'].to_numpy()
+    strong_scores = strong.loc[common, 'score'].to_numpy()
+    print(f"共同URL: {len(common)}")
+
+    widths = [float(w) for w in args.widths.split(",")]
+    curve = cascade_curve(y, cheap_scores, strong_scores, args.threshold, widths,
+                          model_profile(args.cheap_model, args.cheap_metrics, args.cheap_prompt),
+                          model_profile(args.strong_model, args.strong_metrics, args.strong_prompt))
+    pd.set_option("display.width", 120)
+    print(curve.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    if args.plot:
+        from sklearn.metrics import roc_auc_score
+        plot_curve(curve, args.plot, float(roc_auc_score(y, strong_scores)))
+        print(f"曲线已保存: {args.plot}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+import os
+
+from prompts import SYSTEM_MSG, PROMPT_TEMPLATE, parse_score_and_reason
+from providers import OpenAIProvider, GeminiProvider
+from cascade import run_cascade
+from response_cache import ResponseCache
+
+# ========= Init =========
+# 需要 OPENAI_API_KEY（便宜模型）和 GEMINI_API_KEY（强模型）
+cheap_model = "gpt-4o-mini"
+strong_model = "gemini-2.5-pro"
+# 便宜模型分数落在 (CASCADE_LOW, CASCADE_HIGH) 内的URL升级到强模型，默认围绕0.2阈值
+low = float(os.environ.get("CASCADE_LOW", "0.1"))
+high = float(os.environ.get("CASCADE_HIGH", "0.4"))
+# 处理行数：默认前100行，设为0处理整个数据集（export INFERENCE_LIMIT=0）
+limit = int(os.environ.get("INFERENCE_LIMIT", "100"))
+
+# ========= IO =========
+data_file = './extracted_urls_2000_balanced_shuffled.csv'
+output_file = 'cascade_results.json'
+reasons_file = 'cascade_reasons.json'
+
+if __name__ == "__main__":
+    cache = ResponseCache.from_env()
+    cheap = OpenAIProvider(
+        cheap_model,
+        prompt_template=PROMPT_TEMPLATE,
+        system_msg=SYSTEM_MSG,
+        parser=parse_score_and_reason,
+        max_tokens=200,
+        response_format={"type": "json_object"},
+        cache=cache,
+    )
+    strong = GeminiProvider(
+        strong_model,
+        prompt_template=PROMPT_TEMPLATE,
+        parser=parse_score_and_reason,
+        backoff=1.0,
+        cache=cache,
+    )
+    run_cascade(cheap, strong, data_file, output_file, reasons_file,
+                low=low, high=high, limit=limit)
@@ -0,0 +1,321 @@
+"""
+Registered-domain memoization: score a domain's first URLs, reuse the verdict
+for the rest of its paths.
+
+Real traffic is heavily skewed towards a few domains (youtube.com,
+en.wikipedia.org, facebook.com, ... in the sample data). `registered_domain()`
+maps a host to its registrable domain (eTLD+1) with the offline Public Suffix
+List, including its private section, so `user.github.io` or
+`x.blogspot.com` stay separate sites. `DomainCache` keeps per-domain score
+priors (count, sum, min, max) and, under the `reuse` policy, answers URLs on
+a domain whose first `min_samples` scores were all confidently benign
+(<= low) or all confidently malicious (>= high) with the domain's mean score
+instead of calling the model. Hosts that serve arbitrary user content (cloud
+storage, shorteners, see url_features.py) never reuse, and one disagreeing
+score makes a domain unconfident for good. `observe` only counts what
+`reuse` would have saved.
+
+Priors are persisted per provider / model / prompt in a JSON file so later
+runs start warm. In inference_runner.py the first URLs of each domain are
+scored first and the rest are resolved against the cache afterwards, so the
+decision does not depend on request completion order.
+
+    python domain_cache.py sampled_data_2000_balanced.csv --results claudehaiku_url_classification_results.json
+
+The PSL is read from $PUBLIC_SUFFIX_LIST, ./public_suffix_list.dat or the
+system copy (/usr/share/publicsuffix); without one only a short built-in
+list of common multi-label suffixes is used.
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+PSL_PATHS = ["public_suffix_list.dat", "/usr/share/publicsuffix/public_suffix_list.dat"]
+# used when no PSL file is found
+FALLBACK_SUFFIXES = ["co.uk", "org.uk", "ac.uk", "gov.uk", "com.au", "net.au", "org.au", "co.jp", "ne.jp",
+                     "or.jp", "co.kr", "com.br", "com.cn", "com.tw", "com.mx", "co.in", "co.za", "co.nz",
+                     "com.tr", "com.ar", "github.io", "blogspot.com", "000webhostapp.com"]
+DEFAULT_CACHE_FILE = "domain_priors.json"
+POLICIES = ("off", "observe", "reuse")
+_HOST = r'^(?:[a-zA-Z][a-zA-Z0-9+.-]*://)?(?:[^/?#@]*@)?(?P<host>\[[^\]]*\]|[^/?#:]*)'
+_IPV4 = re.compile(r'^\d{1,3}(?:\.\d{1,3}){3}$')
+
+
+# ========= Public Suffix List =========
+class PublicSuffixList:
+    """Suffix rules with `*.` wildcards and `!` exceptions (https://publicsuffix.org/list/)."""
+
+    def __init__(self, rules=()):
+        self.rules, self.wildcards, self.exceptions = set(), set(), set()
+        for rule in rules:
+            rule = rule.strip().lower()
+            if not rule or rule.startswith("//"):
+                continue
+            rule = rule.split()[0]
+            if rule.startswith("!"):
+                self.exceptions.add(_ascii(rule[1:]))
+            elif rule.startswith("*."):
+                self.wildcards.add(_ascii(rule[2:]))
+            else:
+                self.rules.add(_ascii(rule))
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "PublicSuffixList":
+        candidates = [path] if path else [os.environ.get("PUBLIC_SUFFIX_LIST")] + PSL_PATHS
+        for candidate in filter(None, candidates):
+            if os.path.exists(candidate):
+                with open(candidate, 'r', encoding='utf-8') as f:
+                    return cls(f)
+        if path:
+            raise FileNotFoundError(f"找不到公共后缀列表: {path}")
+        print("[WARN] 没有找到公共后缀列表（public_suffix_list.dat），只使用内置的常见后缀")
+        return cls(FALLBACK_SUFFIXES)
+
+    def suffix_labels(self, labels: list[str]) -> int:
+        """Number of trailing labels that form the public suffix (the longest matching rule wins)."""
+        for i in range(len(labels)):
+            candidate = ".".join(labels[i:])
+            if candidate in self.exceptions:
+                return len(labels) - i - 1
+            if candidate in self.rules or (i + 1 < len(labels) and ".".join(labels[i + 1:]) in self.wildcards):
+                return len(labels) - i
+        return 1  # implicit "*" rule
+
+    def registered_domain(self, host: str) -> Optional[str]:
+        """eTLD+1 of `host`; IP hosts are their own domain; None for a bare public suffix."""
+        host = _ascii(host.strip().lower().rstrip("."))
+        if not host or host.startswith("[") or _IPV4.match(host):
+            return host or None
+        labels = host.split(".")
+        n = self.suffix_labels(labels)
+        return ".".join(labels[-(n + 1):]) if len(labels) > n else None
+
+
+def _ascii(host: str) -> str:
+    if host.isascii():
+        return host
+    try:
+        return host.encode("idna").decode("ascii")
+    except UnicodeError:
+        return host
+
+
+_psl: Optional[PublicSuffixList] = None
+
+
+def get_psl() -> PublicSuffixList:
+    global _psl
+    if _psl is None:
+        _psl = PublicSuffixList.load()
+    return _psl
+
+
+@lru_cache(maxsize=1 << 16)
+def registered_domain(host: str) -> Optional[str]:
+    return get_psl().registered_domain(host)
+
+
+def url_hosts(urls: pd.Series) -> pd.Series:
+    return pd.Series(urls, copy=False).fillna("").astype(str).str.extract(_HOST)["host"].fillna("").str.lower()
+
+
+def registered_domains(urls: pd.Series) -> pd.Series:
+    """Registered domain of every URL (one PSL lookup per distinct host)."""
+    hosts = url_hosts(urls)
+    unique = hosts.unique()
+    return hosts.map(dict(zip(unique, map(registered_domain, unique)))).rename("domain")
+
+
+def shared_host_mask(urls: pd.Series) -> np.ndarray:
+    """True for hosts whose paths belong to unrelated users (cloud storage, shorteners)."""
+    from url_features import CLOUD_HOSTS, SHORTENERS
+    hosts = url_hosts(urls)
+    shortener = "|".join(re.escape(s) for s in SHORTENERS)
+    return hosts.str.contains(rf"(?:^|\.)(?:{shortener})$|{CLOUD_HOSTS}", regex=True).to_numpy()
+
+
+# ========= Domain cache =========
+class DomainCache:
+    """Per-domain score priors and the reuse decision.
+
+    policy: "off", "observe" (count would-be hits, always call the model)
+    or "reuse" (answer confident domains from the cache).
+    """
+
+    def __init__(self, policy: str = "reuse", min_samples: int = 2, low: float = 0.05, high: float = 0.95,
+                 path: Optional[str] = None, namespace: str = "default"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown domain cache policy {policy!r}; choose from {POLICIES}")
+        self.policy = policy
+        self.min_samples = max(1, min_samples)
+        self.low, self.high = low, high
+        self.path = path
+        self.namespace = namespace
+        self.priors: dict[str, list] = {}  # domain -> [count, sum, min, max]
+        self.stats = {"urls": 0, "lookups": 0, "hits": 0, "would_hit": 0, "shared_host": 0, "no_domain": 0}
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.priors = json.load(f).get(namespace, {})
+
+    @classmethod
+    def from_env(cls, namespace: str = "default") -> Optional["DomainCache"]:
+        """Cache configured by $INFERENCE_DOMAIN_POLICY (off / observe / reuse), $DOMAIN_MIN_SAMPLES,
+        $DOMAIN_LOW, $DOMAIN_HIGH and $DOMAIN_CACHE_FILE ("off" = no persistence); None when off."""
+        policy = os.environ.get("INFERENCE_DOMAIN_POLICY", "off")
+        if policy == "off":
+            return None
+        path = os.environ.get("DOMAIN_CACHE_FILE", DEFAULT_CACHE_FILE)
+        return cls(policy, int(os.environ.get("DOMAIN_MIN_SAMPLES", "2")),
+                   float(os.environ.get("DOMAIN_LOW", "0.05")), float(os.environ.get("DOMAIN_HIGH", "0.95")),
+                   None if path == "off" else path, namespace)
+
+    def add(self, domain: Optional[str], score: float):
+        if not domain:
+            return
+        prior = self.priors.get(domain)
+        if prior is None:
+            self.priors[domain] = [1, score, score, score]
+        else:
+            prior[0] += 1
+            prior[1] += score
+            prior[2] = min(prior[2], score)
+            prior[3] = max(prior[3], score)
+
+    def verdict(self, domain: Optional[str]) -> Optional[float]:
+        """Mean score of a confidently benign / malicious domain, else None."""
+        prior = self.priors.get(domain) if domain else None
+        if prior is None or prior[0] < self.min_samples:
+            return None
+        if prior[3] <= self.low or prior[2] >= self.high:
+            return round(prior[1] / prior[0], 4)
+        return None
+
+    def split(self, rows: list, domains: list, shared: np.ndarray) -> tuple[list, list]:
+        """(probes, followers): the URLs that must be scored before their domain can have a
+        verdict, and the rest, which are resolved with `lookup()` once the probes are done."""
+        probes, followers, pending = [], [], {}
+        for row, domain, is_shared in zip(rows, domains, shared):
+            if is_shared or not domain:
+                self.stats["shared_host" if is_shared else "no_domain"] += 1
+                probes.append(row)
+                continue
+            prior = self.priors.get(domain)
+            known = prior[0] if prior else 0
+            if known + pending.get(domain, 0) < self.min_samples:
+                pending[domain] = pending.get(domain, 0) + 1
+                probes.append(row)
+            else:
+                followers.append(row)
+        return probes, followers
+
+    def lookup(self, domain: Optional[str], shared: bool = False) -> Optional[float]:
+        """Score to use instead of calling the model (None = call it); counts hits."""
+        self.stats["lookups"] += 1
+        if shared:
+            self.stats["shared_host"] += 1
+            return None
+        if not domain:
+            self.stats["no_domain"] += 1
+            return None
+        score = self.verdict(domain)
+        if score is None:
+            return None
+        if self.policy == "reuse":
+            self.stats["hits"] += 1
+            return score
+        self.stats["would_hit"] += 1
+        return None
+
+    def summary(self) -> dict:
+        urls = self.stats["urls"]
+        saved = self.stats["hits"] or self.stats["would_hit"]
+        return {**self.stats, "policy": self.policy, "domains": len(self.priors),
+                "hit_rate": saved / urls if urls else 0.0}
+
+    def save(self):
+        if not self.path:
+            return
+        data = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        data[self.namespace] = self.priors
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+
+def print_domain_summary(summary: dict):
+    verb = "复用" if summary["policy"] == "reuse" else "可复用（observe模式，未跳过）"
+    saved = summary["hits"] or summary["would_hit"]
+    print(f"域名缓存: {summary['urls']} 个URL，{summary['domains']} 个注册域名；{verb} {saved} 个"
+          f"（命中率 {summary['hit_rate']:.1%}），共享托管主机 {summary['shared_host']} 个，无域名 {summary['no_domain']} 个")
+
+
+# ========= Offline replay =========
+def replay(urls: pd.Series, scores: np.ndarray, cache: DomainCache) -> np.ndarray:
+    """Replay the policy over scored URLs in order; returns the scores the pipeline would have used."""
+    domains = registered_domains(urls).tolist()
+    shared = shared_host_mask(urls)
+    out = np.array(scores, dtype=float)
+    cache.stats["urls"] += len(out)
+    for i, (domain, is_shared) in enumerate(zip(domains, shared)):
+        hit = cache.lookup(domain, bool(is_shared))
+        if hit is not None:
+            out[i] = hit
+        elif not is_shared:
+            cache.add(domain, float(scores[i]))
+    return out
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Registered-domain skew and domain-cache savings report")
+    parser.add_argument("data_file", help="CSV with a url column (and type for accuracy)")
+    parser.add_argument("--results", default=None, help="{url: score} JSON to replay the reuse policy on")
+    parser.add_argument("--min-samples", type=int, default=2)
+    parser.add_argument("--low", type=float, default=0.05)
+    parser.add_argument("--high", type=float, default=0.95)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    df = pd.read_csv(args.data_file)
+    domains = registered_domains(df["url"])
+    counts = domains.value_counts()
+    repeated = counts[counts > 1]
+    print(f"{len(df)} 个URL，{len(counts)} 个注册域名；{int(repeated.sum())} 个URL"
+          f"（{repeated.sum() / max(len(df), 1):.1%}）所在域名出现不止一次")
+    print(f"同域名的后续URL上限（每个域名只调用一次）: {int((counts - 1).sum())}")
+    print(counts.head(args.top).to_string())
+
+    if args.results:
+        from evaluation import load_labels, binary_metrics
+        from url_canon import match_scores
+        with open(args.results, 'r', encoding='utf-8') as f:
+            predictions = json.load(f)
+        labels = load_labels(args.data_file) if "type" in df.columns else df
+        scores = match_scores(labels["url"], predictions).to_numpy(dtype=float)
+        scored = ~np.isnan(scores)
+        labels, scores = labels[scored].reset_index(drop=True), scores[scored]
+        cache = DomainCache("reuse", args.min_samples, args.low, args.high)
+        replayed = replay(labels["url"], scores, cache)
+        print()
+        print_domain_summary(cache.summary())
+        if "label" in labels.columns and len(np.unique(labels["label"])) == 2:
+            y = labels["label"].to_numpy()
+            before, after = binary_metrics(y, scores), binary_metrics(y, replayed)
+            print(f"AUROC {before['auroc']:.3f} -> {after['auroc']:.3f}  F1 {before['f1']:.3f} -> {after['f1']:.3f}"
+                  f"  复用分数与原分数的平均绝对差 {np.abs(replayed - scores).mean():.4f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
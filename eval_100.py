@@ -3,14 +3,18 @@ import math
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from sklearn.metrics import roc_curve, auc, confusion_matrix, ConfusionMatrixDisplay, f1_score as f1_sklearn
+from sklearn.metrics import roc_curve, auc, confusion_matrix, ConfusionMatrixDisplay
+from url_canon import match_scores
+from evaluation import threshold_sweep, best_thresholds, load_failures, drop_failed
+from report import save_or_show
 
 # 1) 读预测
 with open('claudehaiku_100_results.json', 'r') as f:
     raw_preds = json.load(f)
 
-# 2) 读前100真实标签
+# 2) 读前100真实标签（推理失败的URL没有分数，直接跳过）
 actual_data = pd.read_csv('./sampled_data_2000_balanced.csv').head(100)
+actual_data = drop_failed(actual_data, load_failures('claudehaiku_100_results.json')).reset_index(drop=True)
 
 # 3) 映射标签
 actual_data['type_numeric'] = actual_data['type'].map(
@@ -28,7 +32,7 @@ def _safe_to_float(x):
         v = max(0.0, min(1.0, v))
     return v
 
-mapped = actual_data['url'].map(raw_preds)               # 可能有 NaN
+mapped = match_scores(actual_data['url'], raw_preds)     # 原始/规范化URL匹配，可能有 NaN
 mapped = mapped.apply(_safe_to_float).fillna(0.5)        # 用 0.5 补缺
 y_pred_prob = mapped.values.astype(float)
 
@@ -54,20 +58,13 @@ plt.xlim([0.0, 1.0]); plt.ylim([0.0, 1.05])
 plt.xlabel('False Positive Rate'); plt.ylabel('True Positive Rate')
 plt.title('Claude Haiku CoT ROC Curve (100 URLs)')
 plt.legend(loc='lower right')
-plt.show()
+save_or_show('eval_100_roc.png')
 
 # 7) 建议阈值（不改变你主评估的0.2，仅打印建议）
-# Youden's J
-j_scores = tpr - fpr
-best_j_idx = int(np.argmax(j_scores))
-best_thresh_j = thresholds[best_j_idx]
-
-# F1最优
-f1_scores = []
-for th in thresholds:
-    y_bin = (y_pred_prob >= th).astype(int)
-    f1_scores.append(f1_sklearn(y_true, y_bin))
-best_thresh_f1 = thresholds[int(np.argmax(f1_scores))]
+# 分数只排序一次，用累计TP/FP得到每个阈值下的F1和Youden's J
+best = best_thresholds(threshold_sweep(y_true, y_pred_prob))
+best_thresh_j = best["youden_j"]["threshold"]
+best_thresh_f1 = best["f1"]["threshold"]
 
 print(f"[INFO] Suggested threshold (Youden's J): {best_thresh_j:.3f}")
 print(f"[INFO] Suggested threshold (Max F1):     {best_thresh_f1:.3f}")
@@ -81,7 +78,7 @@ cm = confusion_matrix(y_true, y_pred)
 disp = ConfusionMatrixDisplay(confusion_matrix=cm, display_labels=['Benign (0)', 'Phish/Mal/Deface (1)'])
 disp.plot(cmap=plt.cm.Blues)
 plt.title(f'Claude Haiku CoT Confusion Matrix (100 URLs, TH={TH})')
-plt.show()
+save_or_show('eval_100_confusion_matrix.png')
 
 TN, FP, FN, TP = cm.ravel()
 precision = TP / (TP + FP) if (TP + FP) > 0 else 0.0
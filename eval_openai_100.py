@@ -3,6 +3,8 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 from sklearn.metrics import roc_curve, auc, confusion_matrix, ConfusionMatrixDisplay
+from evaluation import load_labels, load_failures, join_predictions
+from report import save_or_show
 
 print("=== 开始执行OpenAI评估脚本 ===")
 
@@ -19,43 +21,20 @@ except Exception as e:
 # 加载原始实际标签数据
 print("步骤2: 正在加载原始实际标签数据...")
 try:
-    full_data = pd.read_csv('./extracted_urls_2000_balanced.csv')
+    full_data = load_labels('./extracted_urls_2000_balanced.csv')
     print(f"✓ 成功加载完整数据，共 {len(full_data)} 行")
     
     # 检查数据分布
     print(f"完整数据分布: {full_data['type'].value_counts().to_dict()}")
+    print(f"OpenAI预测数据中可用的URL数量: {len(openai_predictions)}")
     
-    # 找到OpenAI预测数据中URL在原始数据中的位置
-    available_urls = list(openai_predictions.keys())
-    print(f"OpenAI预测数据中可用的URL数量: {len(available_urls)}")
-    
-    # 找到这些URL在原始数据中的行号
-    url_positions = []
-    for url in available_urls:
-        if url in full_data['url'].values:
-            pos = full_data[full_data['url'] == url].index[0]
-            url_positions.append(pos)
-    
-    if url_positions:
-        # 找到包含这些URL的最小范围
-        min_pos = min(url_positions)
-        max_pos = max(url_positions)
-        
-        # 取包含这些URL的连续100行，确保包含恶意样本
-        start_pos = max(0, min_pos)
-        end_pos = min(len(full_data), start_pos + 100)
-        
-        # 如果范围太小，调整起始位置
-        if end_pos - start_pos < 100:
-            start_pos = max(0, end_pos - 100)
-        
-        actual_data = full_data.iloc[start_pos:end_pos].reset_index(drop=True)
-        print(f"✓ 找到URL位置范围: {min_pos} - {max_pos}")
-        print(f"✓ 取数据范围: {start_pos} - {end_pos}")
-        print(f"✓ 实际取到 {len(actual_data)} 行数据")
-    else:
+    # 按URL（原始或规范化写法）把预测结果和标签做一次哈希连接
+    actual_data = join_predictions(full_data, openai_predictions, only_predicted=True).reset_index(drop=True)
+    if len(actual_data) == 0:
         print("⚠️  警告: 在原始数据中找不到OpenAI预测的URL，使用前100行")
-        actual_data = full_data.head(100)
+        actual_data = join_predictions(full_data.head(100), openai_predictions,
+                                       failed=load_failures('openai_100_results.json'))
+    print(f"✓ 匹配到 {len(actual_data)} 行数据")
     
     # 检查数据分布
     print(f"取到的数据分布: {actual_data['type'].value_counts().to_dict()}")
@@ -64,33 +43,21 @@ except Exception as e:
     print(f"✗ 加载实际标签数据失败: {e}")
     exit(1)
 
-# 将 phishing, malware, defacement, mal 均标记为1，benign标记为0
+# 将 phishing, malware, defacement, mal 均标记为1，benign标记为0（evaluation.LABEL_MAP）
 print("步骤3: 正在转换标签格式...")
-actual_data['type_numeric'] = actual_data['type'].map(
-    {'benign': 0, 'phishing': 1, 'malware': 1, 'defacement': 1, 'mal': 1}
-)
-print(f"✓ 标签转换完成，标签分布: {actual_data['type_numeric'].value_counts().to_dict()}")
+print(f"✓ 标签转换完成，标签分布: {actual_data['label'].value_counts().to_dict()}")
 
 # 提取真实标签和OpenAI预测概率
 print("步骤4: 正在提取真实标签和OpenAI预测概率...")
-y_true = actual_data['type_numeric'].values
+y_true = actual_data['label'].values
 print(f"✓ 真实标签提取完成，形状: {y_true.shape}")
 
-# 确保所有URL都有对应的预测值
-y_pred_prob_openai = []
-missing_urls = []
-for url in actual_data['url']:
-    if url in openai_predictions:
-        y_pred_prob_openai.append(float(openai_predictions[url]))
-    else:
-        missing_urls.append(url)
-        y_pred_prob_openai.append(0.5)  # 默认值
-
+missing_urls = actual_data.loc[~actual_data['matched'], 'url'].tolist()
 if missing_urls:
     print(f"⚠️  警告: 发现 {len(missing_urls)} 个URL在OpenAI预测中缺失")
     print(f"缺失的URL示例: {missing_urls[:3]}")
 
-y_pred_prob_openai = np.array(y_pred_prob_openai)
+y_pred_prob_openai = actual_data['score'].to_numpy()
 print(f"✓ OpenAI预测概率提取完成，形状: {y_pred_prob_openai.shape}")
 
 # 检查是否有NaN值
@@ -130,10 +97,10 @@ plt.xlim([0.0, 1.0])
 plt.ylim([0.0, 1.05])
 plt.xlabel('False Positive Rate')
 plt.ylabel('True Positive Rate')
-plt.title('OpenAI ROC Curve (100 URLs)')
+plt.title(f'OpenAI ROC Curve ({len(actual_data)} URLs)')
 plt.legend(loc='lower right')
-plt.show()
-print("✓ ROC曲线图表显示完成")
+save_or_show('eval_openai_100_roc.png')
+print("✓ ROC曲线图表保存完成")
 
 # 预测标签（阈值设为0.2）
 print("步骤6: 正在计算预测标签...")
@@ -146,9 +113,9 @@ try:
     cm = confusion_matrix(y_true, y_pred)
     disp = ConfusionMatrixDisplay(confusion_matrix=cm, display_labels=['Benign (0)', 'Phishing/Malware/Defacement (1)'])
     disp.plot(cmap=plt.cm.Blues)
-    plt.title('OpenAI Confusion Matrix (100 URLs)')
-    plt.show()
-    print("✓ 混淆矩阵计算和显示完成")
+    plt.title(f'OpenAI Confusion Matrix ({len(actual_data)} URLs)')
+    save_or_show('eval_openai_100_confusion_matrix.png')
+    print("✓ 混淆矩阵计算和保存完成")
 except Exception as e:
     print(f"✗ 混淆矩阵计算失败: {e}")
     exit(1)
@@ -157,7 +124,7 @@ except Exception as e:
 print("步骤8: 正在计算性能指标...")
 TN, FP, FN, TP = cm.ravel()
 
-print("=== OpenAI Results (100 URLs) ===")
+print(f"=== OpenAI Results ({len(actual_data)} URLs) ===")
 print("True Positives (TP):", TP)
 print("False Positives (FP):", FP)
 print("True Negatives (TN):", TN)
@@ -178,8 +145,7 @@ print("✓ 性能指标计算完成")
 print("\n" + "=" * 50)
 print("详细结果:")
 print("步骤9: 正在显示详细结果...")
-for i, (url, true_label) in enumerate(zip(actual_data['url'], actual_data['type'])):
-    pred_prob = openai_predictions.get(url, 0.5)
+for i, (url, true_label, pred_prob) in enumerate(zip(actual_data['url'], actual_data['type'], y_pred_prob_openai)):
     pred_label = "Malicious" if pred_prob >= 0.2 else "Benign"
     correct = "✓" if (true_label == 'benign' and pred_prob < 0.2) or (true_label != 'benign' and pred_prob >= 0.2) else "✗"
     print(f"{i+1:2d}. {url[:50]:<50} | True: {true_label:>10} | Pred: {pred_prob:.3f} ({pred_label:>9}) | {correct}")
@@ -0,0 +1,267 @@
+"""
+Shared evaluation helpers: join predictions to labels and compute metrics.
+
+Predictions (`{url: score}` JSON) are joined to the labelled CSV with one
+hash join on the URL (canonical URL as fallback, see url_canon.py), the
+label taxonomy is mapped once, and every metric is a vectorized NumPy /
+pandas operation, so the same code evaluates 100 or millions of rows.
+URLs the run could not score (`<results>.failures.json`, see run_journal.py)
+are left out rather than counted as a missing prediction.
+`threshold_sweep()` sorts the scores once and derives precision, recall,
+F1, Youden's J, cost-weighted utility and FPR@TPR for every threshold from
+cumulative TP/FP counts (O(n log n) instead of one pass per threshold).
+
+    python evaluation.py openai_100_results.json extracted_urls_2000_balanced_shuffled.csv
+    python evaluation.py *_url_classification_results.json sampled_data_2000_balanced.csv --sweep
+"""
+
+import sys
+import json
+import argparse
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from url_canon import match_scores
+from run_journal import failures_file
+
+# benign -> 0, everything harmful -> 1
+LABEL_MAP = {'benign': 0, 'phishing': 1, 'malware': 1, 'defacement': 1, 'mal': 1}
+THRESHOLD = 0.2
+
+
+def load_predictions(path: str) -> dict:
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def load_failures(path: str) -> dict:
+    """{url: error} of the URLs the run behind result file `path` could not score ({} if none)."""
+    try:
+        with open(failures_file(path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def load_labels(data_file: str, limit: Optional[int] = None) -> pd.DataFrame:
+    """Labelled rows with a numeric `label` column (unknown types are dropped)."""
+    df = pd.read_csv(data_file)
+    if limit:
+        df = df.head(limit)
+    df['label'] = df['type'].map(LABEL_MAP)
+    unknown = df['label'].isna()
+    if unknown.any():
+        print(f"[WARN] 未知标签类型，已忽略 {int(unknown.sum())} 行: {df.loc[unknown, 'type'].unique()[:5].tolist()}")
+        df = df[~unknown]
+    df['label'] = df['label'].astype(int)
+    return df
+
+
+def drop_failed(labels: pd.DataFrame, failed: Optional[dict]) -> pd.DataFrame:
+    """Labelled rows whose URL is not in `failed` ({url: error}, see load_failures)."""
+    if not failed:
+        return labels
+    ok = match_scores(labels['url'].astype(str), dict.fromkeys(failed, 1.0)).isna()
+    if not ok.all():
+        print(f"[WARN] 跳过 {int((~ok).sum())} 个推理失败的URL")
+    return labels[ok]
+
+
+def join_predictions(labels: pd.DataFrame, predictions: dict,
+                     default: Optional[float] = 0.5, only_predicted: bool = False,
+                     failed: Optional[dict] = None) -> pd.DataFrame:
+    """Add `score` (clamped to [0,1]) and `matched` columns to the labelled rows.
+
+    Rows without a prediction get `default` (or are dropped when
+    only_predicted=True or default=None). Rows whose URL is in `failed`
+    (see load_failures) are always dropped.
+    """
+    df = drop_failed(labels, failed).copy()
+    score = match_scores(df['url'].astype(str), predictions)
+    df['matched'] = score.notna()
+    if only_predicted or default is None:
+        df = df[df['matched']]
+        score = score[df.index]
+    df['score'] = score.fillna(default).clip(0.0, 1.0)
+    return df
+
+
+def confusion(y_true: np.ndarray, y_pred: np.ndarray) -> tuple[int, int, int, int]:
+    """(TN, FP, FN, TP) with one bincount."""
+    tn, fp, fn, tp = np.bincount(2 * np.asarray(y_true, dtype=np.int64) + np.asarray(y_pred, dtype=np.int64),
+                                 minlength=4)[:4]
+    return int(tn), int(fp), int(fn), int(tp)
+
+
+def _ratio(a, b):
+    return a / b if b > 0 else 0.0
+
+
+def auroc(y_true: np.ndarray, scores: np.ndarray) -> float:
+    """Rank-based AUROC (Mann-Whitney U, ties averaged); NaN with a single class."""
+    from scipy.stats import rankdata
+    y_true = np.asarray(y_true)
+    n_pos = int(y_true.sum())
+    n_neg = len(y_true) - n_pos
+    if n_pos == 0 or n_neg == 0:
+        return float("nan")
+    ranks = rankdata(scores)
+    return float((ranks[y_true == 1].sum() - n_pos * (n_pos + 1) / 2) / (n_pos * n_neg))
+
+
+def binary_metrics(y_true: np.ndarray, scores: np.ndarray, threshold: float = THRESHOLD) -> dict:
+    y_true = np.asarray(y_true).astype(int)
+    scores = np.asarray(scores, dtype=float)
+    tn, fp, fn, tp = confusion(y_true, scores >= threshold)
+    precision = _ratio(tp, tp + fp)
+    recall = _ratio(tp, tp + fn)
+    return {
+        "n": len(y_true), "threshold": threshold,
+        "tp": tp, "fp": fp, "tn": tn, "fn": fn,
+        "accuracy": _ratio(tp + tn, len(y_true)),
+        "precision": precision,
+        "recall": recall,
+        "f1": _ratio(2 * precision * recall, precision + recall),
+        "fpr": _ratio(fp, fp + tn),
+        "auroc": auroc(y_true, scores),
+    }
+
+
+def threshold_sweep(y_true: np.ndarray, scores: np.ndarray,
+                    cost_fp: float = 1.0, cost_fn: float = 1.0) -> pd.DataFrame:
+    """Metrics at every distinct score, used as threshold (malicious when score >= threshold).
+
+    Rows are in descending threshold order, so recall and fpr are non-decreasing.
+    utility = -(cost_fp * FP + cost_fn * FN) / n, higher is better.
+    """
+    y = np.asarray(y_true).astype(np.int64)
+    s = np.asarray(scores, dtype=float)
+    order = np.argsort(-s, kind="mergesort")
+    s_sorted, y_sorted = s[order], y[order]
+    # cumulative counts at the last position of each run of equal scores
+    last = np.r_[np.flatnonzero(s_sorted[1:] != s_sorted[:-1]), len(s) - 1] if len(s) else np.array([], dtype=int)
+    tp = np.cumsum(y_sorted)[last]
+    fp = np.cumsum(1 - y_sorted)[last]
+    n_pos, n = int(y.sum()), len(y)
+    n_neg = n - n_pos
+    fn, tn = n_pos - tp, n_neg - fp
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = tp / (tp + fp)
+        recall = tp / n_pos if n_pos else np.zeros(len(tp))
+        fpr = fp / n_neg if n_neg else np.zeros(len(fp))
+        f1 = np.where(tp > 0, 2 * tp / (2 * tp + fp + fn), 0.0)
+    return pd.DataFrame({
+        "threshold": s_sorted[last], "tp": tp, "fp": fp, "fn": fn, "tn": tn,
+        "precision": precision, "recall": recall, "fpr": fpr, "f1": f1,
+        "youden_j": recall - fpr,
+        "utility": -(cost_fp * fp + cost_fn * fn) / max(n, 1),
+    })
+
+
+def best_thresholds(sweep: pd.DataFrame) -> dict:
+    """Threshold (and its row) maximizing F1, Youden's J and utility."""
+    return {metric: sweep.loc[sweep[metric].idxmax()] for metric in ("f1", "youden_j", "utility")}
+
+
+def fpr_at_tpr(sweep: pd.DataFrame, targets=(0.9, 0.95, 0.99)) -> dict:
+    """{target: (fpr, threshold)}: lowest FPR whose recall reaches each target."""
+    recall = sweep["recall"].to_numpy()
+    out = {}
+    for target in targets:
+        i = int(np.searchsorted(recall, target - 1e-12))
+        out[target] = (float(sweep["fpr"].iat[i]), float(sweep["threshold"].iat[i])) if i < len(sweep) else (float("nan"), float("nan"))
+    return out
+
+
+def sweep_summary(result_files: list[str], data_file: str, limit: Optional[int] = None,
+                  cost_fp: float = 1.0, cost_fn: float = 1.0,
+                  tpr_targets=(0.9, 0.95, 0.99), only_predicted: bool = False) -> pd.DataFrame:
+    """One row per result file: AUROC, best thresholds and FPR@TPR targets."""
+    labels = load_labels(data_file, limit)
+    rows = []
+    for path in result_files:
+        df = join_predictions(labels, load_predictions(path), only_predicted=only_predicted,
+                              failed=load_failures(path))
+        y, scores = df['label'].to_numpy(), df['score'].to_numpy()
+        sweep = threshold_sweep(y, scores, cost_fp, cost_fn)
+        best = best_thresholds(sweep)
+        row = {"file": path, "n": len(df), "coverage": float(df['matched'].mean()) if len(df) else 0.0,
+               "auroc": auroc(y, scores),
+               "max_f1": best["f1"]["f1"], "f1_threshold": best["f1"]["threshold"],
+               "youden_j": best["youden_j"]["youden_j"], "j_threshold": best["youden_j"]["threshold"],
+               "utility": best["utility"]["utility"], "utility_threshold": best["utility"]["threshold"]}
+        for target, (fpr, _) in fpr_at_tpr(sweep, tpr_targets).items():
+            row[f"fpr@tpr{target:g}"] = fpr
+        rows.append(row)
+    return pd.DataFrame(rows).set_index("file")
+
+
+def per_category(df: pd.DataFrame, threshold: float = THRESHOLD) -> pd.DataFrame:
+    """Per original `type`: rows, mean score and share flagged malicious
+    (detection rate for harmful types, false-positive rate for benign)."""
+    flagged = (df['score'] >= threshold).astype(float)
+    return (df.assign(flagged=flagged)
+              .groupby('type')
+              .agg(n=('score', 'size'), mean_score=('score', 'mean'), flagged_rate=('flagged', 'mean'))
+              .sort_values('n', ascending=False))
+
+
+def evaluate(results_file: str, data_file: str, threshold: float = THRESHOLD,
+             limit: Optional[int] = None, only_predicted: bool = False) -> tuple[dict, pd.DataFrame]:
+    """Metrics and the joined rows for one result file."""
+    df = join_predictions(load_labels(data_file, limit), load_predictions(results_file),
+                          only_predicted=only_predicted, failed=load_failures(results_file))
+    metrics = binary_metrics(df['label'].to_numpy(), df['score'].to_numpy(), threshold)
+    metrics["coverage"] = float(df['matched'].mean()) if len(df) else 0.0
+    return metrics, df
+
+
+def print_metrics(name: str, metrics: dict, categories: Optional[pd.DataFrame] = None):
+    print(f"=== {name} ({metrics['n']} URLs) ===")
+    if "coverage" in metrics:
+        print(f"Coverage: {metrics['coverage'] * 100:.1f}%")
+    print("True Positives (TP):", metrics["tp"])
+    print("False Positives (FP):", metrics["fp"])
+    print("True Negatives (TN):", metrics["tn"])
+    print("False Negatives (FN):", metrics["fn"])
+    print("Precision:", metrics["precision"])
+    print("Recall:", metrics["recall"])
+    print("F1 Score:", metrics["f1"])
+    print("AUROC:", metrics["auroc"])
+    if categories is not None:
+        print("\n按类别:")
+        print(categories.to_string(float_format=lambda v: f"{v:.3f}"))
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Evaluate {url: score} result files against labels")
+    parser.add_argument("results", nargs="+", help="result JSON file(s)")
+    parser.add_argument("data_file", help="labelled CSV with url,type columns")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--limit", type=int, default=None, help="only the first N rows of the data file")
+    parser.add_argument("--only-predicted", action="store_true",
+                        help="evaluate only rows that have a prediction (default: missing = 0.5)")
+    parser.add_argument("--sweep", action="store_true",
+                        help="threshold analysis of all files (best F1 / Youden's J / utility, FPR@TPR)")
+    parser.add_argument("--cost-fp", type=float, default=1.0, help="cost of a false positive for --sweep utility")
+    parser.add_argument("--cost-fn", type=float, default=1.0, help="cost of a false negative for --sweep utility")
+    args = parser.parse_args(argv)
+
+    if args.sweep:
+        summary = sweep_summary(args.results, args.data_file, args.limit, args.cost_fp, args.cost_fn,
+                                only_predicted=args.only_predicted)
+        pd.set_option("display.width", 200)
+        print(summary.to_string(float_format=lambda v: f"{v:.3f}"))
+        return 0
+
+    for path in args.results:
+        metrics, df = evaluate(path, args.data_file, args.threshold, args.limit, args.only_predicted)
+        print_metrics(path, metrics, per_category(df, args.threshold))
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,124 +1,102 @@
-import pandas as pd
-import numpy as np
-from pathlib import Path
+"""
+从DeepURLBench的parquet文件中随机提取URL，保存为 url,type 格式的CSV。
 
-def extract_urls_from_parquet(parquet_path, output_csv_path, num_urls=2000):
+可以传入目录、glob或单个part文件；所有part作为一个数据集按批次流式读取，
+只读取URL和标签列，内存中最多保留约 2*num_urls 个候选（见 parquet_ingest.py、sampler.py）。
+按类别比例分层抽样请用 sampler.py。
+
+    python extract_urls_from_parquet.py DeepURLBench-main/urls_with_dns --out extracted_urls_2000.csv --num-urls 2000
+"""
+
+import sys
+import argparse
+from typing import Optional
+
+from parquet_ingest import open_dataset, detect_columns, iter_url_batches
+from sampler import ALL, StratifiedReservoir
+
+
+def extract_urls_from_parquet(parquet_path, output_csv_path, num_urls=2000, seed=42,
+                              url_column=None, label_column=None):
     """
     从parquet文件中提取URL数据并保存为CSV格式
-    
+
     Args:
-        parquet_path: parquet文件路径
+        parquet_path: parquet文件、目录或glob（也可以是列表）
         output_csv_path: 输出CSV文件路径
-        num_urls: 要提取的URL数量
+        num_urls: 要提取的URL数量（均匀随机采样）
+        seed: 随机种子
     """
-    
-    print(f"正在读取parquet文件: {parquet_path}")
-    
+
+    print(f"正在读取parquet数据集: {parquet_path}")
+
     try:
-        # 读取parquet文件
-        df = pd.read_parquet(parquet_path)
-        print(f"成功读取parquet文件，总行数: {len(df)}")
-        print(f"列名: {list(df.columns)}")
-        
-        # 显示前几行数据
-        print("\n前5行数据:")
-        print(df.head())
-        
-        # 检查是否有URL列
-        url_columns = [col for col in df.columns if 'url' in col.lower() or 'link' in col.lower()]
-        if not url_columns:
-            print("\n警告: 未找到URL相关的列")
-            print("可用的列:")
-            for i, col in enumerate(df.columns):
-                print(f"  {i}: {col}")
-            
-            # 让用户选择列
-            try:
-                url_col_idx = int(input("\n请选择包含URL的列索引: "))
-                url_column = df.columns[url_col_idx]
-            except (ValueError, IndexError):
-                print("无效选择，使用第一列")
-                url_column = df.columns[0]
-        else:
-            url_column = url_columns[0]
-            print(f"\n使用列 '{url_column}' 作为URL列")
-        
-        # 提取URL数据
-        urls = df[url_column].dropna().astype(str)
-        print(f"\n提取到 {len(urls)} 个非空URL")
-        
-        # 随机采样
-        if len(urls) >= num_urls:
-            sampled_urls = urls.sample(n=num_urls, random_state=42)
-            print(f"随机采样 {num_urls} 个URL")
-        else:
-            sampled_urls = urls
-            print(f"URL数量不足 {num_urls}，使用全部 {len(sampled_urls)} 个URL")
-        
-        # 创建输出数据框
-        output_df = pd.DataFrame({
-            'url': sampled_urls,
-            'type': 'unknown'  # 默认标签，你可以手动标注或使用其他方法
-        })
-        
-        # 保存为CSV
-        output_df.to_csv(output_csv_path, index=False)
-        print(f"\n成功保存 {len(output_df)} 个URL到: {output_csv_path}")
-        
-        # 显示统计信息
-        print(f"\n统计信息:")
-        print(f"总URL数: {len(output_df)}")
-        print(f"平均URL长度: {output_df['url'].str.len().mean():.1f}")
-        print(f"最短URL: {output_df['url'].str.len().min()} 字符")
-        print(f"最长URL: {output_df['url'].str.len().max()} 字符")
-        
-        # 显示前10个URL示例
-        print(f"\n前10个URL示例:")
-        for i, url in enumerate(output_df['url'].head(10)):
-            print(f"  {i+1}: {url}")
-            
-        return output_df
-        
-    except Exception as e:
+        dataset = open_dataset(parquet_path)
+        url_column, label_column = detect_columns(dataset.schema, url_column, label_column)
+    except (FileNotFoundError, ValueError) as e:
         print(f"处理parquet文件时出错: {e}")
         return None
+    print(f"part文件数: {len(dataset.files)}  列名: {dataset.schema.names}")
+    print(f"使用列 '{url_column}' 作为URL列" + (f"，'{label_column}' 作为标签列" if label_column else "（无标签列）"))
+
+    # 流式均匀采样（见 sampler.py）：每行一个随机键，只保留键最小的 num_urls 行
+    reservoir = StratifiedReservoir({ALL: num_urls}, seed)
+    for table in iter_url_batches(dataset, url_column, label_column):
+        reservoir.add(table.to_pandas())
+    total = sum(reservoir.seen.values())
+    if total == 0:
+        print("没有读取到任何URL")
+        return None
+    print(f"\n扫描到 {total} 个非空URL")
+    if total > num_urls:
+        print(f"随机采样 {num_urls} 个URL")
+    else:
+        print(f"URL数量不足 {num_urls}，使用全部 {total} 个URL")
+
+    output_df = reservoir.result()
+    output_df.to_csv(output_csv_path, index=False)
+    print(f"\n成功保存 {len(output_df)} 个URL到: {output_csv_path}")
+
+    # 显示统计信息
+    print(f"\n统计信息:")
+    print(f"总URL数: {len(output_df)}")
+    print(f"平均URL长度: {output_df['url'].str.len().mean():.1f}")
+    print(f"最短URL: {output_df['url'].str.len().min()} 字符")
+    print(f"最长URL: {output_df['url'].str.len().max()} 字符")
+    print(output_df['type'].value_counts().to_string())
+
+    # 显示前10个URL示例
+    print(f"\n前10个URL示例:")
+    for i, url in enumerate(output_df['url'].head(10)):
+        print(f"  {i+1}: {url}")
+
+    return output_df
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="从parquet part文件中随机提取URL到CSV")
+    parser.add_argument("source", nargs="+", help="parquet文件、目录或glob")
+    parser.add_argument("--out", default="extracted_urls_2000.csv", help="输出CSV文件路径")
+    parser.add_argument("--num-urls", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--url-column", default=None)
+    parser.add_argument("--label-column", default=None)
+    args = parser.parse_args(argv)
 
-def main():
-    # 配置路径
-    parquet_path = r"c:\Users\lujun\AppData\Local\Temp\a1a758b0-c444-4cb2-9655-f2c6177e4b78_DeepURLBench-main.zip.b78\DeepURLBench-main\urls_with_dns\part-00003.parquet"
-    output_csv_path = "extracted_urls_2000.csv"
-    
     print("=" * 60)
     print("从Parquet文件提取URL数据")
     print("=" * 60)
-    
-    # 检查parquet文件是否存在
-    if not Path(parquet_path).exists():
-        print(f"错误: Parquet文件不存在: {parquet_path}")
-        print("\n请提供正确的parquet文件路径:")
-        parquet_path = input("Parquet文件路径: ").strip()
-        
-        if not parquet_path or not Path(parquet_path).exists():
-            print("无效路径，退出程序")
-            return
-    
-    # 提取URL
-    result_df = extract_urls_from_parquet(parquet_path, output_csv_path)
-    
-    if result_df is not None:
-        print("\n" + "=" * 60)
-        print("提取完成！")
-        print(f"输出文件: {output_csv_path}")
-        print("=" * 60)
-        
-        # 询问是否要查看文件内容
-        try:
-            view_file = input("\n是否查看输出文件的前几行? (y/n): ").lower().strip()
-            if view_file == 'y':
-                print(f"\n{output_csv_path} 的前10行:")
-                print(result_df.head(10).to_string(index=False))
-        except KeyboardInterrupt:
-            pass
+
+    result_df = extract_urls_from_parquet(args.source, args.out, args.num_urls, args.seed,
+                                          args.url_column, args.label_column)
+    if result_df is None:
+        return 1
+    print("\n" + "=" * 60)
+    print("提取完成！")
+    print(f"输出文件: {args.out}")
+    print("=" * 60)
+    return 0
+
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    sys.exit(main())
@@ -1,15 +1,23 @@
 """
 Generate a beautiful confusion matrix visualization for URL classification results.
 This script creates a publication-ready confusion matrix with enhanced styling.
+
+    python generate_confusion_matrix.py [results.json] [data.csv] [--dpi 300] [--model GPT-4o-mini]
+
+Rendering uses the non-interactive Agg backend; for a comparison of every
+result file at once see report.py.
 """
 
-import json
-import pandas as pd
+import argparse
+import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import numpy as np
-from sklearn.metrics import confusion_matrix, ConfusionMatrixDisplay, classification_report
+from sklearn.metrics import confusion_matrix, classification_report
 import seaborn as sns
 
+from evaluation import load_labels, load_predictions, load_failures, join_predictions
+
 # Set style for better-looking plots
 plt.style.use('seaborn-v0_8-darkgrid')
 sns.set_palette("husl")
@@ -19,33 +27,13 @@ def load_data(results_file='openai_100_results.json',
     """Load prediction results and ground truth labels."""
     print("📊 Loading data...")
     
-    # Load predictions
-    with open(results_file, 'r') as f:
-        predictions = json.load(f)
-    
-    # Load ground truth
-    df = pd.read_csv(data_file).head(100)
+    predictions = load_predictions(results_file)
+    df = join_predictions(load_labels(data_file, limit=100), predictions, failed=load_failures(results_file))
     
-    # Convert labels to binary (0=benign, 1=malicious)
-    df['type_numeric'] = df['type'].map({
-        'benign': 0, 
-        'phishing': 1, 
-        'malware': 1, 
-        'defacement': 1, 
-        'mal': 1
-    })
-    
-    # Extract predictions for matching URLs
-    y_true = []
-    y_pred_prob = []
-    
-    for url in df['url']:
-        y_true.append(df[df['url'] == url]['type_numeric'].values[0])
-        y_pred_prob.append(float(predictions.get(url, 0.5)))
-    
-    return np.array(y_true), np.array(y_pred_prob), df
+    return df['label'].to_numpy(), df['score'].to_numpy(), df
 
-def create_confusion_matrix(y_true, y_pred_prob, threshold=0.2, save_path='confusion_matrix.png'):
+def create_confusion_matrix(y_true, y_pred_prob, threshold=0.2, save_path='confusion_matrix.png',
+                            dpi=300, model='GPT-4o-mini'):
     """Create a beautiful confusion matrix visualization."""
     
     # Convert probabilities to binary predictions
@@ -128,7 +116,7 @@ def create_confusion_matrix(y_true, y_pred_prob, threshold=0.2, save_path='confu
     
     ⚙️  Configuration
     
-    • Model: GPT-4o-mini
+    • Model: {model}
     • Threshold: {threshold}
     • Total Samples: {len(y_true)}
     • Benign: {np.sum(y_true == 0)}
@@ -142,7 +130,8 @@ def create_confusion_matrix(y_true, y_pred_prob, threshold=0.2, save_path='confu
              bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.3))
     
     plt.tight_layout()
-    plt.savefig(save_path, dpi=300, bbox_inches='tight', facecolor='white')
+    plt.savefig(save_path, dpi=dpi, bbox_inches='tight', facecolor='white')
+    plt.close(fig)
     print(f"✅ Confusion matrix saved to: {save_path}")
     
     # Print classification report
@@ -155,18 +144,28 @@ def create_confusion_matrix(y_true, y_pred_prob, threshold=0.2, save_path='confu
     
     return cm, accuracy, precision, recall, f1
 
-def main():
+def main(argv=None):
     """Main function to generate confusion matrix."""
+    parser = argparse.ArgumentParser(description="Confusion matrix figure for one result file")
+    parser.add_argument("results_file", nargs="?", default='openai_100_results.json')
+    parser.add_argument("data_file", nargs="?", default='./extracted_urls_2000_balanced_shuffled.csv')
+    parser.add_argument("--out", default='confusion_matrix.png')
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--model", default='GPT-4o-mini')
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
     print("="*60)
     print("🎨 Generating Beautiful Confusion Matrix")
     print("="*60)
     
     # Load data
-    y_true, y_pred_prob, df = load_data()
+    y_true, y_pred_prob, df = load_data(args.results_file, args.data_file)
     
     # Create confusion matrix
     cm, accuracy, precision, recall, f1 = create_confusion_matrix(
-        y_true, y_pred_prob, threshold=0.2
+        y_true, y_pred_prob, threshold=args.threshold, save_path=args.out,
+        dpi=args.dpi, model=args.model
     )
     
     print("\n" + "="*60)
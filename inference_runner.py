@@ -0,0 +1,295 @@
+"""
+Shared inference loop used by every *_inference script.
+
+Reads the dataset, scores each URL through a provider with bounded
+concurrency, appends every result to a crash-safe journal, and finally
+compacts the journal into the `{url: score}` / `{url: reason}` JSON files
+and prints the usual summary statistics. URLs that could not be scored are
+listed in `<output_file>.failures.json` instead of getting a score. An interrupted run resumes from
+its journal on the next start. Per-call latency/token/cost metrics go to
+`<output_file>.metrics.jsonl` and are summarized at the end of the run. With batch_size > 1 several URLs share one
+request (see batch_prompting.py). mode="batch" hands the whole dataset to
+an offline provider batch job instead (see batch_jobs.py). With prefilter on,
+URLs a fitted, calibrated lexical scorer is confident about skip the LLM
+(see url_features.py).
+Local providers with `vectorized = True` (see ngram_model.py) score the whole
+dataset in one predict() call.
+With $INFERENCE_RUN_STORE set, the finished run is also written to that
+columnar run store (see run_store.py).
+Spellings of the same URL (see url_canon.py) are scored once and the score is
+written for every original row. With $INFERENCE_DOMAIN_POLICY=reuse the first
+URLs of each registered domain are scored first and the remaining paths of
+confidently benign / malicious domains reuse their score (see domain_cache.py).
+With $INFERENCE_NEAR_DUP=1 lookalikes of already scored URLs reuse their
+score, and one leader per cluster of lookalikes is scored for the rest
+(see near_dup.py).
+"""
+
+import os
+import asyncio
+import pandas as pd
+from tqdm import tqdm
+
+from async_engine import run_bounded
+from providers import Provider, aclose_http_clients
+from run_journal import RunJournal, ERROR_PREFIX, is_failure, failures_file
+from batch_prompting import BatchScorer, drift_report, print_drift
+from batch_jobs import run_batch_job
+from call_metrics import MetricsRecorder, load_metrics, summarize, print_summary
+from url_features import load_prefilter, extract_features, confident_mask
+from url_canon import dedupe as find_aliases
+from domain_cache import DomainCache, registered_domains, shared_host_mask, print_domain_summary
+from near_dup import NearDupIndex, print_near_dup_summary
+from run_store import RunStore
+
+# 复用别处分数的记录（不是模型给出的），续跑时不能当作新证据
+REUSED_REASON_PREFIXES = ("lexical pre-filter", "near duplicate of ", "domain cache: ")
+
+
+def is_reused(reason) -> bool:
+    """True for journal reasons of rows whose score was reused, not produced by the model."""
+    return isinstance(reason, str) and reason.startswith(REUSED_REASON_PREFIXES)
+
+
+def run_inference(provider: Provider,
+                  data_file: str,
+                  output_file: str,
+                  reasons_file: str = None,
+                  limit: int = 0,
+                  concurrency: int = None,
+                  resume: bool = None,
+                  fsync_every: int = 50,
+                  batch_size: int = None,
+                  drift_sample: int = None,
+                  mode: str = None,
+                  prefilter: bool = None,
+                  dedupe: bool = None,
+                  verbose: bool = False) -> dict:
+    """Score every URL in `data_file` with `provider` and write the result files.
+
+    limit: only the first `limit` rows (0 = all rows).
+    concurrency: in-flight request limit (default: $INFERENCE_CONCURRENCY or 16).
+    resume: continue from `<output_file>.journal.jsonl` if an earlier run was
+        interrupted, retrying the URLs that failed (default: True unless $INFERENCE_FRESH=1).
+    fsync_every: journal records per fsync batch.
+    batch_size: URLs per request (default: $INFERENCE_BATCH_SIZE or 1).
+    drift_sample: in batch mode, re-score this many URLs one by one and report
+        the score drift (default: $INFERENCE_DRIFT_SAMPLE or 20; 0 disables).
+    mode: "online" or "batch" (offline batch job; default: $INFERENCE_MODE or online).
+    prefilter: score URLs outside the calibrated band of the fitted lexical
+        scorer in $PREFILTER_MODEL (default lexical_scorer.json) without calling
+        the provider; without that file nothing is skipped (default: $INFERENCE_PREFILTER=1).
+    dedupe: score one spelling per canonical URL and copy its score to the
+        others (default: True unless $INFERENCE_DEDUPE=0).
+    Returns the `{url: score}` dict.
+    """
+    if mode is None:
+        mode = os.environ.get("INFERENCE_MODE", "online")
+    if mode == "batch":
+        return run_batch_job(provider, data_file, output_file, reasons_file, limit=limit,
+                             poll_interval=float(os.environ.get("BATCH_POLL_INTERVAL", "30")))
+    if mode != "online":
+        raise ValueError(f"Unknown mode {mode!r}; choose 'online' or 'batch'")
+    if concurrency is None:
+        concurrency = int(os.environ.get("INFERENCE_CONCURRENCY", "16"))
+    if resume is None:
+        resume = os.environ.get("INFERENCE_FRESH", "") not in ("1", "true", "yes")
+    if batch_size is None:
+        batch_size = int(os.environ.get("INFERENCE_BATCH_SIZE", "1"))
+    if drift_sample is None:
+        drift_sample = int(os.environ.get("INFERENCE_DRIFT_SAMPLE", "20"))
+    if prefilter is None:
+        prefilter = os.environ.get("INFERENCE_PREFILTER", "") in ("1", "true", "yes")
+    if dedupe is None:
+        dedupe = os.environ.get("INFERENCE_DEDUPE", "1") not in ("0", "false", "no")
+
+    df = pd.read_csv(data_file)
+    if limit > 0:
+        df = df.head(limit)
+    print(f"开始处理 {len(df)} 个URL（{provider!r}，并发 {concurrency}）")
+    if 'type' in df.columns:
+        print(f"数据分布: {df['type'].value_counts().to_dict()}")
+
+    journal = RunJournal(output_file + ".journal.jsonl", fsync_every=fsync_every)
+    if not resume:
+        journal.remove()
+    done = journal.load()
+    # failed URLs ("Error: ..." records) are not done: a resumed run retries them
+    retry = {url for url, rec in done.items() if is_failure(rec.get("reason"))}
+    if done:
+        print(f"从日志恢复: 已完成 {len(done) - len(retry)} 个URL，{len(retry)} 个失败的URL重新排队，继续处理剩余URL")
+    else:
+        for path in (output_file, reasons_file):
+            if path and os.path.exists(path):
+                os.remove(path)
+                print(f"已删除现有文件: {path}")
+
+    aliases = find_aliases(df['url'].astype(str)) if dedupe else {}
+    if aliases:
+        print(f"规范化去重: {len(aliases)} 个URL与其他行重复，只推理一次")
+    labels = df['type'] if 'type' in df.columns else pd.Series([None] * len(df), index=df.index)
+    unique = {}
+    for row in zip(df.index, df['url'], labels):
+        if row[1] not in aliases:
+            unique.setdefault(row[1], row)
+    rows = [row for url, row in unique.items() if url not in done or url in retry]
+    total = len(unique)
+    pbar = tqdm(total=total, initial=total - len(rows))
+
+    lexical_scorer = load_prefilter() if prefilter and rows else None
+    if lexical_scorer is not None:
+        lexical = lexical_scorer.score(extract_features(pd.Series([row[1] for row in rows])))
+        skip = confident_mask(lexical, lexical_scorer.low, lexical_scorer.high)
+        for row, score, confident in zip(rows, lexical, skip):
+            if confident:
+                journal.append(row[1], round(float(score), 3), "lexical pre-filter")
+                pbar.update(1)
+        rows = [row for row, confident in zip(rows, skip) if not confident]
+        print(f"词法预过滤: 跳过 {int(skip.sum())} 个URL，{len(rows)} 个URL交给{provider.name}")
+
+    if provider.vectorized and rows:
+        # local models score everything in one vectorized call instead of one request per URL
+        scores = provider.predict([row[1] for row in rows])
+        for row, score in zip(rows, scores):
+            journal.append(row[1], round(float(score), 4), provider.reason)
+        pbar.update(len(rows))
+        print(f"{provider.name}: 向量化评分 {len(rows)} 个URL")
+        rows = []
+
+    namespace = f"{provider.name}/{provider.model}/{(provider.prompt_hash or '')[:12]}"
+    near_index = NearDupIndex.from_env(namespace)
+    near_followers, dup_leader, sig_of, scored = [], {}, {}, {}
+    if near_index is not None and rows:
+        matches, leader_of, sigs = near_index.plan([row[1] for row in rows])
+        sig_of = {row[1]: sig for row, sig in zip(rows, sigs)}
+        for i, (item, similarity) in matches.items():
+            journal.append(rows[i][1], near_index.scores[item],
+                           f"near duplicate of {near_index.urls[item]} ({similarity:.2f})")
+        near_index.stats["index_hits"] += len(matches)
+        pbar.update(len(matches))
+        dup_leader = {rows[i][1]: rows[j][1] for i, j in leader_of.items()}
+        near_followers = [rows[i] for i in leader_of]
+        rows = [row for i, row in enumerate(rows) if i not in matches and i not in leader_of]
+        print(f"近重复索引: {len(matches)} 个URL复用已评分URL，{len(near_followers)} 个URL等待同簇首个URL的结果")
+
+    domain_cache = DomainCache.from_env(namespace)
+    followers = []
+    if domain_cache is not None:
+        urls = pd.Series(list(unique))
+        domain_of = dict(zip(urls, registered_domains(urls)))
+        shared = dict(zip(urls, shared_host_mask(urls)))
+        for url, rec in done.items():
+            reason = rec.get("reason")
+            if url in domain_of and not shared[url] and not is_failure(reason) and not is_reused(reason):
+                domain_cache.add(domain_of[url], rec["score"])
+        domain_cache.stats["urls"] = len(rows)
+        rows, followers = domain_cache.split(rows, [domain_of[row[1]] for row in rows],
+                                             [shared[row[1]] for row in rows])
+
+    metrics_file = output_file + ".metrics.jsonl"
+    if not done and os.path.exists(metrics_file):
+        os.remove(metrics_file)
+    provider.metrics = MetricsRecorder(metrics_file)
+    scorer = BatchScorer(provider, batch_size) if batch_size > 1 else None
+    batched_scores, failed = {}, []
+
+    async def score_batch(batch):
+        if scorer is None:
+            return [await provider.ascore(batch[0][1])]
+        return await scorer.ascore_many([row[1] for row in batch])
+
+    def on_result(batch, results):
+        if isinstance(results, Exception):
+            print(f"[WARN] 处理URL时出错，不计分: {[row[1] for row in batch]}\n  err={repr(results)}")
+            results = [(None, f"{ERROR_PREFIX} {repr(results)}")] * len(batch)
+        for (index, url, true_label), (score, reason) in zip(batch, results):
+            journal.append(url, score, reason)
+            if is_failure(reason):
+                failed.append(url)
+            else:
+                if domain_cache is not None and not shared[url]:
+                    domain_cache.add(domain_of[url], score)
+                if near_index is not None and url in sig_of:
+                    near_index.add([url], [score], sig_of[url][None, :])
+                    scored[url] = score
+                if scorer is not None:
+                    batched_scores[url] = score
+            pbar.update(1)
+
+            if verbose:
+                print(f"\n处理URL {index+1}/{total}: {url}")
+                print(f"真实标签: {true_label}")
+                print(f"{provider.name}推理: {score}")
+                print("-" * 60)
+
+    def resolve_followers():
+        """Answer lookalikes from their cluster leader and the remaining URLs of confident
+        domains from the domain cache; return the rest."""
+        remaining = []
+        for row in near_followers:
+            leader = dup_leader[row[1]]
+            if leader in scored:
+                journal.append(row[1], scored[leader], f"near duplicate of {leader}")
+                near_index.stats["cluster_hits"] += 1
+                pbar.update(1)
+            else:
+                remaining.append(row)
+        for row in followers:
+            score = domain_cache.lookup(domain_of[row[1]], shared[row[1]])
+            if score is None:
+                remaining.append(row)
+            else:
+                journal.append(row[1], score, f"domain cache: {domain_of[row[1]]}")
+                pbar.update(1)
+        return remaining
+
+    async def _main():
+        try:
+            for leaders in (True, False):
+                stage = rows if leaders else resolve_followers()
+                batches = [stage[i:i + batch_size] for i in range(0, len(stage), batch_size)]
+                await run_bounded(batches, score_batch, concurrency=concurrency, on_result=on_result)
+            if scorer is not None:
+                print(f"\n批量模式: {scorer.stats}")
+                if drift_sample > 0 and batched_scores:
+                    print_drift(await drift_report(provider, batched_scores, sample=drift_sample))
+        finally:
+            journal.close()
+            provider.metrics.close()
+            provider.metrics = None
+            await aclose_http_clients()
+
+    asyncio.run(_main())
+    pbar.close()
+
+    # ========= Save & Stats =========
+    result_dict = journal.compact(output_file, reasons_file, aliases)
+    journal.remove()
+    if domain_cache is not None:
+        domain_cache.save()
+        print_domain_summary(domain_cache.summary())
+    if near_index is not None:
+        near_index.save()
+        print_near_dup_summary(near_index.summary())
+    store_dir = os.environ.get("INFERENCE_RUN_STORE")
+    if store_dir:
+        run_id = RunStore(store_dir).import_results(output_file, reasons_file, metrics_file,
+                                                    provider=provider.name, model=provider.model,
+                                                    prompt_hash=provider.prompt_hash)
+        print(f"已写入运行存储: {store_dir} (run_id={run_id})")
+
+    print(f"\n完成！总共处理了 {len(result_dict)} 个URL")
+    if failed:
+        print(f"[WARN] {len(failed)} 个URL推理失败，未写入分数文件，见 {failures_file(output_file)}")
+    if result_dict:
+        print("\n" + "=" * 50)
+        print("统计信息:")
+        vals = list(result_dict.values())
+        print(f"总URL数: {len(result_dict)}")
+        print(f"平均概率: {sum(vals) / len(vals):.3f}")
+        print(f"最高概率: {max(vals):.3f}")
+        print(f"最低概率: {min(vals):.3f}")
+    records = load_metrics(metrics_file)
+    if records:
+        print_summary(summarize(records))
+    return result_dict
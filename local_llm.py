@@ -0,0 +1,246 @@
+"""
+Local CPU inference of open-weight GGUF models through llama.cpp's server.
+
+`LlamaServer` starts `llama-server` (from llama.cpp, $LLAMA_SERVER_BIN) as a
+child process with a thread count and N parallel slots; `LlamaCppProvider`
+speaks its OpenAI-compatible endpoint, so the shared runner, response cache,
+metrics and batch prompting work unchanged. No API key or network is needed.
+
+- continuous batching: the runner keeps `concurrency` requests in flight and
+  the server decodes every busy slot in one batch per step, admitting a new
+  prompt into a slot as soon as its previous one finishes (--parallel,
+  --cont-batching);
+- prompt-prefix KV reuse: every request sets `cache_prompt`, so a slot keeps
+  the KV cache of its last prompt and only evaluates the tokens after the
+  common prefix. The prompt templates end with the URL, so the instructions
+  and few-shot examples of PROMPT_TEMPLATE are evaluated once per slot rather
+  than once per URL; `prefix_stats` counts the prompt tokens served from cache;
+- per-request limits: `max_tokens` caps each completion, `--ctx-per-slot`
+  bounds prompt + completion of one request.
+
+ONNX Runtime is not wired in: its generate API has no prefix cache shared
+across requests.
+
+    python local_llm.py run models/Llama-3.2-3B-Instruct-Q4_K_M.gguf --threads 8 --parallel 4 --limit 100
+    python local_llm.py serve models/Llama-3.2-3B-Instruct-Q4_K_M.gguf --threads 8 --parallel 4 --port 8080
+"""
+
+import os
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+from typing import Optional
+
+import httpx
+
+import prompts
+from providers import OpenAIProvider
+from response_cache import ResponseCache
+
+DEFAULT_PARALLEL = 4
+DEFAULT_CTX_PER_SLOT = 2048
+STARTUP_TIMEOUT = 600.0  # seconds to load the model
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LlamaServer:
+    """`with LlamaServer("model.gguf", threads=8, parallel=4) as base_url: ...` runs llama-server.
+
+    port=0 picks a free port. The context manager returns once /health
+    reports the model loaded, and stops the server on exit. The server logs a
+    line per request, so its output goes to `log_file` (default: a temporary
+    file) rather than a pipe that nobody drains.
+    """
+
+    def __init__(self, model_path: str, threads: Optional[int] = None, parallel: int = DEFAULT_PARALLEL,
+                 ctx_per_slot: int = DEFAULT_CTX_PER_SLOT, host: str = "127.0.0.1", port: int = 0,
+                 binary: Optional[str] = None, extra_args: tuple = (), log_file: Optional[str] = None):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"找不到模型文件: {model_path}")
+        self.model_path = model_path
+        self.threads = threads or os.cpu_count() or 1
+        self.parallel = parallel
+        self.ctx_per_slot = ctx_per_slot
+        self.host = host
+        self.port = port or _free_port()
+        self.binary = binary or os.environ.get("LLAMA_SERVER_BIN", "llama-server")
+        self.extra_args = tuple(extra_args)
+        self.log_file = log_file
+        self.proc: Optional[subprocess.Popen] = None
+        self._log = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def command(self) -> list[str]:
+        # the KV cache is split evenly between the slots
+        return [self.binary, "--model", self.model_path, "--host", self.host, "--port", str(self.port),
+                "--threads", str(self.threads), "--threads-batch", str(self.threads),
+                "--parallel", str(self.parallel), "--ctx-size", str(self.ctx_per_slot * self.parallel),
+                "--cont-batching", *self.extra_args]
+
+    def log_tail(self, size: int = 800) -> str:
+        """Last `size` bytes of the server log."""
+        if self._log is None:
+            return ""
+        self._log.flush()
+        self._log.seek(max(0, os.fstat(self._log.fileno()).st_size - size))
+        return self._log.read().decode(errors="replace")
+
+    def start(self, timeout: float = STARTUP_TIMEOUT) -> str:
+        # 不能用PIPE：服务器每个请求都写日志，管道缓冲区满了就会阻塞整个推理
+        self._log = open(self.log_file, "w+b") if self.log_file else tempfile.TemporaryFile()
+        try:
+            self.proc = subprocess.Popen(self.command(), stdout=subprocess.DEVNULL, stderr=self._log)
+        except FileNotFoundError:
+            self._close_log()
+            raise FileNotFoundError(f"找不到 {self.binary}，请安装llama.cpp或设置 LLAMA_SERVER_BIN") from None
+        health = f"http://{self.host}:{self.port}/health"
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                tail = self.log_tail()
+                self.stop()
+                raise RuntimeError(f"llama-server 启动失败: {tail}")
+            try:
+                if httpx.get(health, timeout=1.0).status_code == 200:  # 503 while the model is loading
+                    return self.base_url
+            except httpx.TransportError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise TimeoutError(f"llama-server 在 {timeout:.0f}s 内没有就绪")
+
+    def stop(self):
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+        self.proc = None
+        self._close_log()
+
+    def _close_log(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def __enter__(self) -> str:
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class LlamaCppProvider(OpenAIProvider):
+    """llama.cpp server in OpenAI chat-completions format, with prompt-prefix KV cache reuse."""
+
+    name = "llamacpp"
+    api_key_env = "LLAMACPP_API_KEY"
+    default_base_url = os.environ.get("LLAMACPP_BASE_URL", "http://127.0.0.1:8080/v1")
+
+    def __init__(self, model: str, **kwargs):
+        # llama-server only checks a key when started with --api-key
+        kwargs.setdefault("api_key", os.environ.get(self.api_key_env) or "local")
+        super().__init__(model, **kwargs)
+        self.prefix_stats = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0}
+
+    def build_request(self, prompt, stream=False):
+        endpoint, headers, body = super().build_request(prompt, stream)
+        body["cache_prompt"] = True
+        return endpoint, headers, body
+
+    def extract_usage(self, data):
+        usage = super().extract_usage(data)
+        timings = data.get("timings")
+        if usage is not None and timings:
+            # prompt_n = prompt tokens actually evaluated; newer servers also report cache_n
+            cached = timings.get("cache_n", usage[0] - timings.get("prompt_n", usage[0]))
+            self.prefix_stats["requests"] += 1
+            self.prefix_stats["prompt_tokens"] += usage[0]
+            self.prefix_stats["cached_tokens"] += max(0, cached)
+        return usage
+
+    @property
+    def prefix_hit_rate(self) -> Optional[float]:
+        total = self.prefix_stats["prompt_tokens"]
+        return self.prefix_stats["cached_tokens"] / total if total else None
+
+
+def build_provider(model: str, base_url: Optional[str] = None, prompt: str = "full",
+                   max_tokens: int = 256, **kwargs) -> LlamaCppProvider:
+    """Provider with the full few-shot prompt (JSON score) or the simple numeric one."""
+    if prompt == "simple":
+        kwargs.update(prompt_template=prompts.SIMPLE_PROMPT_TEMPLATE, parser=prompts.parse_probability)
+    else:
+        kwargs.update(prompt_template=prompts.PROMPT_TEMPLATE, system_msg=prompts.SYSTEM_MSG,
+                      parser=prompts.parse_score_and_reason)
+    return LlamaCppProvider(model, base_url=base_url, max_tokens=max_tokens, **kwargs)
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Score URLs with a local GGUF model via llama.cpp")
+    parser.add_argument("command", choices=["run", "serve"])
+    parser.add_argument("model", help="GGUF model file")
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("LLAMACPP_THREADS", "0")) or None,
+                        help="CPU threads (default: all cores)")
+    parser.add_argument("--parallel", type=int, default=int(os.environ.get("LLAMACPP_PARALLEL", DEFAULT_PARALLEL)),
+                        help="server slots decoded together (continuous batching)")
+    parser.add_argument("--ctx-per-slot", type=int, default=DEFAULT_CTX_PER_SLOT)
+    parser.add_argument("--port", type=int, default=0, help="serve: default 8080; run: a free port")
+    parser.add_argument("--base-url", default=None, help="run: use an already running server instead of starting one")
+    parser.add_argument("--data", default="./sampled_data_2000_balanced.csv")
+    parser.add_argument("--out", default="llamacpp_url_classification_results.json")
+    parser.add_argument("--reasons", default=None)
+    parser.add_argument("--limit", type=int, default=int(os.environ.get("INFERENCE_LIMIT", "0")))
+    parser.add_argument("--prompt", choices=["full", "simple"], default="full",
+                        help="full: few-shot PROMPT_TEMPLATE (long shared prefix); simple: SIMPLE_PROMPT_TEMPLATE")
+    parser.add_argument("--max-tokens", type=int, default=256, help="completion token limit per request")
+    parser.add_argument("--concurrency", type=int, default=None, help="in-flight requests (default: 2 x parallel)")
+    args = parser.parse_args(argv)
+
+    try:
+        server = LlamaServer(args.model, args.threads, args.parallel, args.ctx_per_slot,
+                             port=args.port or (8080 if args.command == "serve" else 0),
+                             log_file=f"{args.out}.llama-server.log")
+    except FileNotFoundError as e:
+        print(f"错误: {e}")
+        return 1
+    if args.command == "serve":
+        print(f"启动: {' '.join(server.command())}")
+        return subprocess.call(server.command())
+
+    from inference_runner import run_inference
+    model_name = os.path.splitext(os.path.basename(args.model))[0]
+    concurrency = args.concurrency or 2 * args.parallel  # keep every slot busy while responses are parsed
+    try:
+        if args.base_url:
+            base_url = args.base_url
+        else:
+            print(f"启动llama-server: {args.threads or server.threads} 线程，{args.parallel} 个并行槽位")
+            base_url = server.start()
+        provider = build_provider(model_name, base_url, args.prompt, args.max_tokens, cache=ResponseCache.from_env())
+        run_inference(provider, args.data, args.out, args.reasons, limit=args.limit, concurrency=concurrency)
+    except (FileNotFoundError, RuntimeError, TimeoutError) as e:
+        print(f"错误: {e}")
+        return 1
+    finally:
+        server.stop()
+    if provider.prefix_hit_rate is not None:
+        print(f"提示词前缀KV缓存命中: {provider.prefix_hit_rate:.1%}（{provider.prefix_stats}）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,478 @@
+"""
+Local stand-in for the LLM APIs, for load tests and offline runs.
+
+Speaks the wire formats of every provider adapter under one port, routed by
+the first path segment:
+
+    /openai/chat/completions, /xai/chat/completions   OpenAI chat completions (+ SSE streaming)
+    /llama/chat/completions                           Llama API completion_message format
+    /llamacpp/chat/completions                        llama.cpp server (OpenAI format + prefix-cache `timings`)
+    /gemini/models/<model>:generateContent            Gemini (+ :streamGenerateContent?alt=sse)
+    /openai/files, /openai/batches                    OpenAI batch API (jobs finish on the second poll)
+    /openai/models, /stats, /health                   model list; request/fault counters; liveness
+
+Point every inference path at it with one switch, `LLM_BASE_URL` (providers
+then use `$LLM_BASE_URL/<provider name>`, see providers.py); scripts that use
+the OpenAI SDK directly honor `OPENAI_BASE_URL=http://127.0.0.1:8700/openai`.
+
+Answers follow the prompt: reasoning plus a final `{"score": x}` line for
+PROMPT_TEMPLATE, a bare number for SIMPLE_PROMPT_TEMPLATE, a `{"results": [...]}`
+object for BATCH_PROMPT_TEMPLATE. Scores are a hash of the seed and the URL,
+so the same URL always gets the same score. Latency is drawn from a
+configurable distribution or replayed from a recorded metrics.jsonl
+(spread across the chunks when streaming), and
+429s (random, or from an RPM token bucket with Retry-After and
+x-ratelimit-* headers), transient 5xx errors and truncated outputs
+(finish reason length / MAX_TOKENS) are injected at the given rates.
+
+    python mock_llm_server.py --latency lognormal:0.4,0.6 --rate-limit 0.05 --error-rate 0.02 --truncate-rate 0.01
+    LLM_BASE_URL=http://127.0.0.1:8700 OPENAI_API_KEY=x INFERENCE_LIMIT=0 python inference_100.py
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional
+from urllib.parse import urlsplit
+
+DEFAULT_PORT = 8700
+_URL_LINE = re.compile(r'^\s*URL: (.*)$', re.M)
+_NUMBERED = re.compile(r'^\d+\.\s+')  # "3. example.com" lines of BATCH_PROMPT_TEMPLATE
+_MODEL_PATH = re.compile(r'^/gemini/models/([^/:]+):(generateContent|streamGenerateContent)$')
+_REASONING = ("Looking at the host, the path and the query string of this URL. "
+              "The domain, TLD and path structure are compared with the usual signals.")
+
+
+# ========= Configuration =========
+def load_latency_profile(path: str) -> list[float]:
+    """Recorded latencies: `latency_s` of the successful, uncached calls in a
+    metrics.jsonl file (see call_metrics.py), or a JSON list of seconds."""
+    if path.endswith(".jsonl"):
+        from call_metrics import load_metrics
+        values = [r["latency_s"] for r in load_metrics(path)
+                  if not r.get("cached") and not r.get("error") and r.get("latency_s") is not None]
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            values = [float(v) for v in json.load(f)]
+    if not values:
+        raise ValueError(f"{path} 中没有可用的延迟记录")
+    return values
+
+
+def parse_latency(spec: str):
+    """"fixed:0.2", "uniform:0.1,0.6", "normal:0.4,0.1", "lognormal:<median>,<sigma>", "exp:<mean>"
+    or "empirical:<metrics.jsonl | latencies.json>" -> function(rng) returning seconds (never negative)."""
+    kind, _, args = spec.partition(":")
+    if kind == "empirical":
+        values = load_latency_profile(args)
+        return lambda rng: rng.choice(values)
+    params = [float(v) for v in args.split(",") if v]
+    draw = {
+        "fixed": lambda rng: params[0],
+        "uniform": lambda rng: rng.uniform(params[0], params[1]),
+        "normal": lambda rng: rng.gauss(params[0], params[1]),
+        "lognormal": lambda rng: params[0] * rng.lognormvariate(0.0, params[1]),
+        "exp": lambda rng: rng.expovariate(1.0 / params[0]),
+    }.get(kind)
+    if draw is None:
+        raise ValueError(f"未知的延迟分布 {spec!r}; 可选 fixed/uniform/normal/lognormal/exp")
+    return lambda rng: max(0.0, draw(rng))
+
+
+class MockConfig:
+    def __init__(self, latency: str = "fixed:0", rate_limit: float = 0.0, rpm: int = 0,
+                 error_rate: float = 0.0, truncate_rate: float = 0.0, seed: int = 0,
+                 retry_after: float = 1.0):
+        self.latency_spec = latency
+        self.latency = parse_latency(latency)
+        self.rate_limit = rate_limit
+        self.rpm = rpm
+        self.error_rate = error_rate
+        self.truncate_rate = truncate_rate
+        self.seed = seed
+        self.retry_after = retry_after
+
+    @classmethod
+    def from_env(cls) -> "MockConfig":
+        env = os.environ.get
+        return cls(latency=env("MOCK_LATENCY", "fixed:0"), rate_limit=float(env("MOCK_RATE_LIMIT", "0")),
+                   rpm=int(env("MOCK_RPM", "0")), error_rate=float(env("MOCK_ERROR_RATE", "0")),
+                   truncate_rate=float(env("MOCK_TRUNCATE_RATE", "0")), seed=int(env("MOCK_SEED", "0")))
+
+
+def url_score(url: str, seed: int = 0) -> float:
+    """Deterministic score in [0, 1] for a URL."""
+    digest = hashlib.sha256(f"{seed}:{url}".encode("utf-8")).digest()
+    return round(int.from_bytes(digest[:4], "big") / 0xFFFFFFFF, 2)
+
+
+def answer(prompt: str, seed: int = 0) -> str:
+    """The completion a well-behaved model would give for one of our prompts."""
+    if "\nURLs:\n" in prompt:
+        block = prompt.split("\nURLs:\n", 1)[1].split("\nReturn:", 1)[0]
+        urls = [_NUMBERED.sub("", line.strip()) for line in block.splitlines() if line.strip()]
+        return json.dumps({"results": [{"url": u, "score": url_score(u, seed)} for u in urls]})
+    urls = _URL_LINE.findall(prompt)
+    if not urls:
+        return "API working"
+    score = url_score(urls[-1].strip(), seed)
+    if '"score"' in prompt:
+        return f"{_REASONING}\n{{\"score\": {score}}}"
+    return f"{score}"
+
+
+def truncate(text: str) -> str:
+    """What a model cut off by max_tokens returns: the start, without the answer."""
+    return text[:max(1, len(text) * 2 // 3)] if len(text) > 8 else ""
+
+
+# ========= Server state =========
+class MockState:
+    """Fault injection, RPM bucket, batch jobs and counters, shared by all handler threads."""
+
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "ok": 0, "rate_limited": 0, "errors": 0, "truncated": 0, "streamed": 0}
+        self.files = {}
+        self.batches = {}
+        self._tokens = float(config.rpm)
+        self._refill = time.monotonic()
+        self._last_prompt = ""
+
+    def count(self, key: str, n: int = 1):
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + n
+
+    def draw(self):
+        """(fault, seconds): fault is None, "429", "5xx" or "truncate"; seconds is the
+        response latency, or the Retry-After for a 429."""
+        cfg = self.config
+        with self.lock:
+            self.stats["requests"] += 1
+            if cfg.rpm:
+                now = time.monotonic()
+                self._tokens = min(cfg.rpm, self._tokens + (now - self._refill) * cfg.rpm / 60.0)
+                self._refill = now
+                if self._tokens < 1:
+                    return "429", (1 - self._tokens) * 60.0 / cfg.rpm  # until the next token
+                self._tokens -= 1
+            roll = self.rng.random()
+            latency = cfg.latency(self.rng)
+        if roll < cfg.rate_limit:
+            return "429", cfg.retry_after
+        if roll < cfg.rate_limit + cfg.error_rate:
+            return "5xx", latency
+        if roll < cfg.rate_limit + cfg.error_rate + cfg.truncate_rate:
+            return "truncate", latency
+        return None, latency
+
+    def prefix_timings(self, prompt: str, usage) -> dict:
+        """llama.cpp-style timings for a single-slot prompt cache: the prefix shared
+        with the previous prompt counts as cached."""
+        with self.lock:
+            cached = min(len(os.path.commonprefix([self._last_prompt, prompt])) // 4, usage[0])
+            self._last_prompt = prompt
+        return {"cache_n": cached, "prompt_n": usage[0] - cached, "predicted_n": usage[1]}
+
+    def rate_headers(self) -> dict:
+        cfg = self.config
+        if not cfg.rpm:
+            return {}
+        with self.lock:
+            remaining = int(self._tokens)
+        return {"x-ratelimit-limit-requests": str(cfg.rpm), "x-ratelimit-remaining-requests": str(remaining),
+                "x-ratelimit-reset-requests": f"{60.0 / cfg.rpm:.3f}s"}
+
+
+# ========= Wire formats =========
+def _usage(prompt: str, text: str) -> tuple[int, int]:
+    return max(1, len(prompt) // 4), max(1, len(text) // 4)
+
+
+def openai_body(model: str, text: str, finish: str, usage) -> dict:
+    return {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion", "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": finish}],
+            "usage": {"prompt_tokens": usage[0], "completion_tokens": usage[1], "total_tokens": sum(usage)}}
+
+
+def openai_chunks(model: str, pieces: list[str], finish: str, usage, include_usage: bool) -> list[dict]:
+    base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion.chunk",
+            "created": int(time.time()), "model": model}
+    chunks = [{**base, "choices": [{"index": 0, "delta": {"content": p}, "finish_reason": None}]} for p in pieces]
+    chunks.append({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": finish}]})
+    if include_usage:
+        chunks.append({**base, "choices": [], "usage": {"prompt_tokens": usage[0], "completion_tokens": usage[1],
+                                                        "total_tokens": sum(usage)}})
+    return chunks
+
+
+def llama_body(model: str, text: str, finish: str, usage) -> dict:
+    return {"id": uuid.uuid4().hex[:12], "model": model,
+            "completion_message": {"role": "assistant", "content": {"type": "text", "text": text},
+                                   "stop_reason": finish},
+            "metrics": [{"metric": "num_prompt_tokens", "value": usage[0]},
+                        {"metric": "num_completion_tokens", "value": usage[1]},
+                        {"metric": "num_total_tokens", "value": sum(usage)}]}
+
+
+def gemini_body(text: str, finish: Optional[str], usage) -> dict:
+    body = {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}]}
+    if finish:
+        body["candidates"][0]["finishReason"] = finish
+        body["usageMetadata"] = {"promptTokenCount": usage[0], "candidatesTokenCount": usage[1],
+                                 "totalTokenCount": sum(usage)}
+    return body
+
+
+def split_pieces(text: str, n: int = 8) -> list[str]:
+    """Text as ~n streamed deltas, split on word boundaries."""
+    words = re.findall(r'\S+\s*|\s+', text) or [""]
+    step = max(1, -(-len(words) // n))
+    return ["".join(words[i:i + step]) for i in range(0, len(words), step)]
+
+
+# ========= HTTP handler =========
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockLLM/1.0"
+    state: MockState = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, payload, headers: Optional[dict] = None):
+        data = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status: int, message: str, headers: Optional[dict] = None):
+        self._send_json(status, {"error": {"message": message, "type": "mock_error", "code": status}}, headers)
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("content-length") or 0))
+
+    def _stream(self, events: list[dict], latency: float, done: bool):
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("transfer-encoding", "chunked")
+        for key, value in self.state.rate_headers().items():
+            self.send_header(key, value)
+        self.end_headers()
+        frames = [f"data: {json.dumps(e)}\n\n".encode("utf-8") for e in events]
+        if done:
+            frames.append(b"data: [DONE]\n\n")
+        gap = latency / max(len(frames), 1)
+        try:
+            for frame in frames:
+                time.sleep(gap)
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(frame), frame))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # client stopped reading early (final score already seen)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/health":
+            return self._send_json(200, {"status": "ok"})
+        if path == "/stats":
+            config = {k: v for k, v in vars(self.state.config).items() if k != "latency"}
+            with self.state.lock:
+                stats = dict(self.state.stats)
+            return self._send_json(200, {**stats, "config": config})
+        if path.endswith("/models"):
+            return self._send_json(200, {"object": "list", "data": [
+                {"id": m, "object": "model", "owned_by": "mock"} for m in ("gpt-4o-mini", "gpt-4o", "grok-4-latest")]})
+        m = re.match(r'^/(openai|xai)/batches/([^/]+)$', path)
+        if m:
+            job = self.state.batches.get(m.group(2))
+            if job is None:
+                return self._error(404, "no such batch")
+            job["polls"] += 1
+            status = "completed" if job["polls"] > 1 else "in_progress"
+            return self._send_json(200, {"id": job["id"], "object": "batch", "status": status,
+                                         "output_file_id": job["output_file_id"] if status == "completed" else None})
+        m = re.match(r'^/(openai|xai)/files/([^/]+)/content$', path)
+        if m and m.group(2) in self.state.files:
+            return self._send_json(200, self.state.files[m.group(2)])
+        self._error(404, f"unknown path {path}")
+
+    def do_POST(self):
+        parts = urlsplit(self.path)
+        path = parts.path
+        if re.match(r'^/(openai|xai)/files$', path):
+            return self._upload()
+        if re.match(r'^/(openai|xai)/batches$', path):
+            return self._create_batch(json.loads(self._read_body()))
+        body = json.loads(self._read_body() or b"{}")
+        m = _MODEL_PATH.match(path)
+        if m:
+            return self._complete("gemini", m.group(1), body, stream=m.group(2) == "streamGenerateContent")
+        m = re.match(r'^/(openai|xai|llama|llamacpp)/chat/completions$', path)
+        if m:
+            return self._complete(m.group(1), body.get("model", "mock"), body, stream=bool(body.get("stream")))
+        self._error(404, f"unknown path {path}")
+
+    def _complete(self, fmt: str, model: str, body: dict, stream: bool):
+        fault, latency = self.state.draw()
+        if fault == "429":
+            self.state.count("rate_limited")
+            return self._error(429, "Rate limit reached (mock)",
+                               {"retry-after": f"{latency:.3f}", **self.state.rate_headers()})
+        if fault == "5xx":
+            time.sleep(latency)
+            self.state.count("errors")
+            return self._error(self.state.rng.choice([500, 502, 503]), "Transient upstream error (mock)")
+
+        if fmt == "gemini":
+            prompt = "".join(p.get("text", "") for c in body.get("contents", []) for p in c.get("parts", []))
+        else:
+            prompt = (body.get("messages") or [{}])[-1].get("content", "")
+        text = answer(prompt, self.state.config.seed)
+        finish = {"gemini": "STOP"}.get(fmt, "stop")
+        if fault == "truncate":
+            text = truncate(text)
+            finish = {"gemini": "MAX_TOKENS"}.get(fmt, "length")
+            self.state.count("truncated")
+        usage = _usage(prompt, text)
+        self.state.count("ok")
+
+        if stream and fmt in ("openai", "xai", "llamacpp"):
+            self.state.count("streamed")
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            return self._stream(openai_chunks(model, split_pieces(text), finish, usage, include_usage), latency, done=True)
+        if stream and fmt == "gemini":
+            self.state.count("streamed")
+            pieces = split_pieces(text)
+            events = [gemini_body(p, finish if i == len(pieces) - 1 else None, usage) for i, p in enumerate(pieces)]
+            return self._stream(events, latency, done=False)
+        time.sleep(latency)
+        if fmt == "llama":
+            return self._send_json(200, llama_body(model, text, finish, usage), self.state.rate_headers())
+        if fmt == "gemini":
+            return self._send_json(200, gemini_body(text, finish, usage), self.state.rate_headers())
+        body = openai_body(model, text, finish, usage)
+        if fmt == "llamacpp":
+            body["timings"] = self.state.prefix_timings(prompt, usage)
+        return self._send_json(200, body, self.state.rate_headers())
+
+    # --- batch API ---
+    def _upload(self):
+        raw = self._read_body()
+        message = BytesParser(policy=HTTP).parsebytes(
+            b"content-type: " + self.headers["content-type"].encode() + b"\r\n\r\n" + raw)
+        content = next((part.get_payload(decode=True) for part in message.iter_parts()
+                        if part.get_param("name", header="content-disposition") == "file"), b"")
+        file_id = f"file-{uuid.uuid4().hex[:12]}"
+        self.state.files[file_id] = content
+        self._send_json(200, {"id": file_id, "object": "file", "bytes": len(content), "purpose": "batch"})
+
+    def _create_batch(self, request: dict):
+        lines = []
+        for line in self.state.files.get(request.get("input_file_id"), b"").decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            req = json.loads(line)
+            prompt = req["body"]["messages"][-1]["content"]
+            text = answer(prompt, self.state.config.seed)
+            lines.append(json.dumps({"id": f"batch_req_{uuid.uuid4().hex[:8]}", "custom_id": req["custom_id"],
+                                     "response": {"status_code": 200,
+                                                  "body": openai_body(req["body"].get("model", "mock"), text, "stop",
+                                                                      _usage(prompt, text))},
+                                     "error": None}))
+        output_id = f"file-{uuid.uuid4().hex[:12]}"
+        self.state.files[output_id] = ("\n".join(lines) + "\n").encode("utf-8")
+        job_id = f"batch_{uuid.uuid4().hex[:12]}"
+        self.state.batches[job_id] = {"id": job_id, "output_file_id": output_id, "polls": 0}
+        self._send_json(200, {"id": job_id, "object": "batch", "status": "validating",
+                              "input_file_id": request.get("input_file_id")})
+
+
+# ========= Entry points =========
+def make_server(config: MockConfig, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    handler = type("BoundMockHandler", (MockHandler,), {"state": MockState(config)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+class MockServer:
+    """Run the mock in a background thread: `with MockServer(config) as base_url: ...`.
+
+    port=0 picks a free port. For load tests prefer a separate process
+    (`python mock_llm_server.py`) so the server does not share the client's GIL.
+    """
+
+    def __init__(self, config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.server = make_server(config or MockConfig(), host, port)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> str:
+        self.thread.start()
+        return self.base_url
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main(argv: Optional[list[str]] = None):
+    env = MockConfig.from_env()
+    parser = argparse.ArgumentParser(description="Local mock of the OpenAI / xAI / Llama / Gemini APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", default=env.latency_spec,
+                        help="fixed:S | uniform:A,B | normal:MU,SD | lognormal:MEDIAN,SIGMA | exp:MEAN (seconds)"
+                             " | empirical:<metrics.jsonl> (recorded latencies)")
+    parser.add_argument("--rate-limit", type=float, default=env.rate_limit, help="share of requests answered with 429")
+    parser.add_argument("--rpm", type=int, default=env.rpm, help="requests/minute token bucket (0 = unlimited)")
+    parser.add_argument("--retry-after", type=float, default=env.retry_after, help="Retry-After seconds on 429")
+    parser.add_argument("--error-rate", type=float, default=env.error_rate, help="share of transient 500/502/503")
+    parser.add_argument("--truncate-rate", type=float, default=env.truncate_rate, help="share of max-token truncations")
+    parser.add_argument("--seed", type=int, default=env.seed, help="seed of the scores and the fault draws")
+    args = parser.parse_args(argv)
+
+    try:
+        config = MockConfig(args.latency, args.rate_limit, args.rpm, args.error_rate, args.truncate_rate,
+                            args.seed, args.retry_after)
+    except (ValueError, IndexError, OSError) as e:
+        print(f"错误: {e}")
+        return 1
+    server = make_server(config, args.host, args.port)
+    print(f"Mock LLM服务器: http://{args.host}:{args.port}  (LLM_BASE_URL=http://{args.host}:{args.port})")
+    print(f"延迟 {args.latency}  429 {args.rate_limit:.0%}  RPM {args.rpm or '-'}  5xx {args.error_rate:.0%}"
+          f"  截断 {args.truncate_rate:.0%}  种子 {args.seed}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,259 @@
+"""
+Near-duplicate URL index: reuse the score of a lookalike URL that was
+already scored.
+
+Phishing kits emit floods of URLs that differ only in a random subdomain,
+token or session parameter (`fr57f6yg.gb.net/boa/login.php?...`). Every URL
+is reduced to its byte 5-gram shingles (hashed with
+`ngram_model.hash_ngrams`, after lower-casing, dropping scheme / `www.` and
+folding digit runs, so session ids and counters do not count as differences)
+and a MinHash signature (64 multiply-shift hashes, computed for a whole
+batch of URLs at once with NumPy). Signatures are split into 8 bands of 8
+rows for LSH buckets, so a lookup only compares against URLs sharing a band
+and costs microseconds regardless of index size; the candidate with the
+highest estimated Jaccard similarity is returned if it reaches the threshold
+(default 0.8).
+
+The index takes incremental inserts and is saved as one `.npz` (signatures,
+scores, URLs; buckets are rebuilt on load), keyed by provider / model /
+prompt so scores are only reused for the same model. In inference_runner.py
+($INFERENCE_NEAR_DUP=1) a URL close to an indexed one takes its score; the
+rest are clustered, one leader per cluster is scored first and its
+lookalikes reuse the leader's score afterwards. Only URLs that were actually
+scored are inserted, so a campaign adds a few leaders, not thousands of
+near-identical entries.
+
+    python near_dup.py sampled_data_2000_balanced.csv --results gemini_url_classification_results.json
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from typing import Optional
+
+import numpy as np
+
+DEFAULT_INDEX_PATH = "near_dup_index.npz"
+DEFAULT_THRESHOLD = 0.8
+NUM_PERM = 64
+BANDS = 8
+SHINGLE = 5
+SIGN_CHUNK_ROWS = 4096
+_EMPTY = np.uint32(0xFFFFFFFF)
+_DIGITS = re.compile(r"\d+")
+
+
+class NearDupIndex:
+    """MinHash + LSH index of scored URLs; `query()` returns (item id, similarity) of the best match."""
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, num_perm: int = NUM_PERM, bands: int = BANDS,
+                 shingle: int = SHINGLE, seed: int = 1, path: Optional[str] = None, namespace: str = "default"):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) 必须是 bands ({bands}) 的整数倍")
+        self.threshold = threshold
+        self.num_perm, self.bands, self.shingle, self.seed = num_perm, bands, shingle, seed
+        self.path, self.namespace = path, namespace
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+        self._band_mult = rng.integers(1, 2 ** 63, num_perm // bands, dtype=np.uint64) | np.uint64(1)
+        self.urls: list[str] = []
+        self.scores: list[float] = []
+        self._sigs = np.empty((0, num_perm), dtype=np.uint32)
+        self._buckets = [{} for _ in range(bands)]
+        self.stats = {"urls": 0, "index_hits": 0, "cluster_hits": 0, "leaders": 0}
+        if path and os.path.exists(path):
+            self._load(path)
+
+    @classmethod
+    def from_env(cls, namespace: str = "default") -> Optional["NearDupIndex"]:
+        """Index configured by $INFERENCE_NEAR_DUP=1, $NEAR_DUP_THRESHOLD and $NEAR_DUP_INDEX
+        ("off" = in memory only); None when disabled."""
+        if os.environ.get("INFERENCE_NEAR_DUP", "") not in ("1", "true", "yes"):
+            return None
+        path = os.environ.get("NEAR_DUP_INDEX", DEFAULT_INDEX_PATH)
+        return cls(float(os.environ.get("NEAR_DUP_THRESHOLD", DEFAULT_THRESHOLD)),
+                   path=None if path == "off" else path, namespace=namespace)
+
+    def __len__(self):
+        return len(self.urls)
+
+    # ----- signatures -----
+    def signatures(self, urls) -> np.ndarray:
+        """(len(urls), num_perm) MinHash signatures; URLs shorter than one shingle get an empty signature."""
+        from ngram_model import hash_ngrams
+        urls = [_DIGITS.sub("0", url) for url in urls]
+        out = np.full((len(urls), self.num_perm), _EMPTY, dtype=np.uint32)
+        for start in range(0, len(urls), SIGN_CHUNK_ROWS):
+            X = hash_ngrams(urls[start:start + SIGN_CHUNK_ROWS], 2 ** 31 - 1, (self.shingle, self.shingle))
+            rows = np.flatnonzero(np.diff(X.indptr))
+            if not len(rows):
+                continue
+            x = X.indices.astype(np.uint64)
+            # multiply-shift hash per permutation, then the minimum over each URL's shingles
+            hashed = ((self._a[:, None] * x[None, :] + self._b[:, None]) >> np.uint64(32)).astype(np.uint32)
+            out[start + rows] = np.minimum.reduceat(hashed, X.indptr[rows], axis=1).T
+        return out
+
+    def _band_keys(self, sigs: np.ndarray) -> np.ndarray:
+        bands = sigs.reshape(len(sigs), self.bands, -1).astype(np.uint64)
+        return (bands * self._band_mult).sum(axis=2)  # wraps mod 2**64
+
+    # ----- index -----
+    def add(self, urls, scores, sigs: Optional[np.ndarray] = None, keys: Optional[np.ndarray] = None):
+        urls = list(urls)
+        sigs = self.signatures(urls) if sigs is None else np.asarray(sigs, dtype=np.uint32).reshape(len(urls), -1)
+        first = len(self.urls)
+        if first + len(urls) > len(self._sigs):  # grow the signature buffer geometrically
+            grown = np.empty((max(2 * len(self._sigs), first + len(urls), 1024), self.num_perm), dtype=np.uint32)
+            grown[:first] = self._sigs[:first]
+            self._sigs = grown
+        self._sigs[first:first + len(urls)] = sigs
+        self.urls += urls
+        self.scores += [float(s) for s in scores]
+        self._insert(first, sigs, keys)
+
+    def _insert(self, first: int, sigs: np.ndarray, keys: Optional[np.ndarray] = None):
+        keys = self._band_keys(sigs) if keys is None else np.asarray(keys).reshape(len(sigs), -1)
+        for offset, (sig, row) in enumerate(zip(sigs, keys.tolist())):
+            if sig[0] == _EMPTY:
+                continue
+            for bucket, key in zip(self._buckets, row):
+                bucket.setdefault(key, []).append(first + offset)
+
+    def query(self, sig: np.ndarray, keys: Optional[np.ndarray] = None) -> Optional[tuple[int, float]]:
+        """Best indexed match of one signature at or above the threshold, else None
+        (`keys` = its precomputed band keys)."""
+        if sig[0] == _EMPTY or not self.urls:
+            return None
+        keys = self._band_keys(sig[None, :])[0] if keys is None else keys
+        candidates = set()
+        for bucket, key in zip(self._buckets, keys.tolist()):
+            candidates.update(bucket.get(key, ()))
+        if not candidates:
+            return None
+        ids = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        similarity = (self._sigs[ids] == sig).mean(axis=1)
+        best = int(similarity.argmax())
+        if similarity[best] < self.threshold:
+            return None
+        return int(ids[best]), float(similarity[best])
+
+    def plan(self, urls: list[str]) -> tuple[dict, dict, np.ndarray]:
+        """Split URLs about to be scored into (matches, followers, signatures):
+        matches maps position -> (item id, similarity) for URLs close to an indexed URL,
+        followers maps position -> leader position for lookalikes of an earlier unscored URL."""
+        sigs = self.signatures(urls)
+        keys = self._band_keys(sigs)
+        pending = NearDupIndex(self.threshold, self.num_perm, self.bands, self.shingle, self.seed)
+        matches, followers, leaders = {}, {}, []
+        for i, (sig, key) in enumerate(zip(sigs, keys)):
+            hit = self.query(sig, key)
+            if hit is not None:
+                matches[i] = hit
+                continue
+            lead = pending.query(sig, key)
+            if lead is not None:
+                followers[i] = leaders[lead[0]]
+            else:
+                pending.add([urls[i]], [0.0], sig[None, :], key[None, :])
+                leaders.append(i)
+        self.stats["urls"] += len(urls)
+        self.stats["leaders"] += len(leaders)
+        return matches, followers, sigs
+
+    def summary(self) -> dict:
+        urls = self.stats["urls"]
+        reused = self.stats["index_hits"] + self.stats["cluster_hits"]
+        return {**self.stats, "indexed": len(self), "threshold": self.threshold,
+                "hit_rate": reused / urls if urls else 0.0}
+
+    # ----- persistence -----
+    def _meta(self) -> dict:
+        return {"namespace": self.namespace, "num_perm": self.num_perm, "bands": self.bands,
+                "shingle": self.shingle, "seed": self.seed}
+
+    def save(self, path: Optional[str] = None):
+        path = path or self.path
+        if not path:
+            return
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, sigs=self._sigs[:len(self.urls)], scores=np.asarray(self.scores, dtype=np.float64),
+                 urls=np.asarray(self.urls, dtype=object).astype(str), meta=np.array(json.dumps(self._meta())))
+        os.replace(tmp, path)
+
+    def _load(self, path: str):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta != self._meta():
+                print(f"[WARN] {path} 属于其他模型或参数（{meta.get('namespace')}），不复用其中的分数")
+                return
+            sigs, scores, urls = data["sigs"], data["scores"], data["urls"]
+        self.urls, self.scores, self._sigs = urls.tolist(), scores.tolist(), sigs
+        self._insert(0, sigs)
+
+
+def print_near_dup_summary(summary: dict):
+    print(f"近重复索引: {summary['urls']} 个URL，复用已评分URL {summary['index_hits']} 个、"
+          f"同批次相似URL {summary['cluster_hits']} 个（命中率 {summary['hit_rate']:.1%}，"
+          f"阈值 {summary['threshold']}），索引共 {summary['indexed']} 个URL")
+
+
+# ========= Offline replay =========
+def replay(urls: list[str], scores: np.ndarray, index: NearDupIndex) -> tuple[np.ndarray, list]:
+    """Stream scored URLs through the index in order; returns the scores the pipeline would have used
+    and the (url, matched url, similarity) pairs."""
+    sigs = index.signatures(urls)
+    keys = index._band_keys(sigs)
+    out = np.array(scores, dtype=float)
+    pairs = []
+    for i, (sig, key) in enumerate(zip(sigs, keys)):
+        hit = index.query(sig, key)
+        if hit is None:
+            index.add([urls[i]], [scores[i]], sig[None, :], key[None, :])
+        else:
+            out[i] = index.scores[hit[0]]
+            index.stats["index_hits"] += 1
+            pairs.append((urls[i], index.urls[hit[0]], hit[1]))
+    index.stats["urls"] += len(urls)
+    return out, pairs
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Near-duplicate URL reuse report (MinHash/LSH)")
+    parser.add_argument("data_file", help="CSV with url (and type) columns")
+    parser.add_argument("--results", required=True, help="{url: score} JSON to replay")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--examples", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    from evaluation import load_labels, binary_metrics
+    from url_canon import match_scores
+    with open(args.results, 'r', encoding='utf-8') as f:
+        predictions = json.load(f)
+    labels = load_labels(args.data_file)
+    scores = match_scores(labels["url"], predictions).to_numpy(dtype=float)
+    scored = ~np.isnan(scores)
+    labels, scores = labels[scored].reset_index(drop=True), scores[scored]
+
+    index = NearDupIndex(args.threshold)
+    start = time.perf_counter()
+    replayed, pairs = replay(labels["url"].astype(str).tolist(), scores, index)
+    elapsed = time.perf_counter() - start
+    print_near_dup_summary(index.summary())
+    print(f"用时 {elapsed:.2f}s（{len(scores) / max(elapsed, 1e-9):,.0f} URL/s）")
+    if len(np.unique(labels["label"])) == 2:
+        y = labels["label"].to_numpy()
+        before, after = binary_metrics(y, scores), binary_metrics(y, replayed)
+        print(f"AUROC {before['auroc']:.3f} -> {after['auroc']:.3f}  F1 {before['f1']:.3f} -> {after['f1']:.3f}"
+              f"  复用分数与原分数的平均绝对差 {np.abs(replayed - scores).mean():.4f}")
+    for url, match, similarity in sorted(pairs, key=lambda p: p[2])[:args.examples]:
+        print(f"  {similarity:.2f}  {url}  ~  {match}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+"""
+Offline hashed character n-gram classifier, usable as a local provider.
+
+A CPU-only baseline next to the LLMs: URLs are lower-cased, stripped of the
+scheme and a leading `www.` (the datasets differ in how they spell those, see
+url_canon.py) and their byte 3-5-grams are hashed into 2**20 features with
+NumPy (no vocabulary to fit or store, and ~10x faster than sklearn's
+per-string char analyzer). A logistic model is trained with SGD over streamed `url,type` batches (CSV or Parquet,
+see sampler.py), so it can learn from samples far larger than memory. The
+model is a single `.npz` file (weights + JSON metadata) loaded lazily on first
+use.
+
+`NgramModel.predict()` scores a whole list of URLs with one sparse matrix
+product; `NgramProvider` wraps it in the provider contract (see providers.py)
+so it can run through inference_runner.py or as the cheap stage of a cascade,
+and `predict` writes the usual `{url: score}` results file that
+evaluation.py / report.py / generate_confusion_matrix.py compare with the LLMs.
+
+    python ngram_model.py train sampled_data_2000_balanced.csv --holdout 0.2
+    python ngram_model.py predict extracted_urls_2000_balanced.csv --out ngram_url_classification_results.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from providers import Provider
+
+DEFAULT_MODEL_PATH = "ngram_model.npz"
+N_FEATURES = 2 ** 20
+NGRAM_RANGE = (3, 5)
+MAX_LEN = 256  # bytes of the normalized URL that are hashed
+PREDICT_CHUNK_ROWS = 100_000
+PREFIX_RE = r"^(?:[a-z][a-z0-9+.-]*://)?(?:www\d*\.)?"
+REASON = "char n-gram model"
+
+
+def normalize(urls) -> pd.Series:
+    """Lower-case and drop the scheme / leading www. of every URL."""
+    return pd.Series(urls, dtype=object).astype(str).str.lower().str.replace(PREFIX_RE, "", regex=True)
+
+
+def hash_ngrams(urls, n_features: int = N_FEATURES, ngram_range: tuple = NGRAM_RANGE,
+                max_len: int = MAX_LEN) -> sp.csr_matrix:
+    """Sparse (len(urls), n_features) matrix of hashed byte n-grams, rows scaled by 1/sqrt(#n-grams).
+
+    All URLs are concatenated into one byte array and every n-gram length is
+    hashed for all positions at once (FNV-style rolling product + a 64-bit
+    mixer); windows crossing into the next URL are masked out.
+    """
+    raw = [b[:max_len] for b in normalize(urls).str.encode("utf-8", errors="replace")]
+    lengths = np.fromiter(map(len, raw), dtype=np.int64, count=len(raw))
+    codes = np.frombuffer(b"".join(raw), dtype=np.uint8).astype(np.uint64)
+    row = np.repeat(np.arange(len(raw)), lengths)
+    ends = np.cumsum(lengths)[row]  # end offset of the URL each byte belongs to
+    pos = np.arange(len(codes))
+    rows, cols = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int32)]
+    for n in range(ngram_range[0], ngram_range[1] + 1):
+        m = len(codes) - n + 1
+        if m <= 0:
+            continue
+        h = np.full(m, np.uint64(n))
+        for k in range(n):
+            h = (h * np.uint64(1099511628211)) ^ codes[k:k + m]
+        h ^= h >> np.uint64(29)
+        h *= np.uint64(0xBF58476D1CE4E5B9)
+        h ^= h >> np.uint64(32)
+        valid = pos[:m] + n <= ends[:m]
+        rows.append(row[:m][valid])
+        cols.append((h[valid] % np.uint64(n_features)).astype(np.int32))
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    order = np.argsort(rows, kind="stable")
+    counts = np.bincount(rows, minlength=len(raw))
+    data = np.repeat((1.0 / np.sqrt(np.maximum(counts, 1))).astype(np.float32), counts)
+    indptr = np.concatenate([[0], np.cumsum(counts)])
+    return sp.csr_matrix((data, cols[order], indptr), shape=(len(raw), n_features))
+
+
+def holdout_mask(urls: pd.Series, fraction: float) -> np.ndarray:
+    """Deterministic per-URL split: True for the held-out share (stable across runs and batches)."""
+    if fraction <= 0:
+        return np.zeros(len(urls), dtype=bool)
+    buckets = pd.util.hash_pandas_object(urls, index=False).to_numpy() % 10_000
+    return buckets < int(fraction * 10_000)
+
+
+class NgramModel:
+    """Logistic model over hashed character n-grams of the normalized URL."""
+
+    def __init__(self, coef: Optional[np.ndarray] = None, intercept: float = 0.0,
+                 n_features: int = N_FEATURES, ngram_range: tuple = NGRAM_RANGE, meta: Optional[dict] = None):
+        self.n_features = n_features
+        self.ngram_range = tuple(ngram_range)
+        self.coef = np.zeros(n_features, dtype=np.float32) if coef is None else coef.astype(np.float32)
+        self.intercept = float(intercept)
+        self.meta = meta or {}
+
+    def transform(self, urls) -> sp.csr_matrix:
+        return hash_ngrams(urls, self.n_features, self.ngram_range)
+
+    def fit(self, source, epochs: int = 5, alpha: float = 1e-5, holdout: float = 0.0,
+            seed: int = 42, batch_rows: int = 100_000) -> "NgramModel":
+        """Train on url,type batches streamed from CSV/Parquet source(s); labels via evaluation.LABEL_MAP."""
+        from sklearn.linear_model import SGDClassifier
+        from sampler import iter_batches
+        from evaluation import LABEL_MAP
+        clf = SGDClassifier(loss="log_loss", alpha=alpha, random_state=seed)
+        rng = np.random.default_rng(seed)
+        rows = {0: 0, 1: 0}
+        for epoch in range(epochs):
+            for batch in iter_batches(source, batch_rows):
+                labels = batch["type"].map(LABEL_MAP)
+                batch = batch[labels.notna().to_numpy() & ~holdout_mask(batch["url"], holdout)]
+                if batch.empty:
+                    continue
+                batch = batch.iloc[rng.permutation(len(batch))]
+                y = batch["type"].map(LABEL_MAP).astype(int).to_numpy()
+                clf.partial_fit(self.transform(batch["url"]), y, classes=[0, 1])
+                if epoch == 0:
+                    rows[0] += int((y == 0).sum())
+                    rows[1] += int((y == 1).sum())
+        if not rows[0] + rows[1]:
+            raise ValueError(f"没有可用于训练的带标签URL: {source}")
+        self.coef = clf.coef_[0].astype(np.float32)
+        self.intercept = float(clf.intercept_[0])
+        self.meta = {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "sources": [source] if isinstance(source, str) else list(source),
+            "rows": rows, "epochs": epochs, "alpha": alpha, "holdout": holdout, "seed": seed,
+        }
+        return self
+
+    def decision_function(self, urls) -> np.ndarray:
+        return self.transform(urls) @ self.coef + self.intercept
+
+    def predict(self, urls, chunk_rows: int = PREDICT_CHUNK_ROWS) -> np.ndarray:
+        """Malicious probability of every URL, vectorized in chunks of `chunk_rows`."""
+        urls = list(urls)
+        out = np.empty(len(urls), dtype=np.float64)
+        for i in range(0, len(urls), chunk_rows):
+            z = self.decision_function(urls[i:i + chunk_rows])
+            out[i:i + chunk_rows] = 1.0 / (1.0 + np.exp(-z))
+        return out
+
+    def save(self, path: str = DEFAULT_MODEL_PATH):
+        meta = {**self.meta, "n_features": self.n_features, "ngram_range": list(self.ngram_range),
+                "intercept": self.intercept}
+        tmp = path + ".tmp.npz"
+        np.savez_compressed(tmp, coef=self.coef, meta=np.array(json.dumps(meta)))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_MODEL_PATH) -> "NgramModel":
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            coef = data["coef"]
+        return cls(coef, meta.pop("intercept"), meta.pop("n_features"), meta.pop("ngram_range"), meta)
+
+
+# ========= Provider =========
+class NgramProvider(Provider):
+    """Local provider backed by an NgramModel file (model = path, default $NGRAM_MODEL or ngram_model.npz).
+
+    No API key, network or response cache; the model is loaded on the first
+    score. `vectorized = True` lets inference_runner.py score the whole
+    dataset with one `predict()` call instead of one request per URL.
+    """
+
+    name = "ngram"
+    vectorized = True
+    reason = REASON
+
+    def __init__(self, model: Optional[str] = None, **kwargs):
+        kwargs.setdefault("api_key", "local")
+        super().__init__(model or os.environ.get("NGRAM_MODEL", DEFAULT_MODEL_PATH), **kwargs)
+        self.prompt_hash = None
+        self._classifier: Optional[NgramModel] = None
+
+    @property
+    def classifier(self) -> NgramModel:
+        if self._classifier is None:
+            if not os.path.exists(self.model):
+                raise FileNotFoundError(f"找不到n-gram模型 {self.model}，请先运行: python ngram_model.py train <data.csv>")
+            self._classifier = NgramModel.load(self.model)
+        return self._classifier
+
+    def predict(self, urls) -> np.ndarray:
+        return self.classifier.predict(urls)
+
+    def score(self, url: str, purpose: str = "primary") -> tuple[float, str]:
+        start = time.perf_counter()
+        score = round(float(self.predict([url])[0]), 4)
+        self.record_call(url, start, purpose=purpose)
+        return score, REASON
+
+    async def ascore(self, url: str, purpose: str = "primary") -> tuple[float, str]:
+        return self.score(url, purpose)
+
+
+def predict_file(model: NgramModel, data_file: str, output_file: str, reasons_file: Optional[str] = None,
+                 limit: int = 0) -> dict:
+    """Score every URL of a CSV and write `{url: score}` (and `{url: reason}`) JSON like the LLM runs."""
+    urls = pd.read_csv(data_file, usecols=["url"], dtype=str, nrows=limit or None)["url"].dropna()
+    urls = urls.drop_duplicates().tolist()
+    scores = np.round(model.predict(urls), 4).tolist()
+    results = dict(zip(urls, scores))
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    if reasons_file:
+        with open(reasons_file, 'w', encoding='utf-8') as f:
+            json.dump(dict.fromkeys(urls, REASON), f, ensure_ascii=False, indent=2)
+    return results
+
+
+def evaluate_holdout(model: NgramModel, source, holdout: float) -> Optional[dict]:
+    """Binary metrics on the held-out share of the training source(s)."""
+    from sampler import iter_batches
+    from evaluation import LABEL_MAP, THRESHOLD, binary_metrics
+    frames = [b[holdout_mask(b["url"], holdout)] for b in iter_batches(source)]
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["url", "type"])
+    df = df[df["type"].isin(LABEL_MAP.keys())]
+    y = df["type"].map(LABEL_MAP).astype(int).to_numpy()
+    if len(np.unique(y)) < 2:
+        return None
+    return binary_metrics(y, model.predict(df["url"]), THRESHOLD)
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Hashed char n-gram URL classifier (local provider)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    train = sub.add_parser("train", help="train on labelled url,type CSV / Parquet source(s)")
+    train.add_argument("source", nargs="+")
+    train.add_argument("--model", default=os.environ.get("NGRAM_MODEL", DEFAULT_MODEL_PATH))
+    train.add_argument("--epochs", type=int, default=5)
+    train.add_argument("--alpha", type=float, default=1e-5, help="L2 regularization strength")
+    train.add_argument("--holdout", type=float, default=0.0, help="share of URLs held out for evaluation")
+    train.add_argument("--seed", type=int, default=42)
+    predict = sub.add_parser("predict", help="write {url: score} results for a CSV")
+    predict.add_argument("data_file")
+    predict.add_argument("--model", default=os.environ.get("NGRAM_MODEL", DEFAULT_MODEL_PATH))
+    predict.add_argument("--out", default="ngram_url_classification_results.json")
+    predict.add_argument("--reasons", default=None, help="also write {url: reason}")
+    predict.add_argument("--limit", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.command == "train":
+        start = time.perf_counter()
+        try:
+            model = NgramModel().fit(args.source, args.epochs, args.alpha, args.holdout, args.seed)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"错误: {e}")
+            return 1
+        model.save(args.model)
+        print(f"训练完成: {model.meta['rows']} 行 x {args.epochs} 轮，用时 {time.perf_counter() - start:.1f}s -> {args.model}")
+        if args.holdout > 0:
+            m = evaluate_holdout(model, args.source, args.holdout)
+            if m is None:
+                print("[WARN] 留出集只有一个类别，无法评估")
+            else:
+                print(f"留出集 n={m['n']}  AUROC={m['auroc']:.3f}  precision={m['precision']:.3f}  "
+                      f"recall={m['recall']:.3f}  F1={m['f1']:.3f}")
+        return 0
+
+    if not os.path.exists(args.model):
+        print(f"错误: 找不到模型 {args.model}，请先运行 train")
+        return 1
+    start = time.perf_counter()
+    results = predict_file(NgramModel.load(args.model), args.data_file, args.out, args.reasons, args.limit)
+    elapsed = time.perf_counter() - start
+    print(f"已评分 {len(results)} 个URL，用时 {elapsed:.2f}s（{len(results) / max(elapsed, 1e-9):,.0f} URL/s）-> {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""
+Streaming ingestion of DeepURLBench Parquet part files.
+
+Treats a directory, glob or list of `part-*.parquet` files as one
+`pyarrow.dataset`, reads only the URL (and label) columns, and streams
+record batches straight into Parquet or CSV shards of at most `shard_rows`
+rows, so memory stays at roughly one batch plus one shard whatever the size
+of the benchmark. Output columns are the usual `url,type`; rows without a
+URL are dropped and a missing label column becomes `type=unknown`.
+
+    python parquet_ingest.py DeepURLBench-main/urls_with_dns deepurlbench/ --format parquet
+    python parquet_ingest.py "DeepURLBench-main/urls_with_dns/part-*.parquet" urls.csv --limit 50000
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+from typing import Iterator, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pyarrow.csv as pacsv
+
+URL_HINTS = ("url", "link")
+LABEL_HINTS = ("type", "label", "category", "class")
+DEFAULT_BATCH_ROWS = 64_000
+DEFAULT_SHARD_ROWS = 1_000_000
+
+
+def resolve_sources(source) -> list[str]:
+    """Part files for a directory, glob, single file or list of those (sorted)."""
+    sources = [source] if isinstance(source, (str, os.PathLike)) else list(source)
+    files = []
+    for src in map(str, sources):
+        if os.path.isdir(src):
+            files += glob.glob(os.path.join(src, "**", "*.parquet"), recursive=True)
+        elif any(ch in src for ch in "*?["):
+            files += glob.glob(src, recursive=True)
+        elif os.path.exists(src):
+            files.append(src)
+    if not files:
+        raise FileNotFoundError(f"没有找到Parquet文件: {source}")
+    return sorted(set(files))
+
+
+def open_dataset(source) -> ds.Dataset:
+    return ds.dataset(resolve_sources(source), format="parquet")
+
+
+def _find_column(schema: pa.Schema, hints, exact_first: bool = True) -> Optional[str]:
+    names = schema.names
+    lowered = {name.lower(): name for name in names}
+    if exact_first:
+        for hint in hints:
+            if hint in lowered:
+                return lowered[hint]
+    for name in names:
+        if any(hint in name.lower() for hint in hints):
+            return name
+    return None
+
+
+def detect_columns(schema: pa.Schema, url_column: Optional[str] = None,
+                   label_column: Optional[str] = None) -> tuple[str, Optional[str]]:
+    """(url column, label column or None); explicit names must exist."""
+    for name in (url_column, label_column):
+        if name is not None and name not in schema.names:
+            raise ValueError(f"列 '{name}' 不存在，可用的列: {schema.names}")
+    url_column = url_column or _find_column(schema, URL_HINTS)
+    if url_column is None:
+        raise ValueError(f"未找到URL相关的列，请用 --url-column 指定。可用的列: {schema.names}")
+    if label_column is None:
+        label_column = _find_column(schema, LABEL_HINTS)
+    return url_column, label_column
+
+
+def iter_url_batches(dataset: ds.Dataset, url_column: str, label_column: Optional[str] = None,
+                     batch_rows: int = DEFAULT_BATCH_ROWS, limit: Optional[int] = None) -> Iterator[pa.Table]:
+    """`url,type` tables read batch by batch with column projection; null URLs dropped."""
+    columns = {"url": ds.field(url_column).cast(pa.string())}
+    if label_column:
+        columns["type"] = ds.field(label_column).cast(pa.string())
+    remaining = limit
+    for batch in dataset.to_batches(columns=columns, batch_size=batch_rows, filter=ds.field(url_column).is_valid()):
+        table = pa.Table.from_batches([batch])
+        if "type" not in table.column_names:
+            table = table.append_column("type", pa.array(["unknown"] * len(table), pa.string()))
+        else:
+            table = table.set_column(1, "type", pc.fill_null(table["type"], "unknown"))
+        if remaining is not None:
+            table = table.slice(0, remaining)
+            remaining -= len(table)
+        if len(table):
+            yield table
+        if remaining is not None and remaining <= 0:
+            return
+
+
+class ShardWriter:
+    """Writes tables into `<out>/part-00000.<fmt>`, ... (or one file when out has that
+    extension), starting a new shard every `shard_rows` rows."""
+
+    def __init__(self, out: str, fmt: Optional[str] = None, shard_rows: int = DEFAULT_SHARD_ROWS):
+        ext = os.path.splitext(out)[1].lower().lstrip(".")
+        self.fmt = fmt or (ext if ext in ("csv", "parquet") else "parquet")
+        self.single = ext in ("csv", "parquet")
+        self.out = out
+        self.shard_rows = shard_rows if not self.single else None
+        self.paths, self.rows = [], 0
+        self._writer, self._shard_rows = None, 0
+        if not self.single:
+            os.makedirs(out, exist_ok=True)
+        elif os.path.dirname(out):
+            os.makedirs(os.path.dirname(out), exist_ok=True)
+
+    def _open(self, schema: pa.Schema):
+        path = self.out if self.single else os.path.join(self.out, f"part-{len(self.paths):05d}.{self.fmt}")
+        self._writer = pq.ParquetWriter(path, schema) if self.fmt == "parquet" else pacsv.CSVWriter(path, schema)
+        self._shard_rows = 0
+        self.paths.append(path)
+
+    def write(self, table: pa.Table):
+        while len(table):
+            if self._writer is None:
+                self._open(table.schema)
+            room = len(table) if self.shard_rows is None else self.shard_rows - self._shard_rows
+            part, table = table.slice(0, room), table.slice(room)
+            self._writer.write_table(part)
+            self._shard_rows += len(part)
+            self.rows += len(part)
+            if self.shard_rows is not None and self._shard_rows >= self.shard_rows:
+                self.close()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def ingest(source, out: str, fmt: Optional[str] = None, url_column: Optional[str] = None,
+           label_column: Optional[str] = None, limit: Optional[int] = None,
+           batch_rows: int = DEFAULT_BATCH_ROWS, shard_rows: int = DEFAULT_SHARD_ROWS) -> dict:
+    """Stream `source` Parquet parts into url,type shards; returns a small summary."""
+    dataset = open_dataset(source)
+    url_column, label_column = detect_columns(dataset.schema, url_column, label_column)
+    print(f"Parquet文件: {len(dataset.files)}  URL列: '{url_column}'  标签列: '{label_column or '-'}'")
+    start = time.perf_counter()
+    counts = {}
+    with ShardWriter(out, fmt, shard_rows) as writer:
+        for table in iter_url_batches(dataset, url_column, label_column, batch_rows, limit):
+            for value, n in zip(*pc.value_counts(table["type"]).flatten()):
+                counts[value.as_py()] = counts.get(value.as_py(), 0) + n.as_py()
+            writer.write(table)
+    return {"files": len(dataset.files), "rows": writer.rows, "shards": writer.paths,
+            "types": counts, "seconds": time.perf_counter() - start}
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Stream URL/label columns of Parquet part files into shards")
+    parser.add_argument("source", nargs="+", help="directory, glob or Parquet file(s)")
+    parser.add_argument("out", help="output directory for shards, or a single .csv/.parquet file")
+    parser.add_argument("--format", choices=["parquet", "csv"], default=None,
+                        help="shard format (default: from the output extension, else parquet)")
+    parser.add_argument("--url-column", default=None, help="default: first column named like url/link")
+    parser.add_argument("--label-column", default=None, help="default: first column named like type/label")
+    parser.add_argument("--limit", type=int, default=None, help="stop after N rows")
+    parser.add_argument("--batch-rows", type=int, default=DEFAULT_BATCH_ROWS)
+    parser.add_argument("--shard-rows", type=int, default=DEFAULT_SHARD_ROWS)
+    args = parser.parse_args(argv)
+
+    try:
+        summary = ingest(args.source, args.out, args.format, args.url_column, args.label_column,
+                         args.limit, args.batch_rows, args.shard_rows)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"错误: {e}")
+        return 1
+    print(f"写入 {summary['rows']} 行到 {len(summary['shards'])} 个分片，耗时 {summary['seconds']:.1f}s")
+    for value, n in sorted(summary["types"].items(), key=lambda kv: -kv[1]):
+        print(f"  {value}: {n}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
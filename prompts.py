@@ -0,0 +1,153 @@
+"""
+Shared prompts and response parsers for URL classification.
+
+All inference scripts and providers render prompts and parse model output
+through this module, so a prompt change only has to be made once.
+"""
+
+import re
+import json
+from typing import Optional
+
+# ========= Prompt =========
+SYSTEM_MSG = (
+    "You are a URL security expert. "
+    "Evaluate the probability that the given URL is malicious or benign. "
+    "Malicious includes (phishing, malware, defacement, or other harmful). "
+    "Output ONLY a single JSON object with one key 'score' whose value is a number in [0,1]. "
+    "No text before or after the JSON."
+)
+
+# 说明和示例部分，单URL和多URL提示词共用
+_PROMPT_PREFIX = """You are a URL security expert. Evaluate the probability that the given URL is malicious or benign.
+
+Malicious URLs often exhibit abnormal lexical or structural patterns—such as high-entropy or brand-mismatched domains, risky TLDs, suspicious keywords, executable or archive downloads, cloud-storage abuse, redirects/shorteners, and compromised CMS traces—while lacking the consistent branding, clean semantics, and trusted hosting typical of benign sites.
+
+Benign URLs are known reputable sites with clean descriptive paths. Normal encoding alone is neutral.
+
+Examples:
+rapreviews.com/archive/2010_04_cityofdirt.html (benign)
+Signal: Established review site; semantic and readable path; no suspicious parameters or brand terms. 
+
+http://viva-sport.com/index.php?option=com_virtuemart&page=shop.browse&category_id=19&Itemid=54 (malicious)
+Signal: HTTP (no TLS); Joomla/VirtueMart CMS stack with long query string; typical signs of defacement or compromise. 
+
+http://fr57f6yg.gb.net/boa/login.php?... (malicious)
+Signal: Subdomain appears high-entropy/random; path contains "boa/login.php" (brand keyword mismatch — brand impersonation); very long session parameters. 
+
+"""
+
+PROMPT_TEMPLATE = _PROMPT_PREFIX + """Show me your thinking process, but only end your response with one-line JSON exactly like: {{"score": <float>}} (no extra text).
+
+URL: {url}
+Return:"""
+
+# 旧版简单提示词（Grok / Llama / Gemini 2000条脚本使用），只要求返回一个数字
+# 原脚本里是缩进的f-string，缩进也随请求发出；这里逐字节保留，已有结果文件才能复现
+_SIMPLE_PROMPT_LINES = [
+    "Evaluate the probability of this URL being a phishing site.",
+    "Respond only with a numeric value strictly between 0 (definitely not phishing) and 1 (definitely phishing, malware, defacement or others).",
+    "Even if uncertain, you must still choose the number closest to your judgment and do NOT output anything else.",
+    "URL: {url}",
+]
+# Grok_inference.py / LLama_inference.py：续行缩进20个空格
+SIMPLE_PROMPT_TEMPLATE = ("\n" + " " * 20).join(_SIMPLE_PROMPT_LINES)
+# Gemini_inference.PY：续行缩进8个空格
+GEMINI_SIMPLE_PROMPT_TEMPLATE = ("\n" + " " * 8).join(_SIMPLE_PROMPT_LINES)
+
+# 多URL批量提示词：共用同一段说明和示例，一次请求评估多个URL
+BATCH_PROMPT_TEMPLATE = _PROMPT_PREFIX + """Evaluate each of the URLs below independently. Do not explain.
+Return ONLY one JSON object exactly like: {{"results": [{{"url": "<url exactly as given>", "score": <float>}}, ...]}}
+with one entry per URL, in the same order.
+
+URLs:
+{urls}
+Return:"""
+
+# ========= Helpers =========
+num_pattern = re.compile(r'(-?\d+(?:\.\d+)?)')
+
+def parse_score_and_reason(text: str) -> tuple[float, str]:
+    """Parse final JSON score from the last non-empty line; capture prior lines as reasoning.
+    Returns (score, reason_text). Fallback to regex number; else 0.5.
+    """
+    if text is None:
+        return 0.5, ""
+    lines = [ln for ln in (text.splitlines()) if ln.strip() != ""]
+    reason_text = ""
+    json_candidate = None
+    if lines:
+        json_candidate = lines[-1].strip()
+        reason_text = "\n".join(lines[:-1]).strip()
+    # Try JSON on the last line
+    if json_candidate:
+        try:
+            obj = json.loads(json_candidate)
+            if isinstance(obj, dict) and "score" in obj:
+                v = float(obj["score"])
+                return max(0.0, min(1.0, v)), reason_text
+        except Exception:
+            pass
+    # Fallback: search last number in full text
+    m = num_pattern.search(text)
+    if m:
+        v = float(m.group(1))
+        return max(0.0, min(1.0, v)), reason_text
+    return 0.5, reason_text
+
+def find_final_score(text: str) -> Optional[float]:
+    """Score of a complete `{"score": ...}` JSON object ending `text`, else None.
+    Used on partial streamed output to tell when the answer is finished.
+    """
+    stripped = (text or "").rstrip().rstrip("`").rstrip()
+    if not stripped.endswith("}"):
+        return None
+    for candidate in (stripped.splitlines()[-1].strip(), stripped):
+        try:
+            obj = json.loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(obj, dict) and isinstance(obj.get("score"), (int, float)) \
+                and not isinstance(obj["score"], bool):
+            return float(obj["score"])
+    return None
+
+def parse_probability(text: str) -> tuple[float, str]:
+    """Parse a bare numeric answer (SIMPLE_PROMPT_TEMPLATE). Returns (score, "");
+    anything that is not a number scores 0.5.
+    """
+    try:
+        v = float((text or "").strip())
+    except ValueError:
+        return 0.5, ""
+    return max(0.0, min(1.0, v)), ""
+
+def parse_batch_scores(text: str, urls: list[str]) -> dict[str, float]:
+    """Parse a batched answer into {url: score}, keeping only well-formed entries
+    whose url is one of `urls` and whose score is a number in [0,1].
+    Anything missing or malformed is simply absent from the result.
+    """
+    if not text:
+        return {}
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    end = max(text.rfind("}"), text.rfind("]"))
+    if start < 0 or end < start:
+        return {}
+    try:
+        obj = json.loads(text[start:end + 1])
+    except ValueError:
+        return {}
+    items = obj.get("results") if isinstance(obj, dict) else obj
+    if not isinstance(items, list):
+        return {}
+    wanted = set(urls)
+    scores = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        url, v = item.get("url"), item.get("score")
+        if url not in wanted or isinstance(v, bool) or not isinstance(v, (int, float)):
+            continue
+        if 0.0 <= v <= 1.0:
+            scores[url] = float(v)
+    return scores
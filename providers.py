@@ -0,0 +1,558 @@
+"""
+Unified provider adapters for URL scoring (OpenAI, xAI/Grok, Llama API, Gemini).
+
+Every provider exposes the same contract:
+
+    provider.score(url)          -> (score, reason)   # blocking
+    await provider.ascore(url)   -> (score, reason)   # asyncio
+
+A URL that cannot be scored (retries exhausted, truncated response) comes
+back as (None, "Error: ...") rather than a made-up score.
+
+Local models implement the same contract: get_provider("ngram", ...) without
+HTTP (see ngram_model.py), get_provider("llamacpp", ...) against a local
+llama.cpp server (see local_llm.py).
+
+Adapters only know how to build a request and read the text out of a
+response. All HTTP traffic goes through one shared, pooled keep-alive httpx
+client per process (one AsyncClient per event loop), using HTTP/2 when the
+optional `h2` package is installed, so each URL reuses an open connection
+instead of paying a fresh TCP+TLS handshake. Calls are paced by the shared
+per-key RateLimiter (see rate_limiter.py) and, when `metrics` is set, every
+scored URL is recorded by a MetricsRecorder (see call_metrics.py).
+
+With stream=True (or $INFERENCE_STREAM=1) adapters that support it read the
+completion as server-sent events and hang up as soon as the final
+`{"score": ...}` JSON has arrived, so trailing output is neither waited for
+nor paid for. A response cut off by max_tokens before its score raises
+TruncatedResponseError instead of being parsed.
+"""
+
+import os
+import json
+import time
+import asyncio
+import weakref
+import importlib.util
+from typing import Callable, Optional
+
+import httpx
+
+from prompts import PROMPT_TEMPLATE, parse_score_and_reason, find_final_score
+from response_cache import ResponseCache, make_key, sha256_text
+from run_journal import ERROR_PREFIX
+from call_metrics import MetricsRecorder, estimate_cost
+from rate_limiter import (RateLimiter, RateLimitedError, backoff_delay,
+                          get_rate_limiter, retry_after_from_headers)
+
+# ========= Shared HTTP clients =========
+HTTP2_ENABLED = importlib.util.find_spec("h2") is not None
+HTTP_LIMITS = httpx.Limits(max_connections=256, max_keepalive_connections=64, keepalive_expiry=60.0)
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+_sync_client: Optional[httpx.Client] = None
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_http_client() -> httpx.Client:
+    """Process-wide pooled client for blocking calls."""
+    global _sync_client
+    if _sync_client is None or _sync_client.is_closed:
+        _sync_client = httpx.Client(http2=HTTP2_ENABLED, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+    return _sync_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Pooled client for the running event loop (httpx async clients are loop-bound)."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(http2=HTTP2_ENABLED, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+        _async_clients[loop] = client
+    return client
+
+
+def close_http_clients():
+    """Close the blocking client (async clients are closed by aclose_http_clients)."""
+    global _sync_client
+    if _sync_client is not None:
+        _sync_client.close()
+        _sync_client = None
+
+
+async def aclose_http_clients():
+    """Close the pooled client of the running event loop."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+class ProviderError(Exception):
+    """Raised when a provider returns a response we cannot use."""
+
+
+class TruncatedResponseError(ProviderError):
+    """The completion hit the output-token limit before emitting its score."""
+
+
+def override_base_url(name: str) -> Optional[str]:
+    """`$LLM_BASE_URL/<provider name>` when LLM_BASE_URL is set (e.g. mock_llm_server.py), else None."""
+    root = os.environ.get("LLM_BASE_URL")
+    return f"{root.rstrip('/')}/{name}" if root else None
+
+
+# ========= Base adapter =========
+class Provider:
+    """Base class: subclasses implement build_request() and extract_text()."""
+
+    name = "base"
+    api_key_env = ""
+    default_base_url = ""
+    supports_streaming = False
+    # local models with a predict(urls) -> np.ndarray path and a fixed `reason` (see ngram_model.py)
+    vectorized = False
+    # finish reasons meaning "stopped at the output-token limit"
+    truncation_reasons = ("length",)
+
+    def __init__(self, model: str,
+                 api_key: Optional[str] = None,
+                 base_url: Optional[str] = None,
+                 prompt_template: str = PROMPT_TEMPLATE,
+                 system_msg: Optional[str] = None,
+                 parser: Callable[[str], tuple[float, str]] = parse_score_and_reason,
+                 max_tokens: Optional[int] = None,
+                 temperature: float = 0.0,
+                 retries: int = 3,
+                 backoff: float = 0.6,
+                 max_throttle_retries: int = 8,
+                 cache: Optional[ResponseCache] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 metrics: Optional[MetricsRecorder] = None,
+                 stream: Optional[bool] = None):
+        self.model = model
+        self.api_key = api_key if api_key is not None else os.environ.get(self.api_key_env, "")
+        if not self.api_key:
+            raise ValueError(f"请设置环境变量 {self.api_key_env}")
+        self.base_url = (base_url or override_base_url(self.name) or self.default_base_url).rstrip("/")
+        self.prompt_template = prompt_template
+        self.system_msg = system_msg
+        self.parser = parser
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.retries = retries
+        self.backoff = backoff
+        self.max_throttle_retries = max_throttle_retries
+        self.cache = cache
+        self.rate_limiter = rate_limiter or get_rate_limiter(self.name, self.api_key)
+        self.metrics = metrics
+        self.prompt_hash = sha256_text(self.prompt_template, self.system_msg)
+        if stream is None:
+            stream = self.supports_streaming and os.environ.get("INFERENCE_STREAM", "") in ("1", "true", "yes")
+        elif stream and not self.supports_streaming:
+            raise ValueError(f"{type(self).__name__} 不支持流式输出")
+        self.stream = stream
+
+    def __repr__(self):
+        return f"{type(self).__name__}(model={self.model!r})"
+
+    # ----- adapter hooks -----
+    def build_request(self, prompt: str, stream: bool = False) -> tuple[str, dict, dict]:
+        """Return (endpoint_url, headers, json_body) for one prompt."""
+        raise NotImplementedError
+
+    def extract_text(self, data: dict) -> str:
+        """Return the completion text from a decoded JSON response."""
+        raise NotImplementedError
+
+    def extract_usage(self, data: dict) -> Optional[tuple[int, int]]:
+        """Return (prompt_tokens, completion_tokens) if the response reports them."""
+        return None
+
+    def extract_finish_reason(self, data: dict) -> Optional[str]:
+        """Return why generation stopped, if the response says."""
+        return None
+
+    def extract_stream_chunk(self, chunk: dict) -> tuple[str, Optional[str], Optional[tuple[int, int]]]:
+        """Return (text_delta, finish_reason, usage) for one streamed event."""
+        raise NotImplementedError
+
+    # ----- shared plumbing -----
+    def render(self, url: str) -> str:
+        return self.prompt_template.format(url=url)
+
+    def decoding_params(self) -> dict:
+        """Parameters that change the response; part of the cache key."""
+        return {"temperature": self.temperature, "max_tokens": self.max_tokens}
+
+    def cache_key(self, url: str) -> str:
+        return make_key(self.name, self.model, self.prompt_hash, self.decoding_params(), url)
+
+    def messages(self, prompt: str) -> list[dict]:
+        msgs = []
+        if self.system_msg:
+            msgs.append({"role": "system", "content": self.system_msg})
+        msgs.append({"role": "user", "content": prompt})
+        return msgs
+
+    def estimate_tokens(self, prompt: str) -> int:
+        """Rough tokens/minute reservation for one call (~4 chars per token)."""
+        return len(prompt) // 4 + len(self.system_msg or "") // 4 + (self.max_tokens or 256)
+
+    def _read(self, response: httpx.Response) -> dict:
+        self.rate_limiter.update_from_headers(response.headers)
+        if response.status_code == 429:
+            raise RateLimitedError(f"HTTP 429: {response.text[:200]}",
+                                   retry_after_from_headers(response.headers))
+        if response.status_code != 200:
+            raise ProviderError(f"HTTP {response.status_code}: {response.text[:200]}")
+        return response.json()
+
+    def _finish(self, result: tuple, estimate: int, info: dict) -> str:
+        text, finish_reason, usage = result
+        if usage is None and info["early_stop"]:
+            # the usage event comes after the point where we hung up
+            usage = (estimate - (self.max_tokens or 256), len(text) // 4)
+            info["usage_estimated"] = True
+        info["usage"] = usage
+        self.rate_limiter.on_success()
+        self.rate_limiter.settle(estimate, sum(usage) if usage else None)
+        if finish_reason in self.truncation_reasons and find_final_score(text) is None:
+            raise TruncatedResponseError(
+                f"{self.name} 输出在 max_tokens={self.max_tokens} 处被截断，没有最终分数: ...{text[-80:]!r}")
+        return text
+
+    def _send(self, endpoint: str, headers: dict, body: dict, info: dict) -> tuple:
+        start = time.perf_counter()
+        with get_http_client().stream("POST", endpoint, headers=headers, json=body) as response:
+            info["ttfb"] = time.perf_counter() - start
+            if not self.stream or response.status_code != 200:
+                response.read()
+                data = self._read(response)
+                info["tts"] = time.perf_counter() - start
+                return self.extract_text(data), self.extract_finish_reason(data), self.extract_usage(data)
+            self.rate_limiter.update_from_headers(response.headers)
+            state = self._new_stream_state()
+            for line in response.iter_lines():
+                if self._feed(line, state, start, info):
+                    break
+        return self._stream_result(state, start, info)
+
+    async def _asend(self, endpoint: str, headers: dict, body: dict, info: dict) -> tuple:
+        start = time.perf_counter()
+        async with get_async_http_client().stream("POST", endpoint, headers=headers, json=body) as response:
+            info["ttfb"] = time.perf_counter() - start
+            if not self.stream or response.status_code != 200:
+                await response.aread()
+                data = self._read(response)
+                info["tts"] = time.perf_counter() - start
+                return self.extract_text(data), self.extract_finish_reason(data), self.extract_usage(data)
+            self.rate_limiter.update_from_headers(response.headers)
+            state = self._new_stream_state()
+            async for line in response.aiter_lines():
+                if self._feed(line, state, start, info):
+                    break
+        return self._stream_result(state, start, info)
+
+    # ----- streaming -----
+    @staticmethod
+    def _new_stream_state() -> dict:
+        return {"parts": [], "finish_reason": None, "usage": None}
+
+    def _feed(self, line: str, state: dict, start: float, info: dict) -> bool:
+        """Consume one server-sent-event line; True once the answer is complete."""
+        if not line.startswith("data:"):
+            return False
+        payload = line[5:].strip()
+        if payload == "[DONE]":
+            return True
+        text, finish_reason, usage = self.extract_stream_chunk(json.loads(payload))
+        state["finish_reason"] = finish_reason or state["finish_reason"]
+        state["usage"] = usage or state["usage"]
+        if text:
+            state["parts"].append(text)
+            if "}" in text and find_final_score("".join(state["parts"])) is not None:
+                info["tts"] = time.perf_counter() - start
+                info["early_stop"] = state["finish_reason"] is None
+                return info["early_stop"]
+        return False
+
+    @staticmethod
+    def _stream_result(state: dict, start: float, info: dict) -> tuple:
+        if info["tts"] is None:
+            info["tts"] = time.perf_counter() - start
+        return "".join(state["parts"]), state["finish_reason"], state["usage"]
+
+    @staticmethod
+    def new_call_info() -> dict:
+        """Per-call bookkeeping filled in by complete(): retries, ttfb, time to score, usage."""
+        return {"failed": 0, "throttled": 0, "ttfb": None, "tts": None, "early_stop": False,
+                "usage": None, "usage_estimated": False}
+
+    def _retry_delay(self, err: Exception, attempts: dict) -> float:
+        """Count a failed attempt and return how long to wait, or re-raise when out of retries.
+
+        Throttling (429) backs off exponentially with jitter / Retry-After and has
+        its own budget; other errors keep the linear backoff of the old scripts.
+        """
+        if isinstance(err, TruncatedResponseError):
+            raise err  # deterministic decoding would truncate again
+        if isinstance(err, RateLimitedError):
+            self.rate_limiter.on_throttle(err.retry_after)
+            if attempts["throttled"] >= self.max_throttle_retries:
+                raise err
+            delay = backoff_delay(attempts["throttled"], err.retry_after)
+            attempts["throttled"] += 1
+            print(f"[限流 {attempts['throttled']}/{self.max_throttle_retries}] {self.name} 返回429，{delay:.1f} 秒后重试")
+            return delay
+        attempts["failed"] += 1
+        print(f"[尝试 {attempts['failed']}/{self.retries}] {self.name} 调用失败: {type(err).__name__}: {err}")
+        if attempts["failed"] >= self.retries:
+            raise err
+        return self.backoff * attempts["failed"]
+
+    def complete(self, prompt: str, info: Optional[dict] = None) -> str:
+        """Send one prompt (blocking), paced by the rate limiter, with retries."""
+        endpoint, headers, body = self.build_request(prompt, self.stream)
+        estimate = self.estimate_tokens(prompt)
+        info = info if info is not None else self.new_call_info()
+        while True:
+            self.rate_limiter.acquire(estimate)
+            try:
+                return self._finish(self._send(endpoint, headers, body, info), estimate, info)
+            except Exception as e:
+                time.sleep(self._retry_delay(e, info))
+
+    async def acomplete(self, prompt: str, info: Optional[dict] = None) -> str:
+        """Send one prompt on the running event loop, paced by the rate limiter, with retries."""
+        endpoint, headers, body = self.build_request(prompt, self.stream)
+        estimate = self.estimate_tokens(prompt)
+        info = info if info is not None else self.new_call_info()
+        while True:
+            await self.rate_limiter.aacquire(estimate)
+            try:
+                return self._finish(await self._asend(endpoint, headers, body, info), estimate, info)
+            except Exception as e:
+                await asyncio.sleep(self._retry_delay(e, info))
+
+    def record_call(self, url: str, start: float, info: Optional[dict] = None,
+                    error: Optional[Exception] = None, cached: bool = False, urls: int = 1,
+                    purpose: str = "primary"):
+        """Append one call to the metrics file (no-op without a recorder). purpose is
+        "primary", or "fallback" / "drift" for extra calls on URLs a primary call covered."""
+        if self.metrics is None:
+            return
+        info = info or self.new_call_info()
+        usage = info["usage"] or (None, None)
+        self.metrics.record(
+            provider=self.name, model=self.model, url=url, urls=urls, cached=cached, purpose=purpose,
+            latency_s=time.perf_counter() - start, ttfb_s=info["ttfb"], time_to_score_s=info["tts"],
+            early_stop=info["early_stop"], usage_estimated=info["usage_estimated"],
+            retries=info["failed"] + info["throttled"], throttled=info["throttled"],
+            prompt_tokens=usage[0], completion_tokens=usage[1],
+            cost_usd=None if cached else estimate_cost(self.model, usage[0], usage[1]),
+            error=repr(error) if error is not None else None)
+
+    def cache_lookup(self, url: str):
+        """Return (key, (score, reason) or None); key is None when caching is off."""
+        if self.cache is None:
+            return None, None
+        key = self.cache_key(url)
+        hit = self.cache.get(key)
+        return key, (hit[1], hit[2]) if hit is not None else None
+
+    def _parse(self, key: Optional[str], url: str, text: str) -> tuple[float, str]:
+        score, reason = self.parser(text)
+        if key is not None:
+            self.cache.put(key, self.name, self.model, self.prompt_hash, url, text, score, reason)
+        return score, reason
+
+    def score(self, url: str, purpose: str = "primary") -> tuple[Optional[float], str]:
+        """Score one URL (read-through cache); after all retries fail, return (None, "Error: ...").
+        purpose only tags the metrics record (see record_call)."""
+        start = time.perf_counter()
+        key, hit = self.cache_lookup(url)
+        if hit is not None:
+            self.record_call(url, start, cached=True, purpose=purpose)
+            return hit
+        info = self.new_call_info()
+        try:
+            result = self._parse(key, url, self.complete(self.render(url), info))
+        except Exception as e:
+            self.record_call(url, start, info, error=e, purpose=purpose)
+            print(f"[WARN] {self.name} 调用失败，不计分: {url}\n  err={repr(e)}")
+            return None, f"{ERROR_PREFIX} {repr(e)}"
+        self.record_call(url, start, info, purpose=purpose)
+        return result
+
+    async def ascore(self, url: str, purpose: str = "primary") -> tuple[Optional[float], str]:
+        start = time.perf_counter()
+        key, hit = self.cache_lookup(url)
+        if hit is not None:
+            self.record_call(url, start, cached=True, purpose=purpose)
+            return hit
+        info = self.new_call_info()
+        try:
+            result = self._parse(key, url, await self.acomplete(self.render(url), info))
+        except Exception as e:
+            self.record_call(url, start, info, error=e, purpose=purpose)
+            print(f"[WARN] {self.name} 调用失败，不计分: {url}\n  err={repr(e)}")
+            return None, f"{ERROR_PREFIX} {repr(e)}"
+        self.record_call(url, start, info, purpose=purpose)
+        return result
+
+
+# ========= Adapters =========
+class OpenAIProvider(Provider):
+    """OpenAI chat-completions wire format."""
+
+    name = "openai"
+    api_key_env = "OPENAI_API_KEY"
+    default_base_url = os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1")
+    supports_streaming = True
+
+    def __init__(self, model: str, response_format: Optional[dict] = None, **kwargs):
+        self.response_format = response_format
+        super().__init__(model, **kwargs)
+
+    def decoding_params(self):
+        return {**super().decoding_params(), "response_format": self.response_format}
+
+    def build_request(self, prompt, stream=False):
+        body = {"model": self.model, "messages": self.messages(prompt),
+                "temperature": self.temperature, "stream": stream}
+        if stream:
+            body["stream_options"] = {"include_usage": True}
+        if self.max_tokens is not None:
+            body["max_tokens"] = self.max_tokens
+        if self.response_format is not None:
+            body["response_format"] = self.response_format
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        return f"{self.base_url}/chat/completions", headers, body
+
+    def extract_text(self, data):
+        return data["choices"][0]["message"]["content"] or ""
+
+    def extract_usage(self, data):
+        usage = data.get("usage")
+        if not usage:
+            return None
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+    def extract_finish_reason(self, data):
+        return data["choices"][0].get("finish_reason")
+
+    def extract_stream_chunk(self, chunk):
+        choices = chunk.get("choices") or [{}]
+        text = (choices[0].get("delta") or {}).get("content") or ""
+        return text, choices[0].get("finish_reason"), self.extract_usage(chunk)
+
+
+class XAIProvider(OpenAIProvider):
+    """xAI (Grok) speaks the OpenAI chat-completions format."""
+
+    name = "xai"
+    api_key_env = "XAI_API_KEY"
+    default_base_url = os.environ.get("XAI_BASE_URL", "https://api.x.ai/v1")
+
+
+class LlamaProvider(Provider):
+    """Meta Llama API native chat-completions format."""
+
+    name = "llama"
+    api_key_env = "LLAMA_API_KEY"
+    default_base_url = os.environ.get("LLAMA_BASE_URL", "https://api.llama.com/v1")
+
+    def build_request(self, prompt, stream=False):
+        body = {"model": self.model, "messages": self.messages(prompt), "temperature": self.temperature}
+        if self.max_tokens is not None:
+            body["max_completion_tokens"] = self.max_tokens
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        return f"{self.base_url}/chat/completions", headers, body
+
+    def extract_text(self, data):
+        return data["completion_message"]["content"]["text"] or ""
+
+    def extract_usage(self, data):
+        metrics = {m.get("metric"): m.get("value", 0) for m in data.get("metrics") or []}
+        if "num_prompt_tokens" not in metrics:
+            return None
+        return int(metrics["num_prompt_tokens"]), int(metrics.get("num_completion_tokens", 0))
+
+    def extract_finish_reason(self, data):
+        return data["completion_message"].get("stop_reason")
+
+
+class GeminiProvider(Provider):
+    """Google Gemini generateContent REST API."""
+
+    name = "gemini"
+    api_key_env = "GEMINI_API_KEY"
+    default_base_url = os.environ.get("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+    supports_streaming = True
+    truncation_reasons = ("MAX_TOKENS",)
+
+    def build_request(self, prompt, stream=False):
+        generation_config = {"temperature": self.temperature}
+        if self.max_tokens is not None:
+            generation_config["maxOutputTokens"] = self.max_tokens
+        body = {"contents": [{"role": "user", "parts": [{"text": prompt}]}],
+                "generationConfig": generation_config}
+        if self.system_msg:
+            body["systemInstruction"] = {"parts": [{"text": self.system_msg}]}
+        headers = {"x-goog-api-key": self.api_key}
+        if stream:
+            return f"{self.base_url}/models/{self.model}:streamGenerateContent?alt=sse", headers, body
+        return f"{self.base_url}/models/{self.model}:generateContent", headers, body
+
+    def extract_text(self, data):
+        candidates = data.get("candidates") or []
+        parts = (candidates[0].get("content") or {}).get("parts") if candidates else None
+        if not parts:
+            if self.extract_finish_reason(data) in self.truncation_reasons:
+                return ""  # the whole budget went to thinking; _finish reports the truncation
+            raise ProviderError(f"Empty response from Gemini: {data.get('promptFeedback')}")
+        return "".join(p.get("text", "") for p in parts)
+
+    def extract_usage(self, data):
+        usage = data.get("usageMetadata")
+        if not usage:
+            return None
+        return usage.get("promptTokenCount", 0), usage.get("candidatesTokenCount", 0)
+
+    def extract_finish_reason(self, data):
+        candidates = data.get("candidates") or []
+        return candidates[0].get("finishReason") if candidates else None
+
+    def extract_stream_chunk(self, chunk):
+        candidates = chunk.get("candidates") or []
+        parts = (candidates[0].get("content") or {}).get("parts") or [] if candidates else []
+        text = "".join(p.get("text", "") for p in parts if not p.get("thought"))
+        return text, self.extract_finish_reason(chunk), self.extract_usage(chunk)
+
+
+PROVIDERS = {
+    "openai": OpenAIProvider,
+    "xai": XAIProvider,
+    "llama": LlamaProvider,
+    "gemini": GeminiProvider,
+}
+# local models living in their own modules, imported on first use
+LOCAL_PROVIDERS = {
+    "ngram": "ngram_model.NgramProvider",
+    "llamacpp": "local_llm.LlamaCppProvider",
+}
+
+
+def provider_class(name: str) -> type:
+    """Adapter class registered under `name` (local providers are imported here)."""
+    if name in LOCAL_PROVIDERS:
+        module, _, cls = LOCAL_PROVIDERS[name].rpartition(".")
+        return getattr(importlib.import_module(module), cls)
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown provider {name!r}; choose from {sorted(PROVIDERS) + sorted(LOCAL_PROVIDERS)}")
+    return PROVIDERS[name]
+
+
+def get_provider(name: str, model: str, **kwargs) -> Provider:
+    """Build a provider by name, e.g. get_provider("xai", "grok-4-latest")."""
+    return provider_class(name)(model, **kwargs)
@@ -0,0 +1,238 @@
+"""
+Adaptive per-provider, per-key rate limiting.
+
+Each (provider, API key) pair shares one RateLimiter holding two token
+buckets: requests/minute and tokens/minute. Callers reserve capacity before
+sending, so a run paces itself right at the provider's quota instead of
+sleeping a fixed interval after every URL. Limits come from configuration
+(`<PROVIDER>_RPM` / `<PROVIDER>_TPM` environment variables) and are learned
+from `x-ratelimit-*` response headers. A 429 pauses every caller sharing the
+key until `Retry-After`, shrinks the rate multiplicatively (at most once per
+second, however many in-flight calls see the same 429) and lets it creep
+back up additively on success (AIMD).
+"""
+
+import os
+import re
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from typing import Mapping, Optional
+
+
+class RateLimitedError(Exception):
+    """The provider throttled us (HTTP 429); `retry_after` is in seconds if known."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None,
+                  base: float = 0.5, cap: float = 60.0) -> float:
+    """Delay before retry number `attempt` (0-based) after a throttle.
+
+    Honors the server's Retry-After when present, otherwise exponential
+    backoff with full jitter.
+    """
+    if retry_after is not None:
+        return min(cap, retry_after) + random.uniform(0, base)
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse '20', '1.5', '20ms', '6m0s' style header values into seconds."""
+    if value is None:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(n) * _DURATION_UNITS[u] for n, u in parts)
+
+
+def retry_after_from_headers(headers: Mapping[str, str]) -> Optional[float]:
+    if headers.get("retry-after-ms") is not None:
+        return float(headers["retry-after-ms"]) / 1000.0
+    return parse_duration(headers.get("retry-after"))
+
+
+# Fraction of the quota we pace at: the provider's own bucket is empty in steady
+# state, so a little slack absorbs scheduling jitter without leaving much unused.
+HEADROOM = 0.95
+
+
+class TokenBucket:
+    """Token bucket whose level may go negative: reservations queue up as debt."""
+
+    def __init__(self, per_minute: Optional[float]):
+        self.nominal = per_minute
+        self.rate = self._target(per_minute)
+        self.capacity = self._capacity(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    @staticmethod
+    def _target(per_minute):
+        return per_minute / 60.0 * HEADROOM if per_minute else None
+
+    @staticmethod
+    def _capacity(per_minute):
+        # allow ~1 second worth of burst
+        return max(1.0, per_minute / 60.0) if per_minute else 0.0
+
+    def set_limit(self, per_minute: float):
+        if per_minute and per_minute != self.nominal:
+            self.nominal = per_minute
+            self.rate = self._target(per_minute)
+            self.capacity = self._capacity(per_minute)
+            self.level = min(self.level, self.capacity)
+
+    def _refill(self, now):
+        if now <= self.updated:
+            return  # paused until `updated` (see pause_until)
+        if self.rate is not None:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take `amount` and return how long the caller must wait before using it."""
+        if self.rate is None:
+            return 0.0
+        self._refill(now)
+        self.level -= amount
+        return max(0.0, -self.level / self.rate) + max(0.0, self.updated - now)
+
+    def pause_until(self, until: float, now: float):
+        """Empty the bucket and stop refilling until `until`, so callers queued
+        behind a Retry-After are released at the normal rate, not all at once."""
+        if self.rate is not None:
+            self._refill(now)
+            self.level = min(self.level, 0.0)
+            self.updated = max(self.updated, until)
+
+    def refund(self, amount: float, now: float):
+        if self.rate is not None:
+            self._refill(now)
+            self.level = min(self.capacity, self.level + amount)
+
+    def clamp(self, remaining: float, now: float):
+        """Never believe we have more headroom than the server says is left."""
+        if self.rate is not None:
+            self._refill(now)
+            self.level = min(self.level, remaining)
+
+    def throttled(self):
+        if self.nominal:
+            self.rate = max(self._target(self.nominal) * 0.1, self.rate * 0.8)
+
+    def succeeded(self):
+        if self.nominal:
+            target = self._target(self.nominal)
+            self.rate = min(target, self.rate + target * 0.01)
+
+
+class RateLimiter:
+    """Requests/minute + tokens/minute limiter shared by all calls on one key."""
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.blocked_until = 0.0
+        self.throttle_count = 0
+        self._last_slowdown = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self.requests.reserve(1, now), self.tokens.reserve(tokens, now))
+            return max(wait, self.blocked_until - now)
+
+    def acquire(self, tokens: int = 0):
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int = 0):
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def settle(self, estimated: int, actual: Optional[int]):
+        """Correct a token reservation once the real usage is known."""
+        if actual is None or actual == estimated:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if actual < estimated:
+                self.tokens.refund(estimated - actual, now)
+            else:
+                self.tokens.reserve(actual - estimated, now)
+
+    def update_from_headers(self, headers: Mapping[str, str]):
+        """Learn limits and remaining quota from x-ratelimit-* headers."""
+        with self._lock:
+            now = time.monotonic()
+            for kind, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+                limit = headers.get(f"x-ratelimit-limit-{kind}")
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                try:
+                    if limit is not None:
+                        bucket.set_limit(float(limit))
+                    if remaining is not None:
+                        bucket.clamp(float(remaining), now)
+                except ValueError:
+                    continue
+
+    def on_success(self):
+        with self._lock:
+            self.requests.succeeded()
+            self.tokens.succeeded()
+
+    def on_throttle(self, retry_after: Optional[float] = None):
+        """A 429 arrived: pause everyone on this key and slow down."""
+        with self._lock:
+            now = time.monotonic()
+            self.throttle_count += 1
+            if now - self._last_slowdown >= 1.0:
+                self._last_slowdown = now
+                self.requests.throttled()
+                self.tokens.throttled()
+            if retry_after is not None:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+                self.requests.pause_until(self.blocked_until, now)
+                self.tokens.pause_until(self.blocked_until, now)
+
+
+_limiters: dict[tuple[str, str], RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def _env_float(name: str) -> Optional[float]:
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+
+def get_rate_limiter(provider: str, api_key: str,
+                     rpm: Optional[float] = None, tpm: Optional[float] = None) -> RateLimiter:
+    """Shared limiter for one provider + key; defaults from $<PROVIDER>_RPM / $<PROVIDER>_TPM."""
+    key = (provider, hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16])
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            prefix = provider.upper()
+            limiter = RateLimiter(rpm if rpm is not None else _env_float(f"{prefix}_RPM"),
+                                  tpm if tpm is not None else _env_float(f"{prefix}_TPM"))
+            _limiters[key] = limiter
+        return limiter
@@ -0,0 +1,193 @@
+"""
+Headless comparison report for every result file in a directory.
+
+Finds `*_results.json` files, joins each one to the labels (evaluation.py),
+renders its ROC, precision-recall and confusion-matrix figures with the
+non-interactive Agg backend in a process pool, and writes one static
+`report.md` + `report.html` with a metrics table and an ROC overlay of all
+models. No display is needed, so it can run right after a batch job:
+
+    python report.py . --data sampled_data_2000_balanced.csv extracted_urls_2000_balanced.csv --out report
+"""
+
+import os
+import sys
+import glob
+import html
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import matplotlib
+if os.environ.get("SHOW_PLOTS", "") not in ("1", "true", "yes"):
+    matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from evaluation import (THRESHOLD, LABEL_MAP, load_predictions, join_predictions, binary_metrics,
+                        threshold_sweep, best_thresholds)
+
+
+def save_or_show(path: str, dpi: int = 150):
+    """Save the current figure to `path`; also open a window only when SHOW_PLOTS=1."""
+    plt.savefig(path, dpi=dpi, bbox_inches="tight")
+    print(f"图表已保存: {path}")
+    if os.environ.get("SHOW_PLOTS", "") in ("1", "true", "yes"):
+        plt.show()
+    plt.close()
+
+
+def find_results(directory: str, pattern: str = "*_results.json") -> list[str]:
+    return sorted(glob.glob(os.path.join(directory, pattern)))
+
+
+def load_label_union(data_files: list[str]) -> pd.DataFrame:
+    """Labels from several data files (first occurrence of a URL wins)."""
+    frames = [pd.read_csv(path, usecols=["url", "type"]) for path in data_files]
+    df = pd.concat(frames, ignore_index=True).drop_duplicates("url")
+    df["label"] = df["type"].map(LABEL_MAP)
+    return df[df["label"].notna()].astype({"label": int}).reset_index(drop=True)
+
+
+def model_name(path: str) -> str:
+    name = os.path.basename(path)
+    for suffix in ("_url_classification_results.json", "_results.json", ".json"):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def _render_one(path: str, labels: pd.DataFrame, out_dir: str, threshold: float, dpi: int) -> Optional[dict]:
+    """Worker: metrics and figures for one result file (None if it matches no labelled URL)."""
+    name = model_name(path)
+    df = join_predictions(labels, load_predictions(path), only_predicted=True)
+    if df.empty or df["label"].nunique() < 2:
+        return None
+    y, scores = df["label"].to_numpy(), df["score"].to_numpy()
+    metrics = binary_metrics(y, scores, threshold)
+    sweep = threshold_sweep(y, scores)
+    best = best_thresholds(sweep)
+    metrics.update(model=name, file=os.path.basename(path),
+                   best_f1=float(best["f1"]["f1"]), best_f1_threshold=float(best["f1"]["threshold"]))
+    # ROC / PR points straight from the sweep, starting at the (0, 0) corner
+    fpr = np.r_[0.0, sweep["fpr"].to_numpy()]
+    tpr = np.r_[0.0, sweep["recall"].to_numpy()]
+    precision, recall = sweep["precision"].to_numpy(), sweep["recall"].to_numpy()
+    figures = {}
+
+    plt.figure(figsize=(6, 5))
+    plt.plot(fpr, tpr, color="darkorange", lw=2, label=f"AUC = {metrics['auroc']:.3f}")
+    plt.plot([0, 1], [0, 1], color="navy", lw=1, linestyle="--")
+    plt.xlabel("False Positive Rate"); plt.ylabel("True Positive Rate")
+    plt.title(f"{name} ROC ({len(df)} URLs)"); plt.legend(loc="lower right")
+    figures["roc"] = f"{name}_roc.png"
+    plt.savefig(os.path.join(out_dir, figures["roc"]), dpi=dpi, bbox_inches="tight"); plt.close()
+
+    plt.figure(figsize=(6, 5))
+    plt.step(recall, precision, where="post", color="seagreen", lw=2)
+    plt.axhline(y.mean(), color="gray", lw=1, linestyle="--", label=f"base rate {y.mean():.2f}")
+    plt.xlabel("Recall"); plt.ylabel("Precision"); plt.ylim(0, 1.05)
+    plt.title(f"{name} Precision-Recall"); plt.legend(loc="lower left")
+    figures["pr"] = f"{name}_pr.png"
+    plt.savefig(os.path.join(out_dir, figures["pr"]), dpi=dpi, bbox_inches="tight"); plt.close()
+
+    cm = np.array([[metrics["tn"], metrics["fp"]], [metrics["fn"], metrics["tp"]]])
+    fig, ax = plt.subplots(figsize=(5, 4.5))
+    ax.imshow(cm, cmap=plt.cm.Blues)
+    for i in range(2):
+        for j in range(2):
+            ax.text(j, i, cm[i, j], ha="center", va="center", fontsize=16,
+                    color="white" if cm[i, j] > cm.max() / 2 else "black")
+    ax.set_xticks([0, 1], ["Benign", "Malicious"]); ax.set_yticks([0, 1], ["Benign", "Malicious"])
+    ax.set_xlabel("Predicted"); ax.set_ylabel("True"); ax.set_title(f"{name} (TH={threshold})")
+    figures["cm"] = f"{name}_cm.png"
+    fig.savefig(os.path.join(out_dir, figures["cm"]), dpi=dpi, bbox_inches="tight"); plt.close(fig)
+
+    metrics["figures"] = figures
+    metrics["roc_points"] = (fpr, tpr)
+    return metrics
+
+
+def _render_overlay(results: list[dict], out_dir: str, dpi: int) -> str:
+    plt.figure(figsize=(7, 6))
+    for m in results:
+        fpr, tpr = m["roc_points"]
+        plt.plot(fpr, tpr, lw=2, label=f"{m['model']} (AUC = {m['auroc']:.3f})")
+    plt.plot([0, 1], [0, 1], color="navy", lw=1, linestyle="--")
+    plt.xlabel("False Positive Rate"); plt.ylabel("True Positive Rate")
+    plt.title("ROC comparison"); plt.legend(loc="lower right", fontsize=8)
+    path = "roc_all.png"
+    plt.savefig(os.path.join(out_dir, path), dpi=dpi, bbox_inches="tight"); plt.close()
+    return path
+
+
+TABLE_COLUMNS = ["model", "n", "auroc", "precision", "recall", "f1", "accuracy", "fpr", "best_f1", "best_f1_threshold"]
+
+
+def write_report(results: list[dict], out_dir: str, threshold: float, overlay: str):
+    table = pd.DataFrame(results)[TABLE_COLUMNS].sort_values("auroc", ascending=False)
+    fmt = {c: "{:.3f}".format for c in TABLE_COLUMNS if c not in ("model", "n")}
+
+    md = [f"# URL classification report\n", f"Threshold: {threshold}\n",
+          "| " + " | ".join(TABLE_COLUMNS) + " |", "|" + "---|" * len(TABLE_COLUMNS)]
+    for _, row in table.iterrows():
+        md.append("| " + " | ".join(fmt[c](row[c]) if c in fmt else str(row[c]) for c in TABLE_COLUMNS) + " |")
+    md.append(f"\n![ROC comparison]({overlay})\n")
+    for m in sorted(results, key=lambda m: -m["auroc"]):
+        f = m["figures"]
+        md.append(f"## {m['model']}\n\n`{m['file']}`\n\n![ROC]({f['roc']}) ![PR]({f['pr']}) ![Confusion matrix]({f['cm']})\n")
+    with open(os.path.join(out_dir, "report.md"), "w", encoding="utf-8") as fh:
+        fh.write("\n".join(md))
+
+    sections = "".join(
+        f"<h2>{html.escape(m['model'])}</h2><p><code>{html.escape(m['file'])}</code></p>"
+        + "".join(f'<img src="{m["figures"][k]}" width="32%">' for k in ("roc", "pr", "cm"))
+        for m in sorted(results, key=lambda m: -m["auroc"]))
+    page = (f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>URL classification report</title>"
+            f"<style>body{{font-family:sans-serif;margin:2em}}table{{border-collapse:collapse}}"
+            f"td,th{{border:1px solid #ccc;padding:4px 8px;text-align:right}}</style></head><body>"
+            f"<h1>URL classification report</h1><p>Threshold: {threshold}</p>"
+            f"{table.to_html(index=False, formatters=fmt)}"
+            f'<p><img src="{overlay}" width="60%"></p>{sections}</body></html>')
+    with open(os.path.join(out_dir, "report.html"), "w", encoding="utf-8") as fh:
+        fh.write(page)
+
+
+def build_report(directory: str, data_files: list[str], out_dir: str = "report",
+                 threshold: float = THRESHOLD, dpi: int = 100, workers: Optional[int] = None,
+                 pattern: str = "*_results.json") -> list[dict]:
+    os.makedirs(out_dir, exist_ok=True)
+    labels = load_label_union(data_files)
+    paths = find_results(directory, pattern)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_render_one, path, labels, out_dir, threshold, dpi) for path in paths]
+        results = [f.result() for f in futures]
+    skipped = [p for p, r in zip(paths, results) if r is None]
+    results = [r for r in results if r is not None]
+    if skipped:
+        print(f"[WARN] 以下结果文件没有匹配到带标签的URL，已跳过: {skipped}")
+    if results:
+        write_report(results, out_dir, threshold, _render_overlay(results, out_dir, dpi))
+    return results
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Render a static HTML/Markdown report for all result files")
+    parser.add_argument("directory", nargs="?", default=".", help="directory with *_results.json files")
+    parser.add_argument("--data", nargs="+", default=["sampled_data_2000_balanced.csv", "extracted_urls_2000_balanced.csv"],
+                        help="labelled CSV file(s) with url,type columns")
+    parser.add_argument("--out", default="report")
+    parser.add_argument("--pattern", default="*_results.json")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    results = build_report(args.directory, args.data, args.out, args.threshold, args.dpi, args.workers, args.pattern)
+    print(f"已生成报告: {os.path.join(args.out, 'report.html')}（{len(results)} 个模型）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Persistent, content-addressed cache of LLM responses (SQLite).
+
+Entries are keyed by a SHA-256 over provider, model, prompt hash, decoding
+parameters and URL, and store the raw response text together with the
+parsed score and reason. Rerunning a script with an unchanged model/prompt
+therefore costs zero API calls, including after a crash halfway through.
+
+Configuration (environment):
+    LLM_CACHE          path of the SQLite file (default llm_cache.sqlite, "off" disables)
+    LLM_CACHE_MODE     "readwrite" (default, read-through) or "refresh" (write only)
+    LLM_CACHE_MAX_ENTRIES / LLM_CACHE_MAX_AGE_DAYS   eviction limits (unset = unlimited)
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional
+
+DEFAULT_CACHE_PATH = "llm_cache.sqlite"
+CACHE_MODES = ("readwrite", "refresh")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key         TEXT PRIMARY KEY,
+    provider    TEXT NOT NULL,
+    model       TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    url         TEXT NOT NULL,
+    raw         TEXT,
+    score       REAL NOT NULL,
+    reason      TEXT,
+    created_at  REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access);
+"""
+
+
+def sha256_text(*parts: str) -> str:
+    h = hashlib.sha256()
+    for p in parts:
+        h.update((p or "").encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def make_key(provider: str, model: str, prompt_hash: str, params: dict, url: str) -> str:
+    """Content address of one call: identical inputs always map to the same key."""
+    return sha256_text(provider, model, prompt_hash, json.dumps(params, sort_keys=True), url)
+
+
+class ResponseCache:
+    """SQLite-backed response cache, safe to share between threads and asyncio tasks."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH,
+                 mode: str = "readwrite",
+                 max_entries: Optional[int] = None,
+                 max_age_days: Optional[float] = None):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"mode must be one of {CACHE_MODES}, got {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self.evict()
+
+    @classmethod
+    def from_env(cls) -> Optional["ResponseCache"]:
+        """Build the cache configured by LLM_CACHE* variables; None when disabled."""
+        path = os.environ.get("LLM_CACHE", DEFAULT_CACHE_PATH)
+        if path.lower() in ("", "off", "0", "none"):
+            return None
+        max_entries = os.environ.get("LLM_CACHE_MAX_ENTRIES")
+        max_age = os.environ.get("LLM_CACHE_MAX_AGE_DAYS")
+        return cls(path,
+                   mode=os.environ.get("LLM_CACHE_MODE", "readwrite"),
+                   max_entries=int(max_entries) if max_entries else None,
+                   max_age_days=float(max_age) if max_age else None)
+
+    def get(self, key: str) -> Optional[tuple[str, float, str]]:
+        """Return (raw, score, reason) or None. Always a miss in "refresh" mode."""
+        if self.mode == "refresh":
+            self.misses += 1
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT raw, score, reason FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+                self._conn.commit()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0], row[1], row[2]
+
+    def put(self, key: str, provider: str, model: str, prompt_hash: str, url: str,
+            raw: str, score: float, reason: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, provider, model, prompt_hash, url, raw, score, reason, now, now))
+            self._conn.commit()
+
+    def evict(self) -> int:
+        """Drop entries older than max_age_days, then least-recently used beyond max_entries."""
+        deleted = 0
+        with self._lock:
+            if self.max_age_days is not None:
+                cutoff = time.time() - self.max_age_days * 86400
+                deleted += self._conn.execute(
+                    "DELETE FROM responses WHERE created_at < ?", (cutoff,)).rowcount
+            if self.max_entries is not None:
+                deleted += self._conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    " SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)).rowcount
+            self._conn.commit()
+        return deleted
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,132 @@
+"""
+Append-only, crash-safe journal for long inference runs.
+
+Every completed URL is appended as one JSON line; the file is flushed and
+fsync'ed in batches (every `fsync_every` records or `fsync_interval`
+seconds), so write cost is O(1) per URL instead of rewriting the whole
+result dict on each checkpoint. After a crash, `load()` returns everything
+that reached the disk and the run continues from there; a torn last line is
+discarded, and URLs journaled as failures are tried again. `compact()` turns the journal into the usual `{url: score}` /
+`{url: reason}` JSON files. URLs that could not be scored (reason "Error: ...",
+score None) are left out of both and listed in `<output_file>.failures.json`
+instead, so a failed call never shows up as a mid-range score.
+"""
+
+import os
+import json
+import time
+from typing import Optional
+
+# reason prefix of URLs that could not be scored (provider errors, truncated responses)
+ERROR_PREFIX = "Error:"
+
+
+def is_failure(reason) -> bool:
+    return str(reason or "").startswith(ERROR_PREFIX)
+
+
+def failures_file(output_file: str) -> str:
+    """`{url: error}` of the URLs a run could not score, written next to its results."""
+    return output_file + ".failures.json"
+
+
+def write_failures(output_file: str, failures: dict):
+    """Write failures_file(output_file), or remove a stale one when every URL was scored."""
+    path = failures_file(output_file)
+    if failures:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(failures, f, ensure_ascii=False, indent=2)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+class RunJournal:
+    def __init__(self, path: str, fsync_every: int = 50, fsync_interval: float = 1.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._file = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def load(self) -> dict:
+        """Return {url: record} for every complete line already in the journal.
+
+        The last record of a URL wins, except that a failure never replaces a score.
+        """
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn write from a crash; the URL is simply redone
+                prev = records.get(rec["url"])
+                if prev is not None and is_failure(rec.get("reason")) and not is_failure(prev.get("reason")):
+                    continue
+                records[rec["url"]] = rec
+        return records
+
+    def _open(self):
+        # Drop a partial trailing line so the next append starts on a fresh line.
+        if os.path.exists(self.path):
+            with open(self.path, 'rb+') as f:
+                data = f.read()
+                if data and not data.endswith(b"\n"):
+                    f.truncate(data.rfind(b"\n") + 1)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def append(self, url: str, score: Optional[float], reason: str = "", **extra):
+        if self._file is None:
+            self._open()
+        rec = {"url": url, "score": score, "reason": reason, **extra}
+        self._file.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        self._pending += 1
+        if self._pending >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        """Flush buffered records and fsync them to disk."""
+        if self._file is None or self._pending == 0:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def compact(self, output_file: str, reasons_file: Optional[str] = None,
+                aliases: Optional[dict] = None) -> dict:
+        """Write the journal as the legacy result JSON files; returns {url: score}.
+
+        aliases: {url: representative url}; each alias gets its representative's record.
+        Failed URLs go to failures_file(output_file), not to the score/reason files.
+        """
+        self.close()
+        records = self.load()
+        for url, rep in (aliases or {}).items():
+            if rep in records:
+                records[url] = records[rep]
+        failures = {url: rec.get("reason", "") for url, rec in records.items() if is_failure(rec.get("reason"))}
+        records = {url: rec for url, rec in records.items() if url not in failures}
+        result_dict = {url: rec["score"] for url, rec in records.items()}
+        with open(output_file, 'w') as f:
+            json.dump(result_dict, f, indent=2)
+        if reasons_file:
+            with open(reasons_file, 'w', encoding='utf-8') as f:
+                json.dump({url: rec.get("reason", "") for url, rec in records.items()},
+                          f, ensure_ascii=False, indent=2)
+        write_failures(output_file, failures)
+        return result_dict
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
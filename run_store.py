@@ -0,0 +1,249 @@
+"""
+Columnar run store: every scored URL of every run in one Parquet dataset.
+
+One row per (run, URL) with provider, model, prompt hash, url, canonical url,
+score, reason, latency, tokens and error, partitioned by run under
+`<root>/run_id=<id>/part-0.parquet` (hive layout, rows sorted by canonical
+URL). Reads go through a memory-mapped `pyarrow.dataset`, so selecting a few
+runs or URLs only touches the matching partitions and row groups, and a
+cross-model comparison is one scan of the `canonical_url, run_id, score`
+columns instead of loading and re-joining whole JSON files.
+
+Runs get in either from inference (set `INFERENCE_RUN_STORE=runs`, see
+inference_runner.py) or by importing existing result files together with
+their `*_reasons.json` and `.metrics.jsonl` when present:
+
+    python run_store.py import                      # all *_results.json in the current directory
+    python run_store.py runs
+    python run_store.py compare sampled_data_2000_balanced.csv
+"""
+
+import os
+import sys
+import glob
+import json
+import shutil
+import argparse
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+from url_canon import canonicalize
+from run_journal import ERROR_PREFIX, failures_file
+
+DEFAULT_ROOT = "runs"
+
+SCHEMA = pa.schema([
+    ("provider", pa.string()),
+    ("model", pa.string()),
+    ("prompt_hash", pa.string()),
+    ("url", pa.string()),
+    ("canonical_url", pa.string()),
+    ("score", pa.float64()),
+    ("reason", pa.string()),
+    ("latency_s", pa.float64()),
+    ("prompt_tokens", pa.int64()),
+    ("completion_tokens", pa.int64()),
+    ("cached", pa.bool_()),
+    ("error", pa.string()),
+])
+PARTITIONING = ds.partitioning(pa.schema([("run_id", pa.string())]), flavor="hive")
+
+# provider / model of result files without metrics (written before the store existed, or by ngram_model.py)
+LEGACY_RUNS = {
+    "openai_100": ("openai", "gpt-4o-mini"),
+    "url_classification": ("openai", "gpt-4o-mini"),
+    "gemini_100": ("gemini", "gemini-1.5-flash"),
+    "gemini_url_classification": ("gemini", "gemini-2.5-pro"),
+    "grok_url_classification": ("xai", "grok-4-latest"),
+    "llama_url_classification": ("llama", "Llama-4-Maverick-17B-128E-Instruct-FP8"),
+    "claude_url_classification": ("anthropic", "claude"),
+    "claudehaiku_url_classification": ("anthropic", "claude-haiku"),
+    "claudehaiku_url_Cot_classification": ("anthropic", "claude-haiku"),
+    "claudehaiku_100": ("anthropic", "claude-haiku"),
+    "ngram_url_classification": ("ngram", "ngram_model.npz"),
+}
+
+
+def run_id_for(results_file: str) -> str:
+    """`llama_url_classification_results.json` -> `llama_url_classification`."""
+    name = os.path.basename(results_file)
+    for suffix in (".json", "_results"):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return name
+
+
+def _load_json(path: Optional[str]) -> dict:
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _metrics_frame(metrics_file: Optional[str]) -> pd.DataFrame:
+    """Last call record per URL from a metrics.jsonl file (batch calls carry only their first URL)."""
+    if not metrics_file or not os.path.exists(metrics_file):
+        return pd.DataFrame(columns=["url"])
+    from call_metrics import load_metrics
+    df = pd.DataFrame(load_metrics(metrics_file))
+    cols = [c for c in ("url", "provider", "model", "latency_s", "prompt_tokens", "completion_tokens", "cached", "error")
+            if c in df.columns]
+    return df[cols].drop_duplicates("url", keep="last")
+
+
+def build_frame(scores: dict, reasons: Optional[dict] = None, metrics: Optional[pd.DataFrame] = None,
+                provider: Optional[str] = None, model: Optional[str] = None,
+                prompt_hash: Optional[str] = None, failures: Optional[dict] = None) -> pd.DataFrame:
+    """Store rows for one run from `{url: score}`, `{url: reason}`, `{url: error}` and per-call metrics."""
+    failures = {url: e for url, e in (failures or {}).items() if url not in scores}
+    df = pd.DataFrame({"url": pd.Series(list(scores) + list(failures), dtype=object),
+                       "score": pd.to_numeric(pd.Series(list(scores.values()) + [None] * len(failures)),
+                                              errors="coerce")})
+    df["canonical_url"] = canonicalize(df["url"].astype(str))
+    df["reason"] = df["url"].map({**(reasons or {}), **failures})
+    if metrics is not None and len(metrics):
+        provider = provider or next(iter(metrics.get("provider", pd.Series(dtype=object)).dropna()), None)
+        model = model or next(iter(metrics.get("model", pd.Series(dtype=object)).dropna()), None)
+        df = df.merge(metrics.drop(columns=["provider", "model"], errors="ignore"), on="url", how="left")
+    df["provider"], df["model"], df["prompt_hash"] = provider, model, prompt_hash
+    # reasons of failed calls are "Error: ..." (see run_journal.py); older result files scored them 0.5
+    failed = df["reason"].fillna("").str.startswith(ERROR_PREFIX)
+    df.loc[failed, "score"] = np.nan
+    if "error" not in df:
+        df["error"] = None
+    df["error"] = df["error"].fillna(df["reason"].where(failed))
+    for col in SCHEMA.names:
+        if col not in df:
+            df[col] = None
+    return df[SCHEMA.names]
+
+
+class RunStore:
+    def __init__(self, root: str = DEFAULT_ROOT):
+        self.root = root
+        self._fs = fs.LocalFileSystem(use_mmap=True)
+
+    def _run_dir(self, run_id: str) -> str:
+        return os.path.join(self.root, f"run_id={run_id}")
+
+    def write_run(self, run_id: str, frame: pd.DataFrame) -> str:
+        """Write (or replace) one run's partition; returns its file path."""
+        table = pa.Table.from_pandas(frame.sort_values("canonical_url", kind="mergesort"),
+                                     schema=SCHEMA, preserve_index=False)
+        run_dir = self._run_dir(run_id)
+        tmp_dir = os.path.join(self.root, f".tmp-{run_id}")  # dot-prefixed dirs are skipped by scans
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        pq.write_table(table, os.path.join(tmp_dir, "part-0.parquet"), row_group_size=64_000)
+        shutil.rmtree(run_dir, ignore_errors=True)
+        os.replace(tmp_dir, run_dir)
+        return os.path.join(run_dir, "part-0.parquet")
+
+    def import_results(self, results_file: str, reasons_file: Optional[str] = None,
+                       metrics_file: Optional[str] = None, run_id: Optional[str] = None,
+                       provider: Optional[str] = None, model: Optional[str] = None,
+                       prompt_hash: Optional[str] = None) -> str:
+        """Import one `{url: score}` file; reasons/metrics/failures default to the files written next to it."""
+        run_id = run_id or run_id_for(results_file)
+        if reasons_file is None:
+            reasons_file = results_file.replace("_results.json", "_reasons.json")
+        if metrics_file is None:
+            metrics_file = results_file + ".metrics.jsonl"
+        legacy = LEGACY_RUNS.get(run_id, (None, None))
+        frame = build_frame(_load_json(results_file), _load_json(reasons_file), _metrics_frame(metrics_file),
+                            provider or legacy[0], model or legacy[1], prompt_hash,
+                            _load_json(failures_file(results_file)))
+        self.write_run(run_id, frame)
+        return run_id
+
+    def import_directory(self, directory: str = ".", pattern: str = "*_results.json") -> list[str]:
+        return [self.import_results(path) for path in sorted(glob.glob(os.path.join(directory, pattern)))]
+
+    def dataset(self) -> ds.Dataset:
+        return ds.dataset(self.root, schema=SCHEMA.append(pa.field("run_id", pa.string())), format="parquet",
+                          partitioning=PARTITIONING, filesystem=self._fs)
+
+    def scan(self, columns: Optional[list[str]] = None, run_ids: Optional[list[str]] = None,
+             urls: Optional[list[str]] = None, filter: Optional[ds.Expression] = None) -> pa.Table:
+        """Rows of the selected runs / canonical URLs; filters are pushed down to the scan."""
+        expr = filter
+        for column, values in (("run_id", run_ids), ("canonical_url", urls)):
+            if values is not None:
+                cond = ds.field(column).isin(list(values))
+                expr = cond if expr is None else expr & cond
+        if not os.path.isdir(self.root):
+            empty = SCHEMA.append(pa.field("run_id", pa.string())).empty_table()
+            return empty.select(columns) if columns else empty
+        return self.dataset().to_table(columns=columns, filter=expr)
+
+    def runs(self) -> pd.DataFrame:
+        """One row per run: provider, model, rows, errors, mean score and latency."""
+        df = self.scan(["run_id", "provider", "model", "score", "latency_s", "error"]).to_pandas()
+        if df.empty:
+            return pd.DataFrame()
+        return (df.assign(failed=df["error"].notna())
+                  .groupby("run_id")
+                  .agg(provider=("provider", "first"), model=("model", "first"), rows=("score", "size"),
+                       errors=("failed", "sum"), mean_score=("score", "mean"), latency_p50=("latency_s", "median")))
+
+    def scores(self, run_ids: Optional[list[str]] = None) -> pd.DataFrame:
+        """Wide table: one row per canonical URL, one score column per run."""
+        df = self.scan(["run_id", "canonical_url", "score"], run_ids).to_pandas()
+        return df.pivot_table(index="canonical_url", columns="run_id", values="score", aggfunc="first")
+
+
+def compare(store: RunStore, data_file: str, run_ids: Optional[list[str]] = None,
+            threshold: Optional[float] = None) -> pd.DataFrame:
+    """Metrics of every run on the labelled rows it scored, from one scan of the store."""
+    from evaluation import THRESHOLD, load_labels, binary_metrics
+    threshold = THRESHOLD if threshold is None else threshold
+    labels = load_labels(data_file)
+    labels["canonical_url"] = canonicalize(labels["url"].astype(str))
+    labels = labels.drop_duplicates("canonical_url")
+    wide = store.scores(run_ids).reindex(labels["canonical_url"])
+    y = labels["label"].to_numpy()
+    rows = {}
+    for run_id in wide.columns:
+        s = wide[run_id].to_numpy()
+        mask = ~np.isnan(s)
+        if mask.sum() and len(np.unique(y[mask])) == 2:
+            m = binary_metrics(y[mask], np.clip(s[mask], 0.0, 1.0), threshold)
+            rows[run_id] = {k: m[k] for k in ("n", "auroc", "precision", "recall", "f1", "fpr")}
+    if not rows:
+        return pd.DataFrame()
+    return pd.DataFrame(rows).T.astype({"n": int}).sort_values("auroc", ascending=False)
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Columnar store of all inference runs")
+    parser.add_argument("command", choices=["import", "runs", "compare"])
+    parser.add_argument("paths", nargs="*",
+                        help="import: result JSON files (default: all *_results.json); compare: labelled CSV")
+    parser.add_argument("--store", default=os.environ.get("INFERENCE_RUN_STORE") or DEFAULT_ROOT)
+    parser.add_argument("--runs", nargs="+", default=None, help="only these run ids")
+    parser.add_argument("--threshold", type=float, default=None)
+    args = parser.parse_args(argv)
+
+    store = RunStore(args.store)
+    pd.set_option("display.width", 200)
+    if args.command == "import":
+        run_ids = [store.import_results(p) for p in args.paths] if args.paths else store.import_directory(".")
+        print(f"已导入 {len(run_ids)} 个运行到 {args.store}: {run_ids}")
+    elif args.command == "runs":
+        print(store.runs().to_string(float_format=lambda v: f"{v:.3f}"))
+    else:
+        if not args.paths:
+            print("用法: python run_store.py compare <data.csv> [--runs ID ...]")
+            return 1
+        print(compare(store, args.paths[0], args.runs, args.threshold).to_string(float_format=lambda v: f"{v:.3f}"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+"""
+Deterministic stratified sampling of labelled URLs from arbitrarily large inputs.
+
+Reproduces the `*_balanced.csv` / `*_balanced_shuffled.csv` datasets at any
+size in one pass over CSV files or Parquet parts (streamed in batches, see
+parquet_ingest.py), without loading the source into memory. Every row gets a
+random key from a seeded generator in stream order and each label class keeps
+the rows with the smallest keys (bottom-k reservoir sampling, vectorized per
+batch), so memory is bounded by the sample size, the same seed and inputs
+always give the same sample, and a 2k sample is a subset of the 20k one.
+
+Class quotas come from target ratios (largest remainder rounding); a class
+with too few rows contributes all of them and is reported as short. The
+output is grouped by class; `--shuffle` also writes a deterministically
+shuffled copy, and a `<out>.manifest.json` records the seed, ratios, counts
+and SHA-256 of every input and output file.
+
+    python sampler.py DeepURLBench-main/urls_with_dns --n 20000 --out sampled_data_20000_balanced.csv --shuffle
+    python sampler.py big.csv --n 2000 --ratios benign=0.5,mal=0.5 --out extracted_urls_2000_balanced.csv
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+# class mix of sampled_data_2000_balanced.csv
+DEFAULT_RATIOS = {"benign": 0.5, "phishing": 0.3, "defacement": 0.125, "malware": 0.075}
+ALL = "*"
+CSV_CHUNK_ROWS = 100_000
+
+
+def parse_ratios(spec: Optional[str]) -> dict:
+    """"benign=0.5,phishing=0.3" -> {class: share} normalized to sum to 1."""
+    if not spec:
+        return dict(DEFAULT_RATIOS)
+    ratios = {}
+    for part in spec.split(","):
+        name, _, value = part.partition("=")
+        ratios[name.strip()] = float(value)
+    total = sum(ratios.values())
+    if total <= 0 or any(v < 0 for v in ratios.values()):
+        raise ValueError(f"无效的类别比例: {spec}")
+    return {name: v / total for name, v in ratios.items()}
+
+
+def allocate(n: int, ratios: dict) -> dict:
+    """Integer quota per class summing to n (largest remainder)."""
+    raw = {name: n * share for name, share in ratios.items()}
+    quotas = {name: int(v) for name, v in raw.items()}
+    rest = n - sum(quotas.values())
+    for name in sorted(raw, key=lambda k: quotas[k] - raw[k])[:rest]:
+        quotas[name] += 1
+    return quotas
+
+
+def iter_batches(source, batch_rows: int = CSV_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """url,type DataFrames from CSV file(s) or Parquet file(s)/directory/glob."""
+    sources = [source] if isinstance(source, str) else list(source)
+    for src in sources:
+        if src.lower().endswith(".csv"):
+            for chunk in pd.read_csv(src, usecols=["url", "type"], dtype=str, chunksize=batch_rows):
+                yield chunk.dropna(subset=["url"]).fillna({"type": "unknown"})
+        else:
+            from parquet_ingest import open_dataset, detect_columns, iter_url_batches
+            dataset = open_dataset(src)
+            url_column, label_column = detect_columns(dataset.schema)
+            for table in iter_url_batches(dataset, url_column, label_column, batch_rows):
+                yield table.to_pandas()
+
+
+class StratifiedReservoir:
+    """Bottom-k sample per class over a stream of url,type batches.
+
+    quotas maps class -> sample size; the class `*` samples uniformly from
+    all rows regardless of label.
+    """
+
+    def __init__(self, quotas: dict, seed: int = 42):
+        self.quotas = {name: q for name, q in quotas.items() if q > 0}
+        self.rng = np.random.default_rng(seed)
+        self.seen = {}
+        self._keys = {name: [np.empty(0)] for name in self.quotas}
+        self._rows = {name: [] for name in self.quotas}
+        self._pending = dict.fromkeys(self.quotas, 0)
+        self._cutoff = dict.fromkeys(self.quotas, np.inf)
+
+    def _compact(self, name: str):
+        keys = np.concatenate(self._keys[name])
+        rows = pd.concat(self._rows[name], ignore_index=True) if self._rows[name] else pd.DataFrame()
+        q = self.quotas[name]
+        if len(keys) > q:
+            keep = np.argpartition(keys, q - 1)[:q]
+            keys, rows = keys[keep], rows.iloc[keep].reset_index(drop=True)
+            self._cutoff[name] = keys.max()
+        self._keys[name], self._rows[name], self._pending[name] = [keys], [rows], len(keys)
+
+    def add(self, batch: pd.DataFrame):
+        keys = self.rng.random(len(batch))
+        labels = batch["type"].to_numpy()
+        for label, n in batch["type"].value_counts().items():
+            self.seen[label] = self.seen.get(label, 0) + int(n)
+        for name, q in self.quotas.items():
+            mask = keys < self._cutoff[name]
+            if name != ALL:
+                mask &= labels == name
+            if not mask.any():
+                continue
+            self._keys[name].append(keys[mask])
+            self._rows[name].append(batch.loc[mask, ["url", "type"]])
+            self._pending[name] += int(mask.sum())
+            if self._pending[name] > 2 * q:
+                self._compact(name)
+
+    def result(self) -> pd.DataFrame:
+        """The sample, grouped by class in quota order, each class in key order."""
+        frames = []
+        for name in self.quotas:
+            self._compact(name)
+            keys, rows = self._keys[name][0], self._rows[name][0]
+            if len(rows):
+                frames.append(rows.iloc[np.argsort(keys, kind="stable")])
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["url", "type"])
+
+
+def sample(source, n: int, ratios: Optional[dict] = None, seed: int = 42,
+           batch_rows: int = CSV_CHUNK_ROWS) -> tuple[pd.DataFrame, StratifiedReservoir]:
+    """Stratified sample of n rows (uniform over all rows when ratios is None)."""
+    quotas = allocate(n, ratios) if ratios else {ALL: n}
+    reservoir = StratifiedReservoir(quotas, seed)
+    for batch in iter_batches(source, batch_rows):
+        reservoir.add(batch)
+    return reservoir.result(), reservoir
+
+
+def shuffled(df: pd.DataFrame, seed: int = 42) -> pd.DataFrame:
+    """Deterministic row shuffle (independent of the sampling stream)."""
+    order = np.random.default_rng([seed, 1]).permutation(len(df))
+    return df.iloc[order].reset_index(drop=True)
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def write_manifest(path: str, sources: list[str], outputs: list[str], n: int, ratios: Optional[dict],
+                   seed: int, reservoir: StratifiedReservoir, result: pd.DataFrame):
+    from parquet_ingest import resolve_sources
+    inputs = []
+    for src in sources:
+        files = [src] if src.lower().endswith(".csv") else resolve_sources(src)
+        inputs += [{"path": f, "bytes": os.path.getsize(f), "sha256": file_sha256(f)} for f in files]
+    taken = result["type"].value_counts().to_dict() if len(result) else {}
+    short = {name: {"quota": q, "taken": taken.get(name, 0)} for name, q in reservoir.quotas.items()
+             if name != ALL and taken.get(name, 0) < q}
+    manifest = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "n": n, "rows": len(result), "seed": seed, "ratios": ratios,
+        "quotas": reservoir.quotas, "seen": reservoir.seen, "taken": taken, "short": short,
+        "inputs": inputs,
+        "outputs": [{"path": p, "rows": len(result), "sha256": file_sha256(p)} for p in outputs],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Deterministic stratified sample of url,type rows")
+    parser.add_argument("source", nargs="+", help="CSV file(s), or Parquet file(s)/directory/glob")
+    parser.add_argument("--n", type=int, default=2000, help="sample size")
+    parser.add_argument("--ratios", default=None,
+                        help="class shares, e.g. benign=0.5,phishing=0.3,defacement=0.125,malware=0.075 (default)")
+    parser.add_argument("--uniform", action="store_true", help="ignore labels and sample uniformly")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=None, help="default: sampled_data_<n>_balanced.csv")
+    parser.add_argument("--shuffle", action="store_true", help="also write <out>_shuffled.csv")
+    args = parser.parse_args(argv)
+
+    try:
+        ratios = None if args.uniform else parse_ratios(args.ratios)
+    except ValueError as e:
+        print(f"错误: {e}")
+        return 1
+    out = args.out or f"sampled_data_{args.n}_balanced.csv"
+    result, reservoir = sample(args.source, args.n, ratios, args.seed)
+    result.to_csv(out, index=False)
+    outputs = [out]
+    if args.shuffle:
+        shuffled_out = os.path.splitext(out)[0] + "_shuffled.csv"
+        shuffled(result, args.seed).to_csv(shuffled_out, index=False)
+        outputs.append(shuffled_out)
+
+    manifest = write_manifest(out + ".manifest.json", args.source, outputs, args.n, ratios, args.seed, reservoir, result)
+    print(f"扫描 {sum(reservoir.seen.values())} 行，采样 {len(result)} 行 -> {', '.join(outputs)}")
+    total = sum(reservoir.seen.values())
+    for name, q in reservoir.quotas.items():
+        taken = len(result) if name == ALL else manifest["taken"].get(name, 0)
+        seen = total if name == ALL else reservoir.seen.get(name, 0)
+        print(f"  {name}: {taken}/{q}（源数据 {seen}）")
+    if manifest["short"]:
+        print(f"[WARN] 以下类别的源数据不足，已全部采用: {list(manifest['short'])}")
+    print(f"清单: {out}.manifest.json")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+URL canonicalization and deduplication.
+
+The datasets mix `http://example.com`, scheme-less `example.com/path`,
+upper-case hosts, `:80` ports, trailing slashes and needless
+percent-escapes, so the same URL can be scored twice and can fail to join
+against a `{url: score}` result file. `canonical_url()` maps every spelling
+to one key:
+
+- missing scheme -> http, scheme and host lower-cased
+- IDN hosts -> IDNA (punycode), trailing dot removed; IPv6 hosts keep their brackets
+- default ports (:80 for http, :443 for https) removed
+- percent-escapes of unreserved characters decoded, the rest upper-cased
+- trailing slash and fragment removed
+
+`www.` is kept by default (strip_www=True folds it as well). Inference scores
+one representative spelling per key and `dedupe()` fans the score back out to
+every original row; evaluation uses `match_scores()` to join on the key.
+
+    python url_canon.py extracted_urls_2000_balanced.csv
+    python -m doctest url_canon.py          # canonicalization examples
+"""
+
+import re
+import sys
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit
+
+import pandas as pd
+
+DEFAULT_PORTS = {"http": "80", "https": "443", "ftp": "21"}
+_SCHEME = re.compile(r'^[a-zA-Z][a-zA-Z0-9+.-]*://')
+_ESCAPE = re.compile(r'%([0-9a-fA-F]{2})')
+_UNRESERVED = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+
+
+def _normalize_escapes(s: str) -> str:
+    def fix(m):
+        ch = chr(int(m.group(1), 16))
+        return ch if ch in _UNRESERVED else "%" + m.group(1).upper()
+    return _ESCAPE.sub(fix, s)
+
+
+def _idna(host: str) -> str:
+    if host.isascii():
+        return host
+    try:
+        return host.encode("idna").decode("ascii")
+    except UnicodeError:
+        return host
+
+
+@lru_cache(maxsize=1 << 16)
+def canonical_url(url: str, strip_www: bool = False) -> str:
+    """Canonical key for `url`; unparseable input is returned stripped.
+
+    >>> canonical_url("HTTP://Example.COM:80/a/%7euser/")
+    'http://example.com/a/~user'
+    >>> canonical_url("http://[::1]:80/")
+    'http://[::1]'
+    >>> canonical_url("https://[2001:DB8::1]:8443/x")
+    'https://[2001:db8::1]:8443/x'
+    """
+    url = url.strip()
+    raw = url if _SCHEME.match(url) else "http://" + url
+    try:
+        parts = urlsplit(raw)
+        scheme = parts.scheme.lower()
+        host = _idna((parts.hostname or "").rstrip("."))
+        port = parts.port
+    except ValueError:
+        return url
+    if strip_www and host.startswith("www."):
+        host = host[4:]
+    # urlsplit drops the brackets of IPv6 literals; without them the port is ambiguous
+    netloc = f"[{host}]" if ":" in host else host
+    if port is not None and str(port) != DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{port}"
+    if parts.username is not None:
+        userinfo = parts.username + (f":{parts.password}" if parts.password is not None else "")
+        netloc = f"{userinfo}@{netloc}"
+    path = _normalize_escapes(parts.path).rstrip("/")
+    query = _normalize_escapes(parts.query)
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def canonicalize(urls: pd.Series, strip_www: bool = False) -> pd.Series:
+    """Canonical key of every URL in a Series (same index)."""
+    return pd.Series([canonical_url(str(u), strip_www) for u in urls], index=urls.index, dtype=object)
+
+
+def dedupe(urls: pd.Series, strip_www: bool = False) -> dict:
+    """{url: representative url} for every URL whose key was already seen;
+    the representative is the first spelling of each key."""
+    keys = canonicalize(urls, strip_www)
+    first = {}
+    aliases = {}
+    for url, key in zip(urls, keys):
+        rep = first.setdefault(key, url)
+        if rep != url:
+            aliases[url] = rep
+    return aliases
+
+
+def match_scores(urls: pd.Series, predictions: dict, strip_www: bool = False) -> pd.Series:
+    """Scores for `urls` from a `{url: score}` dict: exact key first, then the
+    canonical key. Unmatched URLs are NaN."""
+    exact = urls.map(predictions)
+    missing = exact.isna()
+    if missing.any():
+        by_key = {}
+        for url, score in predictions.items():
+            by_key.setdefault(canonical_url(str(url), strip_www), score)
+        exact[missing] = canonicalize(urls[missing], strip_www).map(by_key)
+    return pd.to_numeric(exact, errors="coerce")
+
+
+def main(argv: Optional[list[str]] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print("用法: python url_canon.py <data.csv> [--strip-www]")
+        return 1
+    strip_www = "--strip-www" in argv
+    df = pd.read_csv(argv[0])
+    keys = canonicalize(df['url'], strip_www)
+    print(f"行数: {len(df)}  不同URL字符串: {df['url'].nunique()}  规范化后不同URL: {keys.nunique()}")
+    dup = df.assign(canonical=keys)[keys.duplicated(keep=False)].sort_values("canonical")
+    conflicts = dup.groupby("canonical")["type"].nunique() if "type" in dup.columns else pd.Series(dtype=int)
+    if (conflicts > 1).any():
+        print(f"标签冲突的规范URL: {int((conflicts > 1).sum())}")
+    for key, group in list(dup.groupby("canonical"))[:10]:
+        print(f"{key}: {group['url'].tolist()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
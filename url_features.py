@@ -0,0 +1,383 @@
+"""
+Vectorized lexical URL features and a fast pre-filter in front of the LLM.
+
+`extract_features()` computes the signals the prompt asks the model to look
+for (high-entropy hosts, risky TLDs, raw-IP hosts, CMS query strings,
+executable downloads, brand keywords outside their brand's domain, ...) for a
+whole column of URLs with pandas string ops and NumPy, without a Python loop
+per URL. `LexicalScorer` turns them into a maliciousness score; URLs it is
+highly confident about can skip the LLM, and only the uncertain band is
+forwarded to the provider.
+
+The pre-filter only uses a scorer fitted on labelled data whose band was
+calibrated on held-out URLs to a target precision (`calibrate()`): URLs at
+or below `low` are benign and at or above `high` malicious with at least
+that precision. The hand-set DEFAULT_WEIGHTS are an uncalibrated baseline
+for the report and never skip LLM calls.
+
+    python url_features.py sampled_data_2000_balanced.csv --fit extracted_urls_2000_balanced.csv --save lexical_scorer.json
+    python url_features.py sampled_data_2000_balanced.csv --model lexical_scorer.json --llm-results claude_url_classification_results.json
+    python url_features.py pq/part-00000.parquet
+"""
+
+import os
+import sys
+import json
+import argparse
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+RISKY_TLDS = [
+    "tk", "ml", "ga", "cf", "gq", "xyz", "top", "club", "online", "site", "website", "space",
+    "pw", "cc", "su", "ws", "work", "click", "link", "loan", "win", "bid", "review", "party",
+    "date", "download", "racing", "stream", "trade", "webcam", "men", "icu", "buzz", "rest", "fit",
+]
+SHORTENERS = [
+    "bit.ly", "goo.gl", "tinyurl.com", "t.co", "ow.ly", "is.gd", "buff.ly", "adf.ly", "cutt.ly",
+    "rebrand.ly", "shorturl.at", "tiny.cc", "bitly.com",
+]
+# Free hosting / cloud storage commonly abused to host phishing kits and payloads
+CLOUD_HOSTS = (r"(?:drive|docs)\.google\.com|firebasestorage\.googleapis\.com|storage\.googleapis\.com|"
+               r"dropbox\.com|dropboxusercontent\.com|onedrive\.live\.com|1drv\.ms|sharepoint\.com|"
+               r"blob\.core\.windows\.net|s3[.-][a-z0-9-]*\.?amazonaws\.com|000webhostapp\.com|"
+               r"weebly\.com|wixsite\.com|pe\.hu|ipfs\.|github\.io|web\.app|firebaseapp\.com")
+BRANDS = ["paypal", "apple", "icloud", "microsoft", "office365", "outlook", "onedrive", "google",
+          "gmail", "facebook", "instagram", "whatsapp", "amazon", "netflix", "ebay", "dhl", "fedex",
+          "chase", "wellsfargo", "bankofamerica", "boa", "hsbc", "santander", "itau", "bradesco",
+          "adobe", "dropbox", "docusign", "linkedin", "yahoo", "steam", "coinbase", "binance", "orange"]
+CREDENTIAL_WORDS = (r"login|log-in|signin|sign-in|logon|verify|verification|account|secure|update|"
+                    r"confirm|banking|webscr|password|wallet|unlock|suspend|billing|authenticate")
+CMS_PATTERN = (r"option=com_|[?&]itemid=|index\.php\?|/components?/com_|wp-(?:content|includes|admin)|"
+               r"/administrator/|tmpl=component|view=article")
+EXECUTABLE_PATTERN = (r"\.(?:exe|scr|msi|dll|bat|cmd|ps1|vbs|jar|apk|bin|sh|elf|zip|rar|7z|iso|img|doc[mx]?|xls[mx]?)(?:$|[?#])|"
+                      r"/(?:i[3-6]86|x86(?:_64)?|arm[4-7]?|mips|mpsl|sh4|ppc|m68k|spc)$|"
+                      r"[?&](?:export=download|download=)")
+
+DEFAULT_SCORER_PATH = "lexical_scorer.json"
+DEFAULT_PRECISION = 0.95
+
+_URL_PARTS = r'^(?:(?P<scheme>[a-zA-Z][a-zA-Z0-9+.-]*)://)?(?P<host>[^/?#:]*)(?::(?P<port>\d+))?(?P<path>[^?#]*)(?:\?(?P<query>[^#]*))?'
+
+FEATURES = [
+    "url_len", "host_len", "path_len", "query_len", "is_https", "has_scheme", "is_ip_host", "has_port",
+    "subdomain_depth", "host_entropy", "host_digit_ratio", "host_hyphens", "path_depth", "num_params",
+    "pct_encoded", "has_at", "risky_tld", "shortener", "cloud_host", "cms_query", "executable",
+    "brand_in_path", "brand_mismatch", "credential_words", "www",
+]
+
+
+def load_urls(path: str, url_column: Optional[str] = None, label_column: Optional[str] = None) -> pd.DataFrame:
+    """Read a CSV or Parquet file as `url` (and `type`) columns; Parquet reads only those
+    two columns, found like parquet_ingest does (e.g. URL/label)."""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        from parquet_ingest import detect_columns
+        url_column, label_column = detect_columns(pq.read_schema(path), url_column, label_column)
+        df = pd.read_parquet(path, columns=[c for c in (url_column, label_column) if c])
+        return df.rename(columns={url_column: "url", label_column: "type"})
+    return pd.read_csv(path)
+
+
+def labelled(df: pd.DataFrame) -> tuple[pd.DataFrame, np.ndarray]:
+    """Rows with a known `type` and their labels (1 = malicious, evaluation.LABEL_MAP)."""
+    from evaluation import LABEL_MAP
+    if "type" not in df.columns:
+        raise ValueError(f"没有标签列，可用的列: {df.columns.tolist()}")
+    y = df["type"].astype(str).str.lower().map(LABEL_MAP)
+    if y.isna().any():
+        print(f"[WARN] 未知标签类型，已忽略 {int(y.isna().sum())} 行: {df.loc[y.isna(), 'type'].unique()[:5].tolist()}")
+    return df[y.notna()], y.dropna().to_numpy().astype(int)
+
+
+def _entropy(strings: pd.Series, width: int = 64) -> np.ndarray:
+    """Shannon entropy (bits/char) of each string, via one byte-count matrix."""
+    arr = np.array(strings.str.slice(0, width).str.encode("utf-8", errors="ignore").tolist(), dtype=f"S{width}")
+    codes = arr.view(np.uint8).reshape(len(arr), width)
+    flat = np.repeat(np.arange(len(arr), dtype=np.int64) * 256, width) + codes.ravel()
+    counts = np.bincount(flat, minlength=len(arr) * 256).reshape(len(arr), 256)
+    counts[:, 0] = 0  # padding
+    lengths = counts.sum(axis=1, keepdims=True)
+    p = counts / np.maximum(lengths, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        h = -np.nansum(np.where(p > 0, p * np.log2(p), 0.0), axis=1)
+    return h
+
+
+def extract_features(urls: pd.Series) -> pd.DataFrame:
+    """Lexical features for a Series of URLs (one row per URL, columns = FEATURES)."""
+    urls = pd.Series(urls, copy=False).fillna("").astype(str)
+    lower = urls.str.lower()
+    parts = lower.str.extract(_URL_PARTS)
+    host = parts["host"].fillna("")
+    path = parts["path"].fillna("")
+    query = parts["query"].fillna("")
+    labels = host.str.split(".")
+    tld = labels.str[-1].fillna("")
+    is_ip = host.str.fullmatch(r"\d{1,3}(?:\.\d{1,3}){3}")
+
+    brand_re = r"(?<![a-z])(?:" + "|".join(BRANDS) + r")(?![a-z])"
+    path_and_query = path + "?" + query
+    brand_in_path = path_and_query.str.contains(brand_re, regex=True)
+    brand_in_host = host.str.contains(brand_re, regex=True)
+    # a brand name in the host that is not the brand's own registrable domain
+    host_parts = host.str.replace(r"^www\.", "", regex=True)
+    brand_subdomain = brand_in_host & host_parts.str.count(r"\.").ge(2)
+
+    f = pd.DataFrame({
+        "url_len": urls.str.len(),
+        "host_len": host.str.len(),
+        "path_len": path.str.len(),
+        "query_len": query.str.len(),
+        "is_https": parts["scheme"].eq("https"),
+        "has_scheme": parts["scheme"].notna(),
+        "is_ip_host": is_ip,
+        "has_port": parts["port"].notna(),
+        "subdomain_depth": np.maximum(labels.str.len().fillna(1) - 2, 0),
+        "host_entropy": _entropy(host),
+        "host_digit_ratio": host.str.count(r"\d") / host.str.len().clip(lower=1),
+        "host_hyphens": host.str.count("-"),
+        "path_depth": path.str.count("/"),
+        "num_params": np.where(query.str.len() > 0, query.str.count("&") + 1, 0),
+        "pct_encoded": urls.str.count(r"%[0-9a-fA-F]{2}"),
+        "has_at": urls.str.contains("@", regex=False),
+        "risky_tld": tld.isin(RISKY_TLDS) & ~is_ip,
+        "shortener": host_parts.isin(SHORTENERS),
+        "cloud_host": host.str.contains(CLOUD_HOSTS, regex=True),
+        "cms_query": lower.str.contains(CMS_PATTERN, regex=True),
+        "executable": (path + np.where(query.str.len() > 0, "?" + query, "")).str.contains(EXECUTABLE_PATTERN, regex=True),
+        "brand_in_path": brand_in_path,
+        "brand_mismatch": (brand_in_path & ~brand_in_host) | brand_subdomain,
+        "credential_words": path_and_query.str.contains(CREDENTIAL_WORDS, regex=True) | host.str.contains(CREDENTIAL_WORDS, regex=True),
+        "www": host.str.startswith("www."),
+    }, index=urls.index)
+    return f.astype(float)
+
+
+# Hand-set log-odds weights: an uncalibrated baseline (lexical AUROC ~0.76 on the
+# bundled data). The pre-filter needs weights from `LexicalScorer.fit()` instead.
+DEFAULT_WEIGHTS = {
+    "is_ip_host": 3.0, "executable": 3.0, "cms_query": 2.0, "brand_mismatch": 2.5,
+    "credential_words": 1.2, "risky_tld": 1.5, "cloud_host": 1.0, "shortener": 1.0,
+    "has_at": 1.5, "has_port": 1.0, "host_entropy": 0.6, "host_digit_ratio": 2.0,
+    "host_hyphens": 0.3, "subdomain_depth": 0.4, "pct_encoded": 0.05, "num_params": 0.15,
+    "is_https": -0.3,
+}
+DEFAULT_BIAS = -3.5
+
+
+def _wilson_lower(hits: np.ndarray, n: np.ndarray, z: float = 1.645) -> np.ndarray:
+    """One-sided 95% lower confidence bound of a proportion (Wilson score interval)."""
+    p = hits / n
+    return (p + z * z / (2 * n) - z * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n))) / (1 + z * z / n)
+
+
+def calibrate_band(labels, scores: np.ndarray, precision: float = DEFAULT_PRECISION,
+                   min_count: int = 20) -> tuple[Optional[float], Optional[float]]:
+    """Widest (low, high) such that URLs scoring <= low are benign and >= high malicious
+    with precision >= `precision` at 95% confidence (Wilson lower bound, so a small
+    calibration set gives a narrower band), each side covering >= min_count URLs;
+    None = no such cut on that side."""
+    y = np.asarray(labels).astype(np.int64)
+    s = np.asarray(scores, dtype=float)
+    bounds = []
+    for sign, target in ((1.0, 0), (-1.0, 1)):
+        # walk the scores from the confident end; cumulative counts at the end of each run of ties
+        order = np.argsort(sign * s, kind="mergesort")
+        s_sorted, hit = s[order], (y[order] == target)
+        last = np.r_[np.flatnonzero(s_sorted[1:] != s_sorted[:-1]), len(s) - 1] if len(s) else np.array([], dtype=int)
+        count = last + 1
+        ok = (_wilson_lower(np.cumsum(hit)[last], count) >= precision) & (count >= min_count)
+        bounds.append(float(s_sorted[last[np.flatnonzero(ok)[-1]]]) if ok.any() else None)
+    low, high = bounds
+    if low is not None and high is not None and low >= high:
+        return None, None
+    return low, high
+
+
+class LexicalScorer:
+    """Logistic model over url_features; ~microseconds per URL.
+
+    `low`/`high` is the calibrated skip band (see calibrate()); None until calibrated.
+    """
+
+    def __init__(self, weights: Optional[dict] = None, bias: float = DEFAULT_BIAS):
+        weights = DEFAULT_WEIGHTS if weights is None else weights
+        self.weights = np.array([weights.get(name, 0.0) for name in FEATURES])
+        self.bias = bias
+        self.mean = np.zeros(len(FEATURES))
+        self.scale = np.ones(len(FEATURES))
+        self.low: Optional[float] = None
+        self.high: Optional[float] = None
+        self.meta: dict = {}
+
+    def fit(self, features: pd.DataFrame, labels, C: float = 1.0) -> "LexicalScorer":
+        """Learn weights from labelled data (1 = malicious) with sklearn logistic regression."""
+        from sklearn.linear_model import LogisticRegression
+        X = features[FEATURES].to_numpy()
+        self.mean = X.mean(axis=0)
+        self.scale = X.std(axis=0) + 1e-9
+        model = LogisticRegression(C=C, max_iter=1000).fit((X - self.mean) / self.scale, np.asarray(labels))
+        self.weights = model.coef_[0]
+        self.bias = float(model.intercept_[0])
+        return self
+
+    def score(self, features: pd.DataFrame) -> np.ndarray:
+        z = ((features[FEATURES].to_numpy() - self.mean) / self.scale) @ self.weights + self.bias
+        return 1.0 / (1.0 + np.exp(-z))
+
+    def score_urls(self, urls) -> np.ndarray:
+        return self.score(extract_features(pd.Series(urls)))
+
+    @property
+    def calibrated(self) -> bool:
+        return self.low is not None or self.high is not None
+
+    def calibrate(self, features: pd.DataFrame, labels, precision: float = DEFAULT_PRECISION,
+                  min_count: int = 20) -> "LexicalScorer":
+        """Set the skip band from held-out labelled URLs (see calibrate_band)."""
+        scores = self.score(features)
+        self.low, self.high = calibrate_band(labels, scores, precision, min_count)
+        r = prefilter_report(np.asarray(labels), scores, self.low, self.high)
+        self.meta.update(precision=precision, calibration_rows=len(features), calibration_auroc=r["lexical_auroc"],
+                         calibration_skipped=r["skipped"], calibration_accuracy=r["skipped_accuracy"])
+        return self
+
+    def save(self, path: str = DEFAULT_SCORER_PATH):
+        state = {"features": FEATURES, "weights": self.weights.tolist(), "bias": self.bias,
+                 "mean": self.mean.tolist(), "scale": self.scale.tolist(),
+                 "low": self.low, "high": self.high, "meta": self.meta}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_SCORER_PATH) -> "LexicalScorer":
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state["features"] != FEATURES:
+            raise ValueError(f"{path} 的特征与当前版本不一致，请重新运行 --fit")
+        scorer = cls(dict(zip(FEATURES, state["weights"])), state["bias"])
+        scorer.mean, scorer.scale = np.array(state["mean"]), np.array(state["scale"])
+        scorer.low, scorer.high, scorer.meta = state["low"], state["high"], state.get("meta", {})
+        return scorer
+
+
+def load_prefilter(path: Optional[str] = None) -> Optional[LexicalScorer]:
+    """The calibrated scorer the pre-filter uses ($PREFILTER_MODEL, default lexical_scorer.json);
+    None (and a warning) when there is none, in which case no URL skips the LLM."""
+    path = path or os.environ.get("PREFILTER_MODEL", DEFAULT_SCORER_PATH)
+    scorer = LexicalScorer.load(path) if os.path.exists(path) else None
+    if scorer is None or not scorer.calibrated:
+        print(f"[WARN] 没有已校准的词法打分器 {path}，预过滤不跳过任何URL。先运行: "
+              f"python url_features.py <带标签的验证集> --fit <训练集> --save {path}")
+        return None
+    return scorer
+
+
+def confident_mask(scores: np.ndarray, low: Optional[float], high: Optional[float]) -> np.ndarray:
+    """True where the lexical score is confident enough to skip the LLM (None = that side never skips)."""
+    mask = np.zeros(len(scores), dtype=bool)
+    if low is not None:
+        mask |= scores <= low
+    if high is not None:
+        mask |= scores >= high
+    return mask
+
+
+def prefilter_report(labels: np.ndarray, lexical: np.ndarray, low: Optional[float], high: Optional[float],
+                     llm: Optional[np.ndarray] = None, threshold: float = 0.5) -> dict:
+    """Share of URLs skipped and how accurate the skipped decisions are (benign at or
+    below `low`, malicious at or above `high`); with LLM scores, also AUROC of the LLM
+    alone vs. the pre-filtered pipeline."""
+    from sklearn.metrics import roc_auc_score
+    skip = confident_mask(lexical, low, high)
+    decided = lexical >= high if high is not None else np.zeros(len(lexical), dtype=bool)
+    report = {
+        "low": low, "high": high,
+        "skipped": float(skip.mean()),
+        "skipped_accuracy": float((decided[skip] == labels[skip]).mean()) if skip.any() else float("nan"),
+        "lexical_auroc": float(roc_auc_score(labels, lexical)),
+    }
+    if llm is not None:
+        combined = np.where(skip, lexical, llm)
+        report["llm_auroc"] = float(roc_auc_score(labels, llm))
+        report["combined_auroc"] = float(roc_auc_score(labels, combined))
+        report["llm_accuracy_on_skipped"] = float(((llm[skip] >= threshold) == labels[skip]).mean()) if skip.any() else float("nan")
+    return report
+
+
+def fit_calibrated(train: pd.DataFrame, holdout: float = 0.3, precision: float = DEFAULT_PRECISION,
+                   min_count: int = 20) -> LexicalScorer:
+    """Fit on labelled URLs and calibrate the skip band on a deterministic held-out share of them."""
+    from ngram_model import holdout_mask
+    train, y = labelled(train)
+    held = holdout_mask(train["url"].astype(str).reset_index(drop=True), holdout)
+    features = extract_features(train["url"]).reset_index(drop=True)
+    scorer = LexicalScorer().fit(features[~held], y[~held])
+    scorer.calibrate(features[held], y[held], precision, min_count)
+    scorer.meta.update(train_rows=int((~held).sum()))
+    return scorer
+
+
+def _fmt_bound(v: Optional[float]) -> str:
+    return "none" if v is None else f"{v:.3g}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lexical pre-filter accuracy / savings report")
+    parser.add_argument("data_file", help="labelled CSV or Parquet (url/type, or columns like URL/label)")
+    parser.add_argument("--llm-results", help="{url: score} JSON to compare against")
+    parser.add_argument("--fit", help="labelled CSV/Parquet to fit and calibrate the scorer on (default: hand-set weights)")
+    parser.add_argument("--model", help="saved scorer to evaluate (see --save)")
+    parser.add_argument("--save", help="write the fitted, calibrated scorer here (the pre-filter reads $PREFILTER_MODEL)")
+    parser.add_argument("--precision", type=float, default=DEFAULT_PRECISION,
+                        help="target precision of the skipped decisions on each side of the band")
+    parser.add_argument("--holdout", type=float, default=0.3, help="share of --fit URLs used for calibration")
+    parser.add_argument("--bands", default="0.02:0.98,0.05:0.95,0.1:0.9,0.2:0.8")
+    args = parser.parse_args(argv)
+
+    try:
+        df, labels = labelled(load_urls(args.data_file))
+        scorer = LexicalScorer.load(args.model) if args.model else LexicalScorer()
+        if args.fit:
+            scorer = fit_calibrated(load_urls(args.fit), args.holdout, args.precision)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"错误: {e}")
+        return 1
+    if args.save:
+        if not args.fit:
+            print("错误: --save 需要 --fit（只保存拟合并校准过的打分器）")
+            return 1
+        scorer.save(args.save)
+        print(f"已保存: {args.save}（校准区间 {_fmt_bound(scorer.low)} - {_fmt_bound(scorer.high)}，"
+              f"目标精度 {args.precision}）")
+    if scorer.calibrated:
+        m = scorer.meta
+        print(f"校准集 {m['calibration_rows']} 行: AUROC {m['calibration_auroc']:.3f}，"
+              f"跳过 {m['calibration_skipped'] * 100:.1f}%，跳过部分准确率 {m['calibration_accuracy'] * 100:.1f}%")
+    elif args.fit:
+        print(f"[WARN] 校准集上没有精度能（95%置信）达到 {args.precision} 的区间，预过滤不会跳过任何URL")
+    lexical = scorer.score(extract_features(df["url"]))
+    llm = None
+    if args.llm_results:
+        from evaluation import load_predictions, load_failures, drop_failed
+        keep = drop_failed(df, load_failures(args.llm_results)).index
+        df, labels, lexical = df.loc[keep], labels[df.index.isin(keep)], lexical[df.index.isin(keep)]
+        llm = pd.to_numeric(df["url"].map(load_predictions(args.llm_results)), errors="coerce").fillna(0.5).to_numpy()
+
+    bands = [tuple(float(x) for x in band.split(":")) for band in args.bands.split(",")]
+    if scorer.calibrated:
+        bands.insert(0, (scorer.low, scorer.high))
+    print(f"{'band':>13} | {'skipped':>7} | {'skip acc':>8} | {'lex AUROC':>9}" + (" | LLM AUROC | combined | LLM acc on skipped" if llm is not None else ""))
+    for low, high in bands:
+        r = prefilter_report(labels, lexical, low, high, llm)
+        line = f"{_fmt_bound(low):>6}-{_fmt_bound(high):<6} | {r['skipped']*100:6.1f}% | {r['skipped_accuracy']*100:7.1f}% | {r['lexical_auroc']:9.3f}"
+        if llm is not None:
+            line += f" | {r['llm_auroc']:9.3f} | {r['combined_auroc']:8.3f} | {r['llm_accuracy_on_skipped']*100:.1f}%"
+        print(line + ("  <- calibrated" if scorer.calibrated and (low, high) == (scorer.low, scorer.high) else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())